@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import argparse
 import json
 import os
 from typing import Any
@@ -13,6 +14,7 @@ from emoji_oracle_analytics.config.logging import get_logger
 from emoji_oracle_analytics.pipeline.utils.calculate_kpis import calculate_kpis
 from emoji_oracle_analytics.pipeline.utils.dataframes import create_dataframes
 from emoji_oracle_analytics.pipeline.utils.main_functions import ensure_directories
+from emoji_oracle_analytics.pipeline.utils.profiling import save_profile
 from emoji_oracle_analytics.pipeline.utils.reporting import generate_report
 from emoji_oracle_analytics.pipeline.utils.staging import run_pipeline
 
@@ -37,7 +39,18 @@ def load_credentials():
     raise RuntimeError("No Google service account credentials found.")
 
 
-def main() -> None:
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Run the analytics pipeline and build the report.")
+    parser.add_argument(
+        "--invalidate-from",
+        metavar="STAGE",
+        help="ignore checkpoints from this stage onward (e.g. question_addressable_index)",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> None:
+    args = parse_args(argv)
     logger.info("Starting pipeline...")
 
     # --- Ensure directories exist
@@ -66,22 +79,48 @@ def main() -> None:
 
     context = {
         "client": client,
+        "manifest_path": settings.MANIFEST_PATH,
         "log_path": settings.LOG_PATH,
+        "param_schema_path": settings.PARAM_SCHEMA_PATH,
+        "user_codes_path": settings.USER_CODES_PATH,
         "data_dir": settings.DATA_DIR,
         "csv_dir": settings.CSV_DIR,
+        "processed_dir": settings.PROCESSED_DIR,
+        "processed_cache": settings.PROCESSED_CACHE,
         "dataset": settings.DATASET,
+        "event_filters": settings.EVENT_FILTERS,
         "start_date": settings.START_DATE,
+        "download_mode": settings.DOWNLOAD_MODE,
+        "download_workers": settings.DOWNLOAD_WORKERS,
+        "download_page_rows": settings.DOWNLOAD_PAGE_ROWS,
+        "refresh_window_days": settings.REFRESH_WINDOW_DAYS,
+        "include_intraday": settings.INCLUDE_INTRADAY,
+        "flatten_engine": settings.FLATTEN_ENGINE,
+        "flatten_workers": settings.FLATTEN_WORKERS,
+        "flatten_chunk_rows": settings.FLATTEN_CHUNK_ROWS,
+        "stage_workers": settings.STAGE_WORKERS,
+        "prune_columns": settings.PRUNE_COLUMNS,
+        "pipeline_targets": settings.PIPELINE_TARGETS,
+        "checkpoints": settings.CHECKPOINTS,
+        "checkpoint_dir": settings.CHECKPOINT_DIR,
+        "checkpoint_max_bytes": settings.CHECKPOINT_MAX_BYTES,
+        "invalidate_from": args.invalidate_from,
+        "session_gap_minutes": settings.SESSION_GAP_MINUTES,
+        "time_features": settings.TIME_FEATURES,
+        "profile_records": [] if settings.PROFILE else None,
+        "profile_memory": settings.PROFILE_MEMORY,
         "report_path": settings.REPORT_PATH,
         "country": settings.COUNTRY,
         "not_user": settings.NOT_USER,
         "version_filter": settings.VERSION_FILTER,
+        "extract_pruned": settings.EXTRACT_PRUNED,
     }
 
     df = run_pipeline(df=pd.DataFrame(), context=context)
     logger.info("Data pipeline executed successfully.")
 
     logger.info("Generating dataframes...")
-    dfs = create_dataframes(df=df)
+    dfs = create_dataframes(df=df, context=context)
     logger.info("Dataframes generated successfully.")
 
     logger.info("Calculating KPIs...")
@@ -98,6 +137,9 @@ def main() -> None:
     logger.info("Data pipeline complete. Processed data saved.")
     generate_report(df=df, dfs_dict=dfs, kpis=kpis, context=context)
 
+    if context["profile_records"]:
+        save_profile(context["profile_records"], settings.PROFILE_DIR)
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,158 @@
+"""Benchmarks of the pipeline on synthetic GA4 exports.
+
+    python -m emoji_oracle_analytics.benchmark --events 100000 1000000
+    python -m emoji_oracle_analytics.benchmark --compare <commit>
+
+For each size, a synthetic store (see pipeline/utils/synthetic_events.py) is
+written once to `BENCHMARK_DIR/store_<events>_<days>d_<seed>` and reused by
+later runs. The pipeline stages, every `create_df_*` split, the KPIs, each
+report plot and the report as a whole are run with profiling on (see
+pipeline/utils/profiling.py). One row per step is appended to
+`BENCHMARK_DIR/benchmarks.csv`, tagged with the commit and the size, so runs
+can be compared across commits with `--compare`.
+
+tracemalloc is off unless `--trace-memory` is given, since it slows the
+allocation-heavy stages down several times. At 10M events the flattened
+frame alone needs tens of GB of memory.
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import subprocess
+from datetime import datetime
+from typing import Optional
+
+import pandas as pd
+
+from emoji_oracle_analytics.config import settings
+from emoji_oracle_analytics.config.logging import get_logger
+from emoji_oracle_analytics.pipeline.utils.calculate_kpis import calculate_kpis
+from emoji_oracle_analytics.pipeline.utils.dataframes import create_dataframes
+from emoji_oracle_analytics.pipeline.utils.profiling import profile_frame, run_profiled
+from emoji_oracle_analytics.pipeline.utils.reporting import generate_report
+from emoji_oracle_analytics.pipeline.utils.staging import run_pipeline
+from emoji_oracle_analytics.pipeline.utils.synthetic_events import EVENTS_PER_USER, write_synthetic_store
+
+logger = get_logger(__name__)
+
+RESULTS_FILE = "benchmarks.csv"
+DEFAULT_SIZES = [100_000, 1_000_000, 10_000_000]
+
+
+def current_commit() -> str:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True)
+        return out.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def synthetic_store(events: int, days: int, seed: int, benchmark_dir: str) -> str:
+    """Directory of the synthetic store for this size, written on first use."""
+    data_dir = os.path.join(benchmark_dir, f"store_{events}_{days}d_{seed}")
+    manifest_path = os.path.join(data_dir, "manifest.json")
+    if not os.path.exists(manifest_path):
+        write_synthetic_store(data_dir, manifest_path, events, settings.START_DATE, days=days, seed=seed)
+    return data_dir
+
+
+def run_benchmark(events: int, days: int, seed: int, benchmark_dir: str, trace_memory: bool) -> pd.DataFrame:
+    """Run the pipeline, splits, KPIs and report on one synthetic store; one row per step."""
+    data_dir = synthetic_store(events, days, seed, benchmark_dir)
+    work_dir = os.path.join(benchmark_dir, f"work_{events}")
+    os.makedirs(work_dir, exist_ok=True)
+
+    context = {
+        "client": None,
+        "store_synced": True,
+        "manifest_path": os.path.join(data_dir, "manifest.json"),
+        "data_dir": data_dir,
+        # Registries start empty, as on a first run
+        "param_schema_path": os.path.join(work_dir, "param_schema.json"),
+        "user_codes_path": os.path.join(work_dir, "user_codes.json"),
+        "report_path": os.path.join(work_dir, "report"),
+        "event_filters": settings.EVENT_FILTERS,
+        "start_date": settings.START_DATE,
+        "country": settings.COUNTRY,
+        "not_user": settings.NOT_USER,
+        "version_filter": settings.VERSION_FILTER,
+        "flatten_engine": settings.FLATTEN_ENGINE,
+        "flatten_workers": settings.FLATTEN_WORKERS,
+        "flatten_chunk_rows": settings.FLATTEN_CHUNK_ROWS,
+        "stage_workers": settings.STAGE_WORKERS,
+        "prune_columns": settings.PRUNE_COLUMNS,
+        "session_gap_minutes": settings.SESSION_GAP_MINUTES,
+        "time_features": settings.TIME_FEATURES,
+        "profile_records": [],
+        "profile_memory": trace_memory,
+    }
+    for path in (context["param_schema_path"], context["user_codes_path"]):
+        if os.path.exists(path):
+            os.remove(path)
+
+    logger.info(f"Benchmarking {events} events...")
+    df = run_pipeline(df=pd.DataFrame(), context=context)
+    dfs = create_dataframes(df=df, context=context)
+    kpis = run_profiled(context, "kpi", "calculate_kpis", calculate_kpis, df=df, dict=dfs)
+    run_profiled(context, "report", "generate_report", generate_report,
+                 df=df, dfs_dict=dfs, kpis=kpis, context=context)
+
+    results = profile_frame(context["profile_records"])
+    results.insert(0, "events", events)
+    results.insert(0, "run_at", datetime.now().isoformat(timespec="seconds"))
+    results.insert(0, "commit", current_commit())
+    return results
+
+
+def save_results(results: pd.DataFrame, benchmark_dir: str) -> str:
+    path = os.path.join(benchmark_dir, RESULTS_FILE)
+    results.to_csv(path, mode="a", header=not os.path.exists(path), index=False)
+    logger.info(f"Benchmark results appended to {path}")
+    return path
+
+
+def compare_results(path: str, base: str, head: Optional[str] = None) -> pd.DataFrame:
+    """Wall time per step of the latest `base` run against the latest `head` run."""
+    results = pd.read_csv(path)
+    head = head or results["commit"].iloc[-1]
+
+    def latest(commit):
+        runs = results[results["commit"] == commit]
+        runs = runs[runs["run_at"] == runs.groupby("events")["run_at"].transform("max")]
+        return runs.groupby(["events", "group", "name"])["wall_s"].sum()
+
+    table = pd.concat({base: latest(base), head: latest(head)}, axis=1)
+    table["ratio"] = (table[head] / table[base]).round(2)
+    return table.sort_values(base, ascending=False)
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline on synthetic GA4 exports.")
+    parser.add_argument("--events", type=int, nargs="+", default=DEFAULT_SIZES, help="event counts to run")
+    parser.add_argument("--days", type=int, default=14, help="daily tables per synthetic store")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--trace-memory", action="store_true", help="record tracemalloc peaks (slower)")
+    parser.add_argument("--compare", metavar="COMMIT", help="compare the latest results with this commit's")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> None:
+    args = parse_args(argv)
+    benchmark_dir = settings.BENCHMARK_DIR
+    os.makedirs(benchmark_dir, exist_ok=True)
+
+    if args.compare:
+        table = compare_results(os.path.join(benchmark_dir, RESULTS_FILE), args.compare)
+        print(table.to_string())
+        return
+
+    for events in args.events:
+        logger.info(f"{events} events, {max(1, events // EVENTS_PER_USER)} users, {args.days} days.")
+        results = run_benchmark(events, args.days, args.seed, benchmark_dir, args.trace_memory)
+        save_results(results, benchmark_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,7 +5,21 @@ see what drives inputs/outputs.
 
 Where these values are used:
 - `DATA_DIR`: local parquet cache for downloaded BigQuery tables
-- `LOG_PATH`: a text file listing which BigQuery tables were downloaded
+- `MANIFEST_PATH`: JSON manifest of downloaded BigQuery tables (rows, bytes,
+	schema fingerprint, source last-modified time, checksum)
+- `LOG_PATH`: legacy text list of downloaded tables, only read once to seed
+	the manifest
+- `PARAM_SCHEMA_PATH`: registered types of flattened parameter columns
+- `USER_CODES_PATH`: append-only list of user ids whose positions are the
+	integer user codes used for grouping
+- `PROCESSED_DIR`: per-day cache of flattened and cleaned events
+- `CHECKPOINT_DIR`: frames saved after each pipeline stage level, to resume
+	reruns (`python main.py --invalidate-from <stage>` recomputes from a stage)
+- `PROFILE_DIR`: per-run timings and memory of stages, splits and plots
+	(JSON and CSV), written when `PROFILE` is on; `PROFILE_MEMORY` adds
+	tracemalloc peaks
+- `BENCHMARK_DIR`: synthetic stores and results of
+	`python -m emoji_oracle_analytics.benchmark`
 - `CSV_DIR`: pipeline outputs written as CSV for inspection/sharing
 - `REPORT_PATH`: HTML report output folder (served as static pages)
 
@@ -13,21 +27,114 @@ Notes:
 - `DATASET` is a BigQuery dataset (GA4 export-style) that contains tables like
 	`events_YYYYMMDD`.
 - `START_DATE` controls the earliest date to pull/process.
+- `DOWNLOAD_MODE` picks one query per missing table or a single wildcard query.
+- `DOWNLOAD_WORKERS` is how many daily tables are downloaded at the same time.
+- `DOWNLOAD_PAGE_ROWS` bounds how many rows are held in memory per table while
+	streaming it to parquet.
+- `FLATTEN_ENGINE` picks the columnar Arrow flattener or the row-by-row
+	reference implementation.
+- `FLATTEN_WORKERS` / `FLATTEN_CHUNK_ROWS` split flattening of large backfills
+	across processes.
+- `EVENT_FILTERS` lists the event filters to apply; each one is configured by
+	`START_DATE`, `COUNTRY`, `NOT_USER` or `VERSION_FILTER`.
+- `STAGE_WORKERS` / `PRUNE_COLUMNS` / `PIPELINE_TARGETS` control the stage
+	runner (see pipeline/utils/stage_graph.py).
+- `CHECKPOINTS` / `CHECKPOINT_MAX_BYTES` turn stage checkpoints on and bound
+	their disk use (see pipeline/utils/checkpoints.py).
+- `TIME_FEATURES` picks compact or object-based date/time parts (see
+	`transform_datetime_fields`).
+- `SESSION_GAP_MINUTES` splits events without a GA session id into inferred
+	sessions (see pipeline/utils/sessions.py).
 """
 
 from datetime import date
 
 DATA_DIR = "./parquet-store"
+MANIFEST_PATH = "./parquet-store/manifest.json"
 LOG_PATH = "./parquet-store/log.txt"
+PARAM_SCHEMA_PATH = "./parquet-store/param_schema.json"
+USER_CODES_PATH = "./parquet-store/user_codes.json"
 
 # LOG_PATH = "./logs/downloaded_tables.log"
 # DATA_DIR = "./data/parquet"
 CSV_DIR = "./data/csv"
+PROCESSED_DIR = "./data/processed"
+CHECKPOINT_DIR = "./data/checkpoints"
+PROFILE_DIR = "./data/profiles"
+BENCHMARK_DIR = "./data/benchmarks"
 REPORT_PATH = "./docs"
 
 
 DATASET = "emoji-oracle-74368.analytics_501671751"
 
+# "per_table": one query job per missing daily table (run on DOWNLOAD_WORKERS threads).
+# "wildcard": a single `events_*` job filtered on _TABLE_SUFFIX for all missing days.
+DOWNLOAD_MODE = "per_table"
+
+# Number of daily tables fetched concurrently (1 = one after another).
+DOWNLOAD_WORKERS = 4
+
+# Rows per Arrow batch / parquet row group when streaming a table to disk.
+DOWNLOAD_PAGE_ROWS = 50_000
+
+# GA4 keeps rewriting a daily table for up to ~72 hours. Cached tables are
+# re-downloaded whenever BigQuery reports a newer last_modified_time; tables
+# cached without that metadata are refreshed if they are this many days old or newer.
+REFRESH_WINDOW_DAYS = 3
+
+# Also pull today's `events_intraday_YYYYMMDD` table (dropped once the daily table lands).
+INCLUDE_INTRADAY = False
+
+# "arrow": columnar flattening of event_params/user_properties/structs.
+# "rows": `flatten_row` on every row (reference implementation, much slower).
+FLATTEN_ENGINE = "arrow"
+
+# Processes used to flatten row chunks in parallel (1 = in-process). Only
+# inputs larger than FLATTEN_CHUNK_ROWS are split.
+FLATTEN_WORKERS = 1
+FLATTEN_CHUNK_ROWS = 100_000
+
+# Threads for pipeline stages that touch disjoint columns (1 = one after another).
+STAGE_WORKERS = 1
+
+# Drop `columns_to_drop` (lists_and_maps) as soon as no later stage uses them.
+PRUNE_COLUMNS = True
+
+# Only run the stages needed to produce these columns (None = every stage).
+PIPELINE_TARGETS = None
+
+# Save the frame after each stage level to CHECKPOINT_DIR and resume reruns
+# from the last level whose inputs and code are unchanged. Least recently used
+# checkpoints are deleted beyond CHECKPOINT_MAX_BYTES.
+CHECKPOINTS = False
+CHECKPOINT_MAX_BYTES = 2 * 2**30
+
+# "compact": `_time` columns as Int32 seconds since midnight and only the
+# `_date` columns read downstream. "full": `datetime.time` objects and every
+# `_date` column (several times the memory per row).
+TIME_FEATURES = "compact"
+
+# Events without a GA session id start a new inferred session after this many
+# minutes of inactivity (GA's own session timeout is 30 minutes).
+SESSION_GAP_MINUTES = 30
+
+# Record wall/CPU time, memory and frame shapes of every stage, split and plot
+# (see pipeline/utils/profiling.py). Slows the run down.
+PROFILE = False
+
+# With PROFILE on, also record tracemalloc peaks. Turn off for timings close to
+# an unprofiled run (tracemalloc slows allocation-heavy stages down).
+PROFILE_MEMORY = True
+
+# Reuse per-day flattened/cleaned events from PROCESSED_DIR and only recompute
+# days whose raw table, stage code or filters changed.
+PROCESSED_CACHE = True
+
+# Event filters applied in this order, combined into one mask / scan predicate:
+# "date" (START_DATE), "country" (COUNTRY), "user" (NOT_USER), "version"
+# (VERSION_FILTER). A filter whose setting is empty is skipped.
+EVENT_FILTERS = ["date", "country", "user", "version"]
+
 START_DATE = date(2025, 11, 1)
 
 COUNTRY = []
@@ -38,3 +145,9 @@ NOT_USER: list[str] = []
 
 # Keep only events where the app version is >= this version.
 VERSION_FILTER = "1.0.4"  # >=
+
+# Select only the columns the pipeline reads and push COUNTRY, NOT_USER and
+# VERSION_FILTER into the BigQuery WHERE clause. Downloaded files are then
+# pre-filtered; each manifest entry records the columns and filters it was
+# extracted with, and tables extracted differently are downloaded again.
+EXTRACT_PRUNED = False
@@ -0,0 +1,173 @@
+"""On-disk checkpoints of the frame after each level of pipeline stages.
+
+Checkpoints are content-addressed by a chain of keys. The first key hashes
+the pipeline input: the checksums of the downloaded tables and the filter
+and pruning settings. Every later key hashes the previous key together with
+the names and module sources of the stages in the level, so editing one late
+stage (e.g. `question_addressable_index`) only changes the keys from that
+stage onward. A rerun loads the last level whose checkpoint is on disk and
+only runs the levels after it::
+
+    data/checkpoints/
+        index.json
+        3f2a...c1.arrow
+
+Frames whose columns all have Arrow-native dtypes (numbers, booleans,
+datetimes, categoricals) are written as Arrow IPC files. Frames with object
+columns are pickled: Arrow does not give those back unchanged (integers mixed
+with NaN come back as floats, None as NaT). `index.json` records each file's size and last use; once
+the files exceed `checkpoint_max_bytes`, the least recently used ones are
+deleted. The registries (`param_schema.json`, `user_codes.json`) are not part
+of the key: after editing them by hand, rerun with `--invalidate-from`.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import inspect
+import json
+import os
+import time
+from typing import Any, Optional
+
+import pandas as pd
+import pyarrow as pa
+
+from emoji_oracle_analytics.config.logging import get_logger
+from emoji_oracle_analytics.pipeline.utils import lists_and_maps
+from emoji_oracle_analytics.pipeline.utils.manifest import (
+    atomic_replace,
+    remove_stale_temp_files,
+    save_manifest,
+    temp_path,
+)
+
+logger = get_logger(__name__)
+
+INDEX_FILE = "index.json"
+
+
+def _sha256(*parts: str) -> str:
+    return hashlib.sha256("|".join(parts).encode("utf-8")).hexdigest()
+
+
+def input_key(manifest: dict[str, Any], settings: dict[str, Any]) -> str:
+    """Key of the pipeline input: table checksums plus the settings that shape the frame."""
+    tables = {name: entry.get("checksum") for name, entry in sorted(manifest["tables"].items())}
+    return _sha256(json.dumps(tables, sort_keys=True), json.dumps(settings, sort_keys=True, default=str))
+
+
+def _module_source(func) -> str:
+    module = inspect.getmodule(func)
+    return inspect.getsource(module) if module is not None else inspect.getsource(func)
+
+
+def level_key(previous_key: str, stages) -> str:
+    """Key of a level's output: the previous key and the code of its stages."""
+    parts = [previous_key, inspect.getsource(lists_and_maps)]
+    for stage in stages:
+        parts += [stage.name, _module_source(stage.func)]
+    return _sha256(*parts)
+
+
+def load_checkpoint_index(checkpoint_dir: str) -> dict[str, Any]:
+    """Index of the checkpoints in `checkpoint_dir`, without entries whose file is gone."""
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    remove_stale_temp_files(checkpoint_dir)
+
+    index = {"entries": {}}
+    path = os.path.join(checkpoint_dir, INDEX_FILE)
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            index = json.load(f)
+
+    entries = index["entries"]
+    for key in [k for k, e in entries.items() if not os.path.exists(os.path.join(checkpoint_dir, e["file"]))]:
+        entries.pop(key)
+    return index
+
+
+def save_checkpoint_index(checkpoint_dir: str, index: dict[str, Any]) -> None:
+    save_manifest(os.path.join(checkpoint_dir, INDEX_FILE), index)
+
+
+def _arrow_native(df: pd.DataFrame) -> bool:
+    return not any(pd.api.types.is_object_dtype(dtype) for dtype in df.dtypes)
+
+
+def load_checkpoint(checkpoint_dir: str, index: dict[str, Any], key: str) -> pd.DataFrame:
+    entry = index["entries"][key]
+    path = os.path.join(checkpoint_dir, entry["file"])
+    if entry["format"] == "arrow":
+        with pa.memory_map(path) as source:
+            df = pa.ipc.open_file(source).read_all().to_pandas()
+    else:
+        df = pd.read_pickle(path)
+
+    entry["last_used"] = time.time()
+    save_checkpoint_index(checkpoint_dir, index)
+    logger.info(f"Loaded checkpoint after {entry['stages'][-1]} ({entry['bytes'] / 2**20:.1f} MiB).")
+    return df
+
+
+def save_checkpoint(
+    checkpoint_dir: str,
+    index: dict[str, Any],
+    key: str,
+    df: pd.DataFrame,
+    stages: list[str],
+    max_bytes: Optional[int] = None,
+    row_order: Optional[str] = None,
+) -> None:
+    """Write `df` under `key`, then evict old checkpoints beyond `max_bytes`.
+
+    `row_order` (see stage_graph) is kept in the index for resumed runs.
+    """
+    table = None
+    if _arrow_native(df):
+        try:
+            table = pa.Table.from_pandas(df, preserve_index=True)
+        except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError) as e:
+            logger.info(f"Pickling the checkpoint after {stages[-1]}; not convertible to Arrow ({e}).")
+    file, fmt = (f"{key}.arrow", "arrow") if table is not None else (f"{key}.pkl", "pickle")
+
+    path = os.path.join(checkpoint_dir, file)
+    if table is not None:
+        with pa.OSFile(temp_path(path), "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    else:
+        df.to_pickle(temp_path(path))
+    atomic_replace(temp_path(path), path)
+
+    index["entries"][key] = {
+        "file": file,
+        "format": fmt,
+        "stages": stages,
+        "row_order": row_order,
+        "bytes": os.path.getsize(path),
+        "last_used": time.time(),
+    }
+    evict_checkpoints(checkpoint_dir, index, max_bytes, keep=key)
+    save_checkpoint_index(checkpoint_dir, index)
+
+
+def evict_checkpoints(
+    checkpoint_dir: str,
+    index: dict[str, Any],
+    max_bytes: Optional[int],
+    keep: Optional[str] = None,
+) -> None:
+    """Delete least recently used checkpoints until their total size fits in `max_bytes`."""
+    if not max_bytes:
+        return
+    entries = index["entries"]
+    total = sum(e["bytes"] for e in entries.values())
+    for key, entry in sorted(entries.items(), key=lambda item: item[1]["last_used"]):
+        if total <= max_bytes:
+            break
+        if key == keep:
+            continue
+        os.remove(os.path.join(checkpoint_dir, entry["file"]))
+        entries.pop(key)
+        total -= entry["bytes"]
+        logger.info(f"Evicted checkpoint after {entry['stages'][-1]} ({entry['bytes'] / 2**20:.1f} MiB).")
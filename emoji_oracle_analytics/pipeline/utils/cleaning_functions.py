@@ -1,6 +1,7 @@
+import numpy as np
 import pandas as pd
 from emoji_oracle_analytics.config.logging import get_logger
-from emoji_oracle_analytics.pipeline.utils.lists_and_maps import map_of_maps
+from emoji_oracle_analytics.pipeline.utils.lists_and_maps import categorical_columns, map_of_maps
 
 logger = get_logger(__name__)
 
@@ -74,11 +75,66 @@ def apply_value_maps(df: pd.DataFrame,
     
     for col, value_map in map_of_maps.items():
         if col in df_copy.columns:
-            if keep_unmapped:
+            if isinstance(df_copy[col].dtype, pd.CategoricalDtype):
+                df_copy[col] = _map_categories(df_copy[col], value_map, keep_unmapped)
+            elif keep_unmapped:
                 df_copy[col] = df_copy[col].map(value_map).fillna(df_copy[col])
             else:
                 df_copy[col] = df_copy[col].map(value_map)
         else:
             logger.warning(f"'{col}' not found in DataFrame.")
     
-    return df_copy
\ No newline at end of file
+    return df_copy
+
+
+def _map_categories(values: pd.Series, value_map: dict, keep_unmapped: bool) -> pd.Series:
+    """Map a categorical column through its categories (missing rows stay missing)."""
+    categories = pd.Series(values.cat.categories)
+    mapped = categories.map(value_map)
+    if keep_unmapped:
+        mapped = mapped.fillna(categories)
+    # Several categories may map to one value
+    codes, uniques = pd.factorize(mapped)
+    # Code -1 (a missing row) picks the appended -1
+    row_codes = np.append(codes, -1)[values.cat.codes.to_numpy()]
+    return pd.Series(pd.Categorical.from_codes(row_codes, categories=uniques), index=values.index)
+
+
+def compact_categoricals(df: pd.DataFrame,
+                         context=None,
+                         categorical_columns=categorical_columns) -> pd.DataFrame:
+    """
+    Converts low-cardinality string columns to pandas Categorical.
+
+    Each value is stored once per column and rows hold small integer codes, so
+    memory drops and `==`/`isin` masks compare codes instead of Python strings.
+    Runs after every stage that rewrites these columns, since assigning a value
+    that is not already a category raises.
+
+    Parameters:
+        df (pd.DataFrame): The DataFrame to modify.
+        categorical_columns (dict): Column name -> most distinct values it may
+            have to still be converted.
+
+    Returns:
+        pd.DataFrame: The DataFrame with compacted columns.
+    """
+    before = df.memory_usage(deep=True).sum()
+    converted = []
+
+    for col, max_categories in categorical_columns.items():
+        if col not in df.columns or isinstance(df[col].dtype, pd.CategoricalDtype):
+            continue
+        n_unique = df[col].nunique(dropna=True)
+        if n_unique > max_categories:
+            logger.info(f"Keeping '{col}' as is: {n_unique} distinct values (limit {max_categories}).")
+            continue
+        df[col] = df[col].astype("category")
+        converted.append(col)
+
+    after = df.memory_usage(deep=True).sum()
+    logger.info(
+        f"Converted {len(converted)} columns to categoricals; "
+        f"memory {before / 2**20:.1f} MiB -> {after / 2**20:.1f} MiB."
+    )
+    return df
@@ -9,21 +9,43 @@ from emoji_oracle_analytics.pipeline.utils.split_functions import (
 )
 
 from emoji_oracle_analytics.pipeline.utils.lists_and_maps import conversion_events
+from emoji_oracle_analytics.pipeline.utils.profiling import run_profiled
 import pandas as pd
 
 logger = get_logger(__name__)
 
-def create_dataframes(df: pd.DataFrame):
+def _without_categoricals(df: pd.DataFrame) -> pd.DataFrame:
+    """Store unordered categorical columns as plain values again.
+
+    The split frames are small, and reports call value_counts() on them, which
+    for a categorical also lists every unused category with a zero count.
+    Ordered categoricals (versions) are kept for their ordering.
+    """
+    is_compacted = df.dtypes.map(lambda t: isinstance(t, pd.CategoricalDtype) and not t.ordered)
+    for col in df.columns[is_compacted]:
+        df[col] = df[col].astype(df[col].cat.categories.dtype)
+    return df
+
+
+def create_dataframes(df: pd.DataFrame, context=None):
     """Generate actual dataframes from a single source df."""
+    def split(func, **kwargs):
+        return run_profiled(context, "split", func.__name__, func, df, **kwargs)
+
+    # These two skip sorting when the pipeline left the rows in session order
+    by_sessions = split(create_df_by_sessions, context=context)
+    by_users, users_meta = split(create_df_by_users)
     dataframes = {
-        "by_sessions": create_df_by_sessions(df),
-        "by_users": create_df_by_users(df)[0],
-        "users_meta": create_df_by_users(df)[1],
-        "by_questions": create_df_by_questions(df),
-        "by_ads": create_df_by_ads(df),
-        "by_date": create_df_by_date(df),
-        "technical_events": create_df_technical_events(df),
+        "by_sessions": by_sessions,
+        "by_users": by_users,
+        "users_meta": users_meta,
+        "by_questions": split(create_df_by_questions),
+        "by_ads": split(create_df_by_ads),
+        "by_date": split(create_df_by_date),
+        "technical_events": split(create_df_technical_events, context=context),
     }
 
+    dataframes = {name: _without_categoricals(frame) for name, frame in dataframes.items()}
+
     logger.info("All split dataframes successfully created.")
     return dataframes
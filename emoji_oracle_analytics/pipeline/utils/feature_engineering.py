@@ -1,22 +1,29 @@
 import pandas as pd
 from emoji_oracle_analytics.config.logging import get_logger
+from emoji_oracle_analytics.pipeline.utils.sessions import ffill_within_sessions, is_session_sorted
+from emoji_oracle_analytics.pipeline.utils.user_keys import session_keys
 
 logger = get_logger(__name__)
 
 def forward_fill_progress(df: pd.DataFrame, context=None) -> pd.DataFrame:
     try:
-        required_cols = ['user_pseudo_id', 'event_params__ga_session_id', 'event_datetime']
+        session_groups = session_keys(df)
+        required_cols = session_groups + ['event_datetime']
         if all(col in df.columns for col in required_cols):
-            df_sorted = df.sort_values(by=required_cols)
             cols_to_fill = [
                 'event_params__character_name',
                 'event_params__current_tier',
                 'event_params__current_qi',
             ]
-            df_sorted[cols_to_fill] = (
-                df_sorted.groupby(['user_pseudo_id', 'event_params__ga_session_id'])[cols_to_fill].ffill()
-            )
-            df.loc[df_sorted.index, cols_to_fill] = df_sorted[cols_to_fill]
+            if is_session_sorted(context):
+                # Sessions are contiguous; fill in place without sorting or grouping
+                df = ffill_within_sessions(df, cols_to_fill)
+            else:
+                df_sorted = df.sort_values(by=required_cols)
+                df_sorted[cols_to_fill] = (
+                    df_sorted.groupby(session_groups)[cols_to_fill].ffill()
+                )
+                df.loc[df_sorted.index, cols_to_fill] = df_sorted[cols_to_fill]
             logger.info(f"Forward-filled for {df['event_params__ga_session_id'].nunique()} sessions.")
         else:
             logger.warning("Missing required columns for forward_fill_progress.")
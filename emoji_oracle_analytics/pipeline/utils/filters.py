@@ -0,0 +1,194 @@
+"""Event filters: start date, country, excluded users and minimum app version.
+
+Each filter is a named clause that can be evaluated two ways:
+
+- as a boolean mask over the flattened frame (`geo__country`, ...)
+- as a `pyarrow.dataset` expression over the raw GA4 schema (`geo.country`,
+  ...), pushed into the parquet store scan
+
+`EVENT_FILTERS` in settings lists the clauses to apply, in order. A clause
+whose setting (`START_DATE`, `COUNTRY`, `NOT_USER`, `VERSION_FILTER`) is
+empty is skipped. The active clauses are combined into one predicate: the
+frame is filtered with a single mask and copied once, and a scan reads only
+the rows that pass all of them. How many events each clause removes is
+logged in both cases; for a scan it is counted from one pass over the clause
+columns only (see `scan_predicate`).
+"""
+
+from __future__ import annotations
+
+from typing import Callable, Optional
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+from emoji_oracle_analytics.config.logging import get_logger
+from emoji_oracle_analytics.pipeline.utils.parquet_store import PARTITION_FIELD, string_isin
+from emoji_oracle_analytics.pipeline.utils.versions import version_at_least
+
+logger = get_logger(__name__)
+
+DEFAULT_FILTERS = ["date", "country", "user", "version"]
+
+
+def _start_timestamp(context: dict) -> int:
+    """Start date as UNIX microseconds (UTC), the unit of `event_timestamp`."""
+    return int(pd.Timestamp(context["start_date"], tz="UTC").value // 10**3)
+
+
+# --- Masks over the flattened frame
+
+def _date_mask(df: pd.DataFrame, context: dict) -> pd.Series:
+    return df["event_timestamp"] >= _start_timestamp(context)
+
+
+def _country_mask(df: pd.DataFrame, context: dict) -> Optional[pd.Series]:
+    if "geo__country" not in df.columns:
+        logger.warning("'geo__country' missing; skipping country filter.")
+        return None
+    return df["geo__country"].isin(context["country"])
+
+
+def _user_mask(df: pd.DataFrame, context: dict) -> pd.Series:
+    return ~df["user_pseudo_id"].isin(context["not_user"])
+
+
+def _version_mask(df: pd.DataFrame, context: dict) -> pd.Series:
+    return version_at_least(df["app_info__version"], context["version_filter"])
+
+
+# --- Expressions over the raw dataset
+
+def _date_expression(context: dict, versions: pd.Series) -> ds.Expression:
+    # Daily tables are cut in the property's time zone, so the table for the
+    # previous day can still hold events at or after midnight UTC.
+    start_dt = pd.Timestamp(context["start_date"], tz="UTC")
+    first_table = (start_dt - pd.Timedelta(days=1)).strftime("%Y%m%d")
+    return (ds.field(PARTITION_FIELD) >= first_table) & (ds.field("event_timestamp") >= _start_timestamp(context))
+
+
+def _country_expression(context: dict, versions: pd.Series) -> ds.Expression:
+    return string_isin(("geo", "country"), context["country"])
+
+
+def _user_expression(context: dict, versions: pd.Series) -> ds.Expression:
+    return ~string_isin(("user_pseudo_id",), context["not_user"])
+
+
+def _version_expression(context: dict, versions: pd.Series) -> ds.Expression:
+    """`app_info.version` >= version_filter as an isin over the distinct `versions` present."""
+    return string_isin(("app_info", "version"), _kept_versions(versions, context))
+
+
+def _kept_versions(versions: pd.Series, context: dict) -> pd.Series:
+    distinct = pd.Series(versions.dropna().unique(), dtype=object)
+    return distinct[version_at_least(distinct, context["version_filter"])]
+
+
+# name -> (setting in context, frame mask, scan expression, log description)
+FILTER_CLAUSES: dict[str, tuple[str, Callable, Callable, str]] = {
+    "date": ("start_date", _date_mask, _date_expression, "start date"),
+    "country": ("country", _country_mask, _country_expression, "countries"),
+    "user": ("not_user", _user_mask, _user_expression, "excluded users"),
+    "version": ("version_filter", _version_mask, _version_expression, "app version >="),
+}
+
+
+def active_filters(context: dict, names: Optional[list[str]] = None) -> list[str]:
+    """Clauses from `names` (default: `event_filters`) whose setting is not empty, in order."""
+    names = context.get("event_filters", DEFAULT_FILTERS) if names is None else names
+    unknown = [name for name in names if name not in FILTER_CLAUSES]
+    if unknown:
+        raise ValueError(f"Unknown event filters {unknown}; expected some of {list(FILTER_CLAUSES)}.")
+
+    active = []
+    for name in names:
+        setting = context.get(FILTER_CLAUSES[name][0])
+        if setting is None or (isinstance(setting, (list, tuple, set, str)) and not setting):
+            logger.info(f"No {name} filter applied ({FILTER_CLAUSES[name][0]}={setting}).")
+            continue
+        active.append(name)
+    return active
+
+
+def _describe(name: str, context: dict) -> str:
+    setting, _, _, label = FILTER_CLAUSES[name]
+    return f"{label} {context[setting]}"
+
+
+def event_mask(df: pd.DataFrame, context: dict, names: Optional[list[str]] = None) -> np.ndarray:
+    """One boolean mask combining the active clauses, logging what each of them removes."""
+    names = active_filters(context, names)
+    mask = np.ones(len(df), dtype=bool)
+    for name in names:
+        clause = FILTER_CLAUSES[name][1](df, context)
+        if clause is None:
+            continue
+        before = int(mask.sum())
+        mask &= clause.fillna(False).to_numpy(dtype=bool)
+        logger.info(f"Filtered events from {before} to {int(mask.sum())} based on {_describe(name, context)}.")
+    return mask
+
+
+def apply_event_filters(df: pd.DataFrame, context=None, names: Optional[list[str]] = None) -> pd.DataFrame:
+    """Keep the events passing every active filter, in a single pass over the frame.
+
+    `names` restricts the clauses considered (default: `event_filters`).
+    """
+    context = context or {}
+    names = active_filters(context, names)
+    if not names or df.empty:
+        return df
+
+    mask = event_mask(df, context, names)
+    if mask.all():
+        return df
+    return df[mask]
+
+
+def _clause_counts(dataset: ds.Dataset, columns: dict[str, ds.Expression]) -> pd.DataFrame:
+    """Events per combination of the projected clause values, from one scan batch by batch."""
+    parts = []
+    for batch in dataset.to_batches(columns=columns, use_threads=True):
+        if batch.num_rows:
+            table = pa.Table.from_batches([batch])
+            parts.append(table.group_by(list(columns), use_threads=False).aggregate([([], "count_all")]).to_pandas())
+    if not parts:
+        return pd.DataFrame({**{col: pd.Series(dtype=object) for col in columns}, "count_all": pd.Series(dtype="int64")})
+    return pd.concat(parts).groupby(list(columns), dropna=False, as_index=False)["count_all"].sum()
+
+
+def scan_predicate(dataset: ds.Dataset, context: dict):
+    """The active filters as one dataset expression (None when nothing filters).
+
+    One scan projects each clause to a boolean (and `app_info.version` to its
+    value) and counts the events per combination. The distinct versions give
+    the version clause its isin list, and the counts give what each clause
+    removes without scanning the events themselves.
+    """
+    names = active_filters(context)
+    if not names:
+        return None
+
+    columns = {name: FILTER_CLAUSES[name][2](context, None) for name in names if name != "version"}
+    if "version" in names:
+        columns["version"] = ds.field("app_info", "version").cast(pa.string())
+    counts = _clause_counts(dataset, columns)
+    versions = counts["version"] if "version" in names else None
+
+    scan_filter: Optional[ds.Expression] = None
+    passing = pd.Series(True, index=counts.index)
+    total = int(counts["count_all"].sum())
+    for name in names:
+        clause = FILTER_CLAUSES[name][2](context, versions)
+        scan_filter = clause if scan_filter is None else scan_filter & clause
+        if name == "version":
+            passing &= counts["version"].isin(_kept_versions(versions, context))
+        else:
+            passing &= counts[name].fillna(False).astype(bool)
+        kept = int(counts.loc[passing, "count_all"].sum())
+        logger.info(f"Scan filtered events from {total} to {kept} based on {_describe(name, context)}.")
+        total = kept
+    return scan_filter
@@ -1,9 +1,13 @@
 from __future__ import annotations
 
 import json
+from concurrent.futures import ProcessPoolExecutor
 from typing import Any, Mapping, MutableMapping, Optional
 
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
 from emoji_oracle_analytics.config.logging import get_logger
 
 logger = get_logger(__name__)
@@ -64,15 +68,80 @@ def flatten_dataframe(df: pd.DataFrame, context: Optional[dict] = None) -> pd.Da
     
     Args:
     - df: The input pandas DataFrame with potential nested dictionary columns.
+    - context: `flatten_engine` selects "arrow" (columnar, default) or "rows"
+      (`flatten_row` per row, the reference implementation).
+      `flatten_workers` > 1 flattens chunks of `flatten_chunk_rows` rows in
+      that many processes.
     
     Returns:
     - A new pandas DataFrame with flattened structure.
     """
-    _ = context
-    records = [flatten_row(row.to_dict()) for _, row in df.iterrows()]
+    context = context or {}
+    engine = context.get("flatten_engine", "arrow")
+    workers = context.get("flatten_workers", 1)
+    chunk_rows = context.get("flatten_chunk_rows", 100_000)
+
+    if workers <= 1 or len(df) <= chunk_rows:
+        return _flatten_chunk(df, engine)
+
+    chunks = [df.iloc[start:start + chunk_rows] for start in range(0, len(df), chunk_rows)]
+    logger.info(f"Flattening {len(df)} rows in {len(chunks)} chunks on {workers} processes...")
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # map() yields results in submission order, so row order is preserved.
+        parts = list(executor.map(_flatten_chunk, chunks, [engine] * len(chunks)))
+    return concat_flattened(parts)
+
+
+def _flatten_chunk(df: pd.DataFrame, engine: str) -> pd.DataFrame:
+    if engine == "arrow":
+        try:
+            return flatten_dataframe_arrow(df)
+        except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError) as e:
+            logger.warning(f"Columnar flattening failed ({e}); falling back to row-by-row flattening.")
+
+    # to_dict("records") hands Arrow list cells over as plain lists of dicts.
+    records = [flatten_row(row) for row in df.to_dict("records")]
     return pd.DataFrame.from_records(records)
 
 
+def concat_flattened(parts: list[pd.DataFrame]) -> pd.DataFrame:
+    """Concatenate separately flattened chunks as if they were flattened together.
+
+    Columns are the union in order of first appearance. A column whose chunks
+    disagree on dtype (or is missing from some chunks) is rebuilt with the
+    dtype `from_records` would have inferred over all rows, so the result does
+    not depend on where the chunk boundaries fall.
+    """
+    lengths = [len(part) for part in parts]
+    columns = list(dict.fromkeys(c for part in parts for c in part.columns))
+
+    out = {}
+    for col in columns:
+        pieces = [part[col] if col in part.columns else None for part in parts]
+        present = [p for p in pieces if p is not None]
+        dtypes = {str(p.dtype) for p in present}
+
+        if len(present) == len(pieces) and len(dtypes) == 1:
+            out[col] = pd.concat(present, ignore_index=True)
+        elif all(pd.api.types.is_numeric_dtype(p.dtype) and not pd.api.types.is_bool_dtype(p.dtype) for p in present):
+            out[col] = pd.Series(np.concatenate([
+                p.to_numpy(dtype=np.float64, na_value=np.nan) if p is not None else np.full(n, np.nan)
+                for p, n in zip(pieces, lengths)
+            ]))
+        elif len(dtypes) == 1 and isinstance(present[0].dtype, pd.StringDtype):
+            dtype = present[0].dtype
+            out[col] = pd.concat(
+                [p if p is not None else pd.Series([np.nan] * n, dtype=dtype) for p, n in zip(pieces, lengths)],
+                ignore_index=True,
+            )
+        else:
+            values: list = []
+            for p, n in zip(pieces, lengths):
+                values.extend(p.tolist() if p is not None else [np.nan] * n)
+            out[col] = pd.Series(values)
+
+    return pd.DataFrame(out)
+
 
 def _firebase_param_value(value_dict: Mapping[str, Any]) -> Any:
     # Prioritize types: string > int > float > double
@@ -202,4 +271,234 @@ def flatten_row(row: Mapping[str, Any]) -> dict[str, Any]:
     item_params = flatten_extract_params(row.get("item_params", []))
     _update_with_prefixed_dict(flat, "item_params", item_params)
 
-    return flat
\ No newline at end of file
+    return flat
+
+# --- Columnar (Arrow) flattening
+#
+# Produces exactly what `DataFrame.from_records([flatten_row(r) ...])` would:
+# the same columns in the same order (first row a key appears in, then its
+# position within that row's dict) and the same dtype inference (NaN for rows
+# that lack a key, None for rows that have it with no value).
+
+# Struct columns expanded with `_coerce_mapping` in `flatten_row`, in output order.
+_STRUCT_COLUMNS: tuple[str, ...] = (
+    "privacy_info",
+    "user_ltv",
+    "device",
+    "geo",
+    "app_info",
+    "traffic_source",
+)
+
+# Columns expanded with `flatten_nested_column` in `flatten_row`, in output order.
+_NESTED_COLUMNS: tuple[str, ...] = ("event_dimensions", "ecommerce", "items", "collected_traffic_source")
+
+# Key/value list columns and the prefix `flatten_row` gives their keys.
+_PARAM_COLUMNS: dict[str, str] = {
+    "event_params": "event_params",
+    "user_properties": "user",
+    "item_params": "item_params",
+}
+
+# Position of each expanded column's keys within a flattened row (base fields are 0).
+_GROUP_RANK: dict[str, int] = {
+    name: rank
+    for rank, name in enumerate(
+        ["event_params", "user_properties", *_STRUCT_COLUMNS, *_NESTED_COLUMNS, "item_params"],
+        start=1,
+    )
+}
+
+_PARAM_VALUE_KEYS: tuple[str, ...] = ("string_value", "int_value", "float_value", "double_value")
+
+
+def _to_arrow(series: pd.Series, convert=None) -> pa.Array:
+    """Arrow array for a nested column; object columns go through `convert` per value."""
+    if isinstance(series.dtype, pd.ArrowDtype):
+        array = pa.array(series.array)
+        return array.combine_chunks() if isinstance(array, pa.ChunkedArray) else array
+    values = series.tolist()
+    if convert is not None:
+        values = [convert(v) for v in values]
+    return pa.array(values)
+
+
+def _mapping_or_none(value: Any) -> Optional[Mapping[str, Any]]:
+    return _coerce_mapping(value) or None
+
+
+def _list_or_none(value: Any) -> Optional[list]:
+    return value if isinstance(value, list) else None
+
+
+def _dict_or_none(value: Any) -> Optional[dict]:
+    return value if isinstance(value, dict) else None
+
+
+def _object_series(values: list, present: np.ndarray) -> pd.Series:
+    """Infer a column from Python values the way `from_records` does."""
+    values = np.array(values + [None], dtype=object)[:-1]
+    values[~present] = np.nan
+    return pd.Series(values.tolist())
+
+
+def _records_series(array: pa.Array, present: np.ndarray) -> pd.Series:
+    """Column as `from_records` would build it from per-row values.
+
+    `array` holds one value per row; `present` marks rows whose dict has the key.
+    """
+    n = len(array)
+    if array.null_count == n:
+        # All-None columns stay object; any absent row turns them into NaN floats.
+        if present.all():
+            return pd.Series([None] * n, dtype=object)
+        return pd.Series(np.full(n, np.nan))
+
+    kind = array.type
+    if pa.types.is_integer(kind):
+        return array.cast(pa.int64()).to_pandas()
+    if pa.types.is_floating(kind):
+        return array.cast(pa.float64()).to_pandas()
+    if pa.types.is_string(kind) or pa.types.is_large_string(kind):
+        return array.to_pandas()
+    if pa.types.is_boolean(kind) and array.null_count == 0:
+        return array.to_pandas()
+    return _object_series(array.to_pylist(), present)
+
+
+def _struct_columns(array: pa.Array, prefix: str, rank: int, out: list) -> None:
+    """Expand a struct column into `prefix.<field>` columns."""
+    if not pa.types.is_struct(array.type):
+        return
+    present = array.is_valid().to_numpy(zero_copy_only=False)
+    if not present.any():
+        return
+    first_row = int(np.argmax(present))
+    for position, child in enumerate(array.flatten()):
+        name = f"{prefix}.{array.type.field(position).name}"
+        out.append(((first_row, rank, position), name, _records_series(child, present)))
+
+
+def _missing_column(missing: np.ndarray, name: str, rank: int, out: list) -> None:
+    """`flatten_nested_column` sets `name` to None on rows where the column is missing."""
+    if missing.any():
+        out.append(((int(np.argmax(missing)), rank, 0), name, _records_series(pa.nulls(len(missing)), missing)))
+
+
+def _param_value(candidates: list[pa.Array], present: np.ndarray) -> pd.Series:
+    """Pick each row's value by the `_firebase_param_value` priority: string > int > float > double."""
+    candidates = [c for c in candidates if c.null_count < len(c)]
+    if not candidates:
+        return _records_series(pa.nulls(len(present)), present)
+
+    types = {c.type for c in candidates}
+    if len(types) == 1:
+        return _records_series(pc.coalesce(*candidates), present)
+
+    # The key holds values of different types across rows: pick in Python-object space.
+    values = [None] * len(present)
+    for candidate in reversed(candidates):
+        for i, value in enumerate(candidate.to_pylist()):
+            if value is not None:
+                values[i] = value
+    return _object_series(values, present)
+
+
+def _param_columns(array: pa.Array, prefix: str, rank: int, out: list) -> None:
+    """Pivot a list<struct<key, value>> column into `prefix.<key>` columns."""
+    if not pa.types.is_list(array.type) or not pa.types.is_struct(array.type.value_type):
+        return
+    entry_type = array.type.value_type
+    if entry_type.get_field_index("key") < 0:
+        return
+
+    n = len(array)
+    entries = array.flatten()
+    parents = pc.list_parent_indices(array).to_numpy()
+    fields = dict(zip([f.name for f in entry_type], entries.flatten()))
+    keys = fields["key"].cast(pa.string())
+    keep = pc.fill_null(pc.not_equal(keys, ""), False).to_numpy(zero_copy_only=False)
+    if not keep.any():
+        return
+
+    index = np.flatnonzero(keep)
+    rows = parents[index]
+    codes, names = pd.factorize(keys.take(pa.array(index)).to_numpy(zero_copy_only=False))
+
+    value = fields.get("value")
+    value_fields = {}
+    if value is not None and pa.types.is_struct(value.type):
+        value_fields = dict(zip([f.name for f in value.type], value.flatten()))
+    candidates = [
+        value_fields[k].take(pa.array(index))
+        for k in _PARAM_VALUE_KEYS
+        if k in value_fields and not pa.types.is_null(value_fields[k].type)
+    ]
+
+    # Dict semantics of `flatten_extract_params`: the first occurrence of a key
+    # fixes its position in the row, the last occurrence supplies its value.
+    first = np.unique(codes, return_index=True)[1]
+    row_key = rows * len(names) + codes
+    last = np.sort(len(codes) - 1 - np.unique(row_key[::-1], return_index=True)[1])
+    last_codes = codes[last]
+
+    for code, name in enumerate(names):
+        selected = last[last_codes == code]
+        row_to_entry = np.zeros(n, dtype=np.int64)
+        present = np.zeros(n, dtype=bool)
+        row_to_entry[rows[selected]] = selected
+        present[rows[selected]] = True
+        take = pa.array(row_to_entry, mask=~present)
+        series = _param_value([c.take(take) for c in candidates], present)
+        position = (int(rows[first[code]]), rank, int(index[first[code]]))
+        out.append((position, f"{prefix}.{name}", series))
+
+
+def flatten_dataframe_arrow(df: pd.DataFrame) -> pd.DataFrame:
+    """Columnar equivalent of flattening every row with `flatten_row`.
+
+    Each nested column is converted to Arrow once (zero-copy for the
+    `pd.ArrowDtype` columns produced by `pull_from_bq`); key/value lists are
+    exploded with `list_flatten`/`list_parent_indices` and pivoted per key.
+    """
+    n = len(df)
+    if n == 0:
+        return pd.DataFrame()
+
+    out: list = []
+    for position, field in enumerate(_BASE_FIELDS):
+        if field not in df.columns:
+            series = pd.Series([None] * n, dtype=object)
+        elif df[field].dtype == object or isinstance(df[field].dtype, pd.ArrowDtype):
+            series = pd.Series(df[field].tolist())
+        else:
+            series = df[field].reset_index(drop=True)
+        out.append(((0, 0, position), field, series))
+
+    for col, prefix in _PARAM_COLUMNS.items():
+        if col in df.columns:
+            _param_columns(_to_arrow(df[col], _list_or_none), prefix, _GROUP_RANK[col], out)
+
+    for col in _STRUCT_COLUMNS:
+        if col in df.columns:
+            _struct_columns(_to_arrow(df[col], _mapping_or_none), col, _GROUP_RANK[col], out)
+
+    for col in _NESTED_COLUMNS:
+        rank = _GROUP_RANK[col]
+        if col not in df.columns:
+            _missing_column(np.ones(n, dtype=bool), col, rank, out)
+            continue
+        series = df[col]
+        if isinstance(series.dtype, pd.ArrowDtype):
+            array = _to_arrow(series)
+            missing = array.is_null().to_numpy(zero_copy_only=False)
+            if pa.types.is_list(array.type):
+                missing |= pc.equal(pc.list_value_length(array), 0).fill_null(True).to_numpy(zero_copy_only=False)
+        else:
+            missing = np.array([_is_missing(v) for v in series.tolist()], dtype=bool)
+            array = _to_arrow(series, _dict_or_none)
+        _struct_columns(array, col, rank, out)
+        _missing_column(missing, col, rank, out)
+
+    out.sort(key=lambda item: item[0])
+    return pd.DataFrame({name: series for _, name, series in out})
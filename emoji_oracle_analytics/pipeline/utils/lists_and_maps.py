@@ -206,6 +206,34 @@ conversion_events = {
 
 
 
+# GA4 export columns the pipeline stages actually read, used to prune the
+# BigQuery SELECT list (see pull_functions.build_events_query).
+# None selects the whole column; a list selects only those struct fields.
+extract_columns = {
+    'event_date': None,
+    'event_timestamp': None,
+    'event_name': None,
+    'event_params': None,
+    'event_previous_timestamp': None,
+    'event_server_timestamp_offset': None,
+    'user_pseudo_id': None,
+    'user_properties': None,
+    'user_first_touch_timestamp': None,
+    'platform': None,
+    'device': ['category',
+               'language',
+               'is_limited_ad_tracking',
+               'mobile_marketing_name',
+               'operating_system',
+               'operating_system_version',
+               'time_zone_offset_seconds'],
+    'geo': ['country'],
+    'app_info': ['version',
+                 'install_source'],
+}
+
+
+
 columns_to_drop = ['event_timestamp',
                     'event_previous_timestamp', 
                     'user_first_touch_timestamp', 
@@ -238,6 +266,10 @@ columns_to_drop = ['event_timestamp',
                     'event_params__system_app'
 ]
 
+# Columns in columns_to_drop that the split dataframes still read. The stage
+# runner drops the rest of columns_to_drop once no later stage uses them.
+split_columns = ['device__mobile_marketing_name']
+
 
 
 
@@ -419,6 +451,48 @@ ts_weekday_map = {'Monday': 'Pazartesi',
 }
 
 
+# Declared physical types of flattened parameter columns (see param_schema.py).
+# Keys not listed here are typed from their first non-empty values and added
+# to the registry file next to the parquet store.
+param_schema = {
+    # Session and progress identifiers
+    'event_params__ga_session_id': 'Int64',
+    'event_params__ga_session_number': 'Int64',
+    'event_params__current_tier': 'Int64',
+    'event_params__current_qi': 'Int64',
+
+    # Measures
+    'event_params__engagement_time_msec': 'float64',
+    'event_params__engaged_session_event': 'float64',
+    'event_params__session_engaged': 'float64',
+    'event_params__time_spent': 'float64',
+    'event_params__answered_wrong': 'float64',
+    'event_params__earned_amount': 'float64',
+    'event_params__spent_amount': 'float64',
+    'event_params__ad_reward_amount': 'float64',
+    'user__first_open_time': 'float64',
+    'user__ga_session_id': 'float64',
+    'user__ga_session_number': 'float64',
+
+    # Names and labels
+    'event_params__firebase_event_origin': 'string',
+    'event_params__firebase_screen_class': 'string',
+    'event_params__character_name': 'string',
+    'event_params__menu_name': 'string',
+    'event_params__mini_game_ri': 'string',
+    'event_params__mini_game_name': 'string',
+    'event_params__currency_name': 'string',
+    'event_params__how_its_earned': 'string',
+    'event_params__where_its_earned': 'string',
+    'event_params__where_its_spent': 'string',
+    'event_params__spent_to': 'string',
+    'event_params__ad_shown_where': 'string',
+    'event_params__ad_network': 'string',
+    'event_params__ad_unit_id': 'string',
+    'event_params__previous_app_version': 'string',
+}
+
+
 map_of_maps = {
     'event_name': event_name_map,
     'event_params__mini_game_ri': event_params__mini_game_ri_map,
@@ -437,6 +511,34 @@ map_of_maps = {
     'ts_weekday': ts_weekday_map,
 }
 
+# Low-cardinality string columns stored as pandas Categorical at the end of the
+# pipeline, with the most distinct values each may have to still be converted.
+categorical_columns = {
+    'event_name': 500,
+    'platform': 10,
+    'geo__country': 300,
+    'geo__continent': 20,
+    'geo__sub_continent': 50,
+    'device__category': 10,
+    'device__operating_system': 20,
+    'device__operating_system_version': 500,
+    'device__language': 300,
+    'device__mobile_brand_name': 500,
+    'app_info__version': 500,
+    'app_info__install_source': 50,
+    'event_params__character_name': 100,
+    'event_params__menu_name': 200,
+    'event_params__spent_to': 200,
+    'event_params__currency_name': 50,
+    'event_params__mini_game_name': 100,
+    'event_params__where_its_earned': 50,
+    'event_params__where_its_spent': 50,
+    'event_params__how_its_earned': 50,
+    'ts_weekday': 7,
+    'ts_daytime_named': 10,
+    'ts_is_weekend': 2,
+}
+
 # Dataframe Splits
 
 df_splits = {
@@ -1,6 +1,7 @@
 import os
 import pandas as pd
 from emoji_oracle_analytics.config.logging import get_logger
+from emoji_oracle_analytics.pipeline.utils.filters import apply_event_filters
 from pathlib import Path
 
 logger = get_logger(__name__)
@@ -23,51 +24,15 @@ def ensure_directories(directories):
 
 def filter_events_by_date(df, context):
     """Filter events in the DataFrame to only include those on or after start_date (UTC)."""
-    # Convert date to pandas Timestamp (assumed UTC)
-
-    start_date = context["start_date"]
-    start_dt = pd.Timestamp(start_date, tz='UTC')
-
-    # Convert to UNIX microseconds
-    start_ts = int(start_dt.value // 10**3)
-
-    # Filter
-    filtered_df = df[df['event_timestamp'] >= start_ts]
-
-    logger.info(
-        f"Filtered events from {len(df)} to {len(filtered_df)} based on start date {start_dt}."
-    )
-    return filtered_df
+    return apply_event_filters(df, context, names=["date"])
 
 def filter_events_by_country(df, context):
-    country = context.get('country')
-    # Treat empty/None as "no filter" (common local default).
-    if not country:
-        logger.info(f"No country filter applied (country={country}). Keeping {len(df)} events.")
-        return df
-
-    if 'geo__country' not in df.columns:
-        logger.warning("'geo__country' missing; skipping country filter.")
-        return df
-
-    filtered_df = df[df['geo__country'].isin(country)]
-
-    logger.info(
-        f"Filtered events from {len(df)} to {len(filtered_df)} based on countries: {country}."
-    )
-    return filtered_df
+    """Keep events from the countries in context['country'] (no filter when empty)."""
+    return apply_event_filters(df, context, names=["country"])
 
 def filter_events_by_user(df, context):
-    
-    # Convert date to pandas Timestamp (assumed UTC)
-    not_user = context['not_user']
-    filtered_df = df[~df['user_pseudo_id'].isin(not_user)]
-
-    logger.info(
-        f"Filtered events from {len(df)} to {len(filtered_df)} based on users: {not_user}."
-    )
-    
-    return filtered_df
+    """Drop events from the users in context['not_user']."""
+    return apply_event_filters(df, context, names=["user"])
 
 
 def vers(v1, v2):
@@ -93,13 +58,6 @@ def vers(v1, v2):
 def filter_events_by_version(df, context):
     """
     Filter events in the DataFrame to only include those with app_version >= specified version.
+    Each distinct version is parsed once; events without a version are dropped.
     """
-    version_filter = context['version_filter']
-    
-    # Apply version comparison
-    filtered_df = df[df['app_info__version'].apply(lambda v: vers(v, version_filter) >= 0)]
-
-    logger.info(
-        f"Filtered events from {len(df)} to {len(filtered_df)} based on app version >= {version_filter}."
-    )
-    return filtered_df
\ No newline at end of file
+    return apply_event_filters(df, context, names=["version"])
@@ -0,0 +1,216 @@
+"""Download manifest for the local parquet store.
+
+The manifest is a JSON file recording, per downloaded BigQuery table, the
+parquet file it was written to and enough metadata to trust that file without
+opening it: row count, byte size, schema fingerprint, the source table's
+`last_modified_time`/`row_count` and a SHA-256 checksum of the file contents.
+
+The manifest also keeps the Arrow schema of each distinct fingerprint under
+`schemas`, so the store is opened with a unified schema built from the
+manifest instead of reading every file's footer. Before an entry is trusted,
+its file's size is checked against the recorded one; a missing or changed file
+is dropped from the manifest and downloaded again.
+
+Both parquet files and the manifest itself are written to a temporary file and
+moved into place with `os.replace`, so a killed run leaves either the old or
+the new version on disk, never a half-written one.
+"""
+
+from __future__ import annotations
+
+import base64
+import hashlib
+import json
+import os
+from datetime import datetime, timezone
+from typing import Any, Optional
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from emoji_oracle_analytics.config.logging import get_logger
+
+logger = get_logger(__name__)
+
+MANIFEST_VERSION = 1
+TMP_SUFFIX = ".tmp"
+
+
+def temp_path(path: str) -> str:
+    return f"{path}{TMP_SUFFIX}"
+
+
+def atomic_replace(tmp: str, path: str) -> None:
+    """Atomically move a fully written `tmp` file over `path`."""
+    os.replace(tmp, path)
+
+
+def remove_stale_temp_files(data_dir: str) -> None:
+    """Delete temp files left behind by an interrupted run."""
+    for root, _, names in os.walk(data_dir):
+        for name in names:
+            if name.endswith(TMP_SUFFIX):
+                logger.warning(f"Removing incomplete file {name} from an interrupted run.")
+                os.remove(os.path.join(root, name))
+
+
+def file_checksum(path: str, chunk_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def schema_fingerprint(schema) -> str:
+    text = schema.to_string(show_field_metadata=False, show_schema_metadata=False)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def describe_parquet(
+    data_dir: str,
+    file: str,
+    last_modified_time: Optional[int] = None,
+    source_rows: Optional[int] = None,
+) -> dict[str, Any]:
+    """Build a manifest entry for a fully written parquet file (`file` is relative to `data_dir`)."""
+    path = os.path.join(data_dir, file)
+    parquet_file = pq.ParquetFile(path)
+    return {
+        "file": file,
+        "rows": parquet_file.metadata.num_rows,
+        "bytes": os.path.getsize(path),
+        "schema_fingerprint": schema_fingerprint(parquet_file.schema_arrow),
+        "last_modified_time": last_modified_time,
+        "source_rows": source_rows,
+        "checksum": file_checksum(path),
+        "downloaded_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+    }
+
+
+def empty_entry(
+    last_modified_time: Optional[int] = None,
+    source_rows: Optional[int] = None,
+) -> dict[str, Any]:
+    """Manifest entry for a table that returned no rows (no file is written)."""
+    return {
+        "file": None,
+        "rows": 0,
+        "bytes": 0,
+        "schema_fingerprint": None,
+        "last_modified_time": last_modified_time,
+        "source_rows": source_rows,
+        "checksum": None,
+        "downloaded_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+    }
+
+
+def save_manifest(path: str, manifest: dict[str, Any]) -> None:
+    tmp = temp_path(path)
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+        f.flush()
+        os.fsync(f.fileno())
+    atomic_replace(tmp, path)
+
+
+def _migrate_legacy_log(log_path: str, data_dir: str) -> dict[str, Any]:
+    """Seed a manifest from the old `log.txt` list of table names."""
+    with open(log_path) as f:
+        logged = [line.strip() for line in f if line.strip()]
+
+    tables = {}
+    for table_name in logged:
+        file = f"{table_name}.parquet"
+        if not os.path.exists(os.path.join(data_dir, file)):
+            logger.warning(f"{table_name} is in {log_path} but {file} is missing; it will be re-downloaded.")
+            continue
+        tables[table_name] = describe_parquet(data_dir, file)
+
+    logger.info(f"Migrated {len(tables)} tables from {log_path} to the download manifest.")
+    return {"version": MANIFEST_VERSION, "tables": tables}
+
+
+def load_manifest(path: str, data_dir: str, legacy_log_path: Optional[str] = None) -> dict[str, Any]:
+    """Load the manifest, migrating from the legacy log file on first use."""
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+
+    if legacy_log_path and os.path.exists(legacy_log_path):
+        manifest = _migrate_legacy_log(legacy_log_path, data_dir)
+        save_manifest(path, manifest)
+        return manifest
+
+    return {"version": MANIFEST_VERSION, "tables": {}}
+
+
+def forget_table(manifest: dict[str, Any], data_dir: str, table_name: str) -> None:
+    """Drop a table from the manifest and delete its parquet file."""
+    entry = manifest["tables"].pop(table_name, None)
+    if entry and entry.get("file"):
+        path = os.path.join(data_dir, entry["file"])
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def verify_entries(manifest: dict[str, Any], data_dir: str) -> list[str]:
+    """Drop tables whose file is missing or not the size recorded; returns their names."""
+    dropped = []
+    for table_name, entry in sorted(manifest["tables"].items()):
+        if not entry.get("file"):
+            continue
+        path = os.path.join(data_dir, entry["file"])
+        size = os.path.getsize(path) if os.path.exists(path) else None
+        if size != entry.get("bytes"):
+            logger.warning(f"{entry['file']} is {size} bytes but {entry.get('bytes')} were recorded; "
+                           f"{table_name} will be re-downloaded.")
+            forget_table(manifest, data_dir, table_name)
+            dropped.append(table_name)
+    return dropped
+
+
+def _encode_schema(schema: pa.Schema) -> str:
+    return base64.b64encode(schema.serialize().to_pybytes()).decode("ascii")
+
+
+def _decode_schema(text: str) -> pa.Schema:
+    return pa.ipc.read_schema(pa.py_buffer(base64.b64decode(text)))
+
+
+def record_schemas(manifest: dict[str, Any], data_dir: str) -> bool:
+    """Keep one schema per fingerprint in use, reading a footer only for new ones.
+
+    Returns whether `manifest["schemas"]` changed.
+    """
+    schemas = manifest.setdefault("schemas", {})
+    in_use = {}
+    for entry in manifest["tables"].values():
+        if entry.get("file") and entry.get("schema_fingerprint"):
+            in_use.setdefault(entry["schema_fingerprint"], entry["file"])
+
+    changed = False
+    for fingerprint, file in in_use.items():
+        if fingerprint not in schemas:
+            schema = pq.read_schema(os.path.join(data_dir, file)).remove_metadata()
+            schemas[fingerprint] = _encode_schema(schema)
+            changed = True
+    for fingerprint in set(schemas) - set(in_use):
+        del schemas[fingerprint]
+        changed = True
+    return changed
+
+
+def manifest_schemas(manifest: dict[str, Any], data_dir: str) -> list[pa.Schema]:
+    """The distinct schemas of the files recorded in the manifest."""
+    record_schemas(manifest, data_dir)
+    return [_decode_schema(text) for _, text in sorted(manifest["schemas"].items())]
+
+
+def manifest_files(manifest: dict[str, Any], data_dir: str) -> list[str]:
+    """Parquet paths recorded in the manifest, ordered by table name."""
+    return [
+        os.path.join(data_dir, entry["file"])
+        for _, entry in sorted(manifest["tables"].items())
+        if entry.get("file")
+    ]
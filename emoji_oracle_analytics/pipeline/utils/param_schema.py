@@ -0,0 +1,169 @@
+"""Registry of physical types for flattened parameter columns.
+
+Flattening infers each `event_params__*` / `user__*` / `item_params__*`
+column's dtype from whatever values a given batch of rows happens to hold, so
+the same key can come out as int64 one day, float64 the next and object when
+a string slips in. The registry pins one type per key:
+
+- `Int64`: nullable integers (identifiers, tiers, counters); only for
+  declared keys, since inferred numbers are typed float64 so that a later
+  fraction does not widen them
+- `float64`: measures, and any other numeric key
+- `string`: labels, using the dtype pandas infers for text
+- `boolean`: nullable booleans
+- `category`: low-cardinality labels that are never rewritten downstream
+
+Declared types come from `param_schema` in lists_and_maps. Every other key is
+typed from its first non-empty values and registered in a JSON file next to
+the parquet store, so it keeps that type on later days. A value that does not
+fit a key's type widens the type (Int64 -> float64 -> string, boolean ->
+string) instead of being dropped; a widening in the registry takes precedence
+over the declared type, so it happens once rather than on every run.
+
+Numeric text with a decimal comma (e.g. "0,0005" from devices with such a
+locale) is read as a number; the conversions are logged per column.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from emoji_oracle_analytics.config.logging import get_logger
+from emoji_oracle_analytics.pipeline.utils.lists_and_maps import param_schema
+from emoji_oracle_analytics.pipeline.utils.manifest import atomic_replace, temp_path
+
+logger = get_logger(__name__)
+
+PARAM_PREFIXES = ("event_params__", "user__", "item_params__")
+PARAM_TYPES = ("Int64", "float64", "string", "boolean", "category")
+
+# The dtype pandas gives text columns (`str` on pandas 3, object before).
+_STRING_DTYPE = pd.Series(["x"]).dtype
+
+# Numbers sent as text from devices with a decimal-comma locale, e.g. "0,0005".
+_DECIMAL_COMMA = r"^-?\d+,\d+$"
+
+_WIDER = {"Int64": "float64", "float64": "string", "boolean": "string", "category": "string"}
+
+
+def is_widening(kind: str, declared: str) -> bool:
+    """Whether `kind` is reached from `declared` by widening."""
+    while declared in _WIDER:
+        declared = _WIDER[declared]
+        if declared == kind:
+            return True
+    return False
+
+
+def load_param_schema(path: Optional[str]) -> dict[str, str]:
+    """Declared types overlaid with the registered ones, where those widen them."""
+    registered = {}
+    if path and os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            registered = json.load(f)["columns"]
+    schema = {**registered, **param_schema}
+    for col, declared in param_schema.items():
+        if is_widening(registered.get(col), declared):
+            schema[col] = registered[col]
+    return schema
+
+
+def save_param_schema(path: str, schema: dict[str, str]) -> None:
+    tmp = temp_path(path)
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"columns": schema}, f, indent=2, sort_keys=True)
+    atomic_replace(tmp, path)
+
+
+def _to_numeric(series: pd.Series, log: bool = False) -> pd.Series:
+    """Numbers in `series`, missing where a value is not one; integers stay exact (Int64)."""
+    if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+        return series
+    text = series.astype(object).where(series.notna())
+    is_comma = text.map(lambda v: isinstance(v, str)) & text.astype(str).str.match(_DECIMAL_COMMA)
+    if is_comma.any():
+        if log:
+            logger.info(f"{series.name}: reading {is_comma.sum()} decimal-comma values as numbers.")
+        text = text.where(~is_comma, text[is_comma].str.replace(",", ".", regex=False))
+    return pd.to_numeric(text, errors="coerce", dtype_backend="numpy_nullable")
+
+
+def infer_param_type(series: pd.Series) -> Optional[str]:
+    """Type for a key seen for the first time; None while it has no values yet."""
+    values = series.dropna()
+    if values.empty:
+        return None
+    if pd.api.types.is_bool_dtype(values) or values.map(lambda v: isinstance(v, (bool, np.bool_))).all():
+        return "boolean"
+    if pd.api.types.is_numeric_dtype(values):
+        return "float64"
+    if _to_numeric(values).notna().all():
+        return "float64"
+    return "string"
+
+
+def convert_param(series: pd.Series, kind: str) -> Optional[pd.Series]:
+    """`series` as `kind`, or None if that would lose a value."""
+    if kind in ("Int64", "float64"):
+        numbers = _to_numeric(series, log=True)
+        if (numbers.isna() & series.notna()).any():
+            return None
+        if kind == "float64":
+            return numbers.astype("float64")
+        # Integers are cast directly: going through float64 rounds them above 2**53
+        if pd.api.types.is_integer_dtype(numbers):
+            return numbers.astype("Int64")
+        numbers = numbers.astype("float64")
+        if (numbers.dropna() % 1 != 0).any():
+            return None
+        return numbers.astype("Int64")
+
+    if kind == "boolean":
+        values = series.dropna()
+        if not values.map(lambda v: isinstance(v, (bool, np.bool_))).all():
+            return None
+        return series.astype("boolean")
+
+    if kind == "category":
+        return series.astype("category")
+
+    return series.astype(_STRING_DTYPE)
+
+
+def apply_param_schema(df: pd.DataFrame, context=None) -> pd.DataFrame:
+    """Cast parameter columns to their registered types, registering new keys."""
+    context = context or {}
+    path = context.get("param_schema_path")
+    schema = load_param_schema(path)
+    changed = False
+
+    for col in df.columns:
+        if not col.startswith(PARAM_PREFIXES):
+            continue
+
+        kind = schema.get(col)
+        if kind is None:
+            kind = infer_param_type(df[col])
+            if kind is None:
+                continue
+            logger.info(f"Registering new parameter column {col} as {kind}.")
+            schema[col] = kind
+            changed = True
+
+        converted = convert_param(df[col], kind)
+        while converted is None:
+            wider = _WIDER[kind]
+            logger.warning(f"{col} has values that do not fit {kind}; widening it to {wider}.")
+            kind = schema[col] = wider
+            changed = True
+            converted = convert_param(df[col], kind)
+        df[col] = converted
+
+    if changed and path:
+        save_param_schema(path, schema)
+    return df
@@ -0,0 +1,115 @@
+"""Layout and scanning of the local parquet store.
+
+Downloaded tables are stored as a hive-partitioned dataset, one directory per
+table date::
+
+    parquet-store/
+        table_date=20251201/events_20251201.parquet
+        table_date=20251202/events_intraday_20251202.parquet
+
+The partition key is named `table_date` rather than `event_date` because the
+GA4 export already has an `event_date` column. The store is read through
+`pyarrow.dataset`, so the pipeline filters (see `filters`) become scan
+predicates that skip whole partitions and row groups instead of filtering a
+fully loaded frame.
+"""
+
+from __future__ import annotations
+
+import os
+from typing import Optional
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from emoji_oracle_analytics.config.logging import get_logger
+
+logger = get_logger(__name__)
+
+PARTITION_FIELD = "table_date"
+PARTITIONING = ds.partitioning(pa.schema([(PARTITION_FIELD, pa.string())]), flavor="hive")
+
+
+def table_date(table_id: str) -> str:
+    """YYYYMMDD suffix of `events_YYYYMMDD` / `events_intraday_YYYYMMDD`."""
+    return table_id.rsplit("_", 1)[1]
+
+
+def table_file(table_name: str) -> str:
+    """Path of a table's parquet file, relative to the store root."""
+    return os.path.join(f"{PARTITION_FIELD}={table_date(table_name)}", f"{table_name}.parquet")
+
+
+def migrate_flat_layout(manifest: dict, data_dir: str) -> bool:
+    """Move files from the old flat `events_X.parquet` layout into partitions.
+
+    Returns True if the manifest was changed and needs saving.
+    """
+    changed = False
+    for table_name, entry in manifest["tables"].items():
+        file = entry.get("file")
+        if not file or file == table_file(table_name):
+            continue
+        old_path = os.path.join(data_dir, file)
+        new_path = os.path.join(data_dir, table_file(table_name))
+        if os.path.exists(old_path):
+            os.makedirs(os.path.dirname(new_path), exist_ok=True)
+            os.replace(old_path, new_path)
+        entry["file"] = table_file(table_name)
+        changed = True
+
+    if changed:
+        logger.info("Moved parquet store files into the partitioned layout.")
+    return changed
+
+
+def open_event_dataset(data_dir: str, files: list[str], schemas: Optional[list[pa.Schema]] = None) -> ds.Dataset:
+    """Open the given store files as one dataset with a unified schema.
+
+    Daily files disagree on types that were all-null on some days (e.g. a
+    `double_value` that is `null` in one file and `double` in another), so the
+    file schemas are unified before scanning: from `schemas` (the distinct
+    schemas recorded in the manifest) when given, else from the file footers.
+    """
+    if schemas is None:
+        schemas = [pq.read_schema(f).remove_metadata() for f in files]
+    schemas = list(schemas)
+    schemas.append(pa.schema([(PARTITION_FIELD, pa.string())]))
+    schema = pa.unify_schemas(schemas, promote_options="permissive")
+    return ds.dataset(
+        files,
+        schema=schema,
+        format="parquet",
+        partitioning=PARTITIONING,
+        partition_base_dir=data_dir,
+    )
+
+
+def string_isin(path: tuple[str, ...], values) -> ds.Expression:
+    """`path` isin `values`, comparing as strings."""
+    # Both sides are typed explicitly: a field that is all-null in every scanned
+    # file has type null, and an empty value list would infer type null too.
+    return ds.field(*path).cast(pa.string()).isin(pa.array(list(values), type=pa.string()))
+
+
+def scan_events(
+    data_dir: str,
+    files: list[str],
+    context: dict,
+    schemas: Optional[list[pa.Schema]] = None,
+) -> pa.Table:
+    """Scan the store files with the pipeline filters pushed down, using multiple threads.
+
+    `schemas` are the files' recorded schemas (see `open_event_dataset`).
+    """
+    if not files:
+        return pa.table({})
+
+    from emoji_oracle_analytics.pipeline.utils.filters import scan_predicate
+
+    dataset = open_event_dataset(data_dir, files, schemas)
+    scan_filter = scan_predicate(dataset, context)
+    table = dataset.to_table(filter=scan_filter, use_threads=True)
+    logger.info(f"Scanned {table.num_rows} events from {len(files)} files.")
+    return table
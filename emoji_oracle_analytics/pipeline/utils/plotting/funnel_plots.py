@@ -3,6 +3,7 @@ import plotly.graph_objects as go
 from emoji_oracle_analytics.config.logging import get_logger
 
 from emoji_oracle_analytics.pipeline.utils.plotting.plot_helpers import funnel_gradient
+from emoji_oracle_analytics.pipeline.utils.versions import version_at_least
 from emoji_oracle_analytics.config.plot_style import (DEFAULT_LAYOUT,
                                BAR_LAYOUT,
                                LINE_LAYOUT,
@@ -17,12 +18,13 @@ def create_funnel_chart(title, df, stage_list, user_col='user_pseudo_id', versio
     df: dataframe where each stage column is 0/1
     stage_list: ordered list of stages in the funnel
     user_col: column representing unique users
+    version: keep users whose start_version is >= this version
     """
     try:
 
         # Version Filtering
         if version is not None:
-            df = df[df['start_version'] == version]
+            df = df[version_at_least(df['start_version'], version)]
         # Values
         values = [df[user_col].nunique()] + [df[s].sum() for s in stage_list]
         labels = ["Total Installs"] + stage_list
@@ -5,6 +5,7 @@ import plotly.graph_objects as go
 
 from emoji_oracle_analytics.pipeline.utils.inferential_helpers import (compute_ci_counts,
                                                 binomial_count_ci)
+from emoji_oracle_analytics.pipeline.utils.versions import version_at_least
 
 from emoji_oracle_analytics.config.plot_style import (DEFAULT_LAYOUT,
                                BAR_LAYOUT,
@@ -163,11 +164,12 @@ def create_funnel_bar_with_ci(title, df, stage_list, user_col='user_pseudo_id',
     """
     Create a bar chart with 95% CIs for funnel steps.
     CIs are computed as binomial CIs relative to total installs.
+    version: keep users whose start_version is >= this version
     """
     try:
         # Version Filtering
         if version is not None:
-            df = df[df['start_version'] == version]
+            df = df[version_at_least(df['start_version'], version)]
 
         # Core values
         total_installs = df[user_col].nunique()
@@ -0,0 +1,230 @@
+"""Per-day cache of the row-local pipeline stages.
+
+Flattening and the other stages that only look at one row at a time give the
+same result whether they run on the whole history or on one daily table, so
+their output is cached per downloaded table::
+
+    data/processed/
+        manifest.json
+        table_date=20251201/events_20251201.pkl
+
+A cached day is reused while its key matches. The key combines the raw
+file's checksum, a hash of the stage code, the scan filters (start date,
+country, users, version) and the `time_features` mode. Only new, re-downloaded or invalidated days are
+recomputed; the cross-day stages (`infer_sessions`, `sort_events`,
+`add_durations`, `forward_fill_progress`, the question stages and
+`apply_value_maps`) then run on the cached union.
+
+Each entry also records the registered types (see param_schema) of the
+parameter columns its day holds. When a later day widens one of those types,
+the days cached with the narrower type no longer match the registry and are
+recomputed, so the union keeps one dtype per column.
+
+Processed days are pickled rather than written as parquet so that every
+column comes back with exactly the pandas dtype it was cached with, without a
+round trip through Arrow types. With `TIME_FEATURES="full"` the `_time`
+columns also hold `datetime.time` objects, which parquet cannot round-trip
+exactly; in the default "compact" mode they are Int32 seconds since midnight.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import inspect
+import json
+import os
+
+import pandas as pd
+
+from emoji_oracle_analytics.config.logging import get_logger
+from emoji_oracle_analytics.pipeline.utils import (
+    cleaning_functions,
+    feature_engineering,
+    filters,
+    flattening_functions,
+    lists_and_maps,
+    param_schema,
+    parquet_store,
+    pull_functions,
+    time_and_date_functions,
+)
+from emoji_oracle_analytics.pipeline.utils.flattening_functions import concat_flattened
+from emoji_oracle_analytics.pipeline.utils.manifest import (
+    atomic_replace,
+    load_manifest,
+    remove_stale_temp_files,
+    save_manifest,
+    temp_path,
+)
+from emoji_oracle_analytics.pipeline.utils.param_schema import load_param_schema
+from emoji_oracle_analytics.pipeline.utils.parquet_store import scan_events, table_file
+from emoji_oracle_analytics.pipeline.utils.pull_functions import (
+    events_to_pandas,
+    normalize_bq_types,
+    sync_store,
+)
+
+logger = get_logger(__name__)
+
+# Stages that only depend on the row they are applied to, in pipeline order.
+ROW_LOCAL_STAGES = [
+    flattening_functions.flatten_dataframe,
+    cleaning_functions.dots_to_underscores,
+    param_schema.apply_param_schema,
+    time_and_date_functions.transform_datetime_fields,
+    time_and_date_functions.add_time_based_features,
+    feature_engineering.mini_game_features,
+    feature_engineering.mini_game_reward_split,
+    feature_engineering.mini_game_buffs,
+    feature_engineering.mini_game_dolls,
+    feature_engineering.currency_define_permanent,
+    feature_engineering.currency_define_consumable,
+    feature_engineering.currency_define_board,
+    feature_engineering.currency_define_keys,
+]
+
+# Modules whose code decides what a processed day contains.
+_STAGE_MODULES = [
+    cleaning_functions,
+    feature_engineering,
+    filters,
+    flattening_functions,
+    lists_and_maps,
+    param_schema,
+    parquet_store,
+    pull_functions,
+    time_and_date_functions,
+]
+
+
+def stage_code_version() -> str:
+    """Hash of the source of every module the row-local stages depend on."""
+    digest = hashlib.sha256()
+    for module in _STAGE_MODULES:
+        digest.update(inspect.getsource(module).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def filter_fingerprint(context: dict) -> str:
+    """The filter settings, as a stable string."""
+    values = {
+        "event_filters": context.get("event_filters"),
+        "start_date": str(context.get("start_date")),
+        "country": sorted(context.get("country") or []),
+        "not_user": sorted(context.get("not_user") or []),
+        "version_filter": context.get("version_filter"),
+    }
+    return json.dumps(values, sort_keys=True)
+
+
+def processed_key(raw_entry: dict, code_version: str, context: dict) -> str:
+    text = "|".join([
+        raw_entry.get("checksum") or "",
+        code_version,
+        filter_fingerprint(context),
+        time_and_date_functions.time_features_fingerprint(context),
+    ])
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def processed_file(table_name: str) -> str:
+    return table_file(table_name).replace(".parquet", ".pkl")
+
+
+def param_types(frame: pd.DataFrame, schema: dict[str, str]) -> dict[str, str]:
+    """Registered types of the parameter columns in `frame`."""
+    return {col: schema[col] for col in frame.columns if col in schema}
+
+
+def _is_current(entry: dict, schema: dict[str, str]) -> bool:
+    """Whether a processed day's parameter types still match the registry."""
+    types = entry.get("param_types")
+    if types is None:
+        return entry.get("file") is None
+    return all(schema.get(col) == kind for col, kind in types.items())
+
+
+def process_table(data_dir: str, raw_file: str, context: dict) -> pd.DataFrame:
+    """Scan one downloaded table (filters pushed down) and run the row-local stages on it."""
+    events = normalize_bq_types(scan_events(data_dir, [os.path.join(data_dir, raw_file)], context))
+    if events.num_rows == 0:
+        return pd.DataFrame()
+
+    df = events_to_pandas(events)
+    for stage in ROW_LOCAL_STAGES:
+        df = stage(df=df, context=context)
+    return df
+
+
+def load_processed_events(df: pd.DataFrame, context: dict) -> pd.DataFrame:
+    """Download new tables, refresh stale processed days and return their union.
+
+    Replaces `pull_from_bq` and the row-local stages when `processed_cache` is on.
+    """
+    data_dir = context["data_dir"]
+    processed_dir = context["processed_dir"]
+    cache_path = os.path.join(processed_dir, "manifest.json")
+
+    raw_manifest = sync_store(context)
+
+    os.makedirs(processed_dir, exist_ok=True)
+    remove_stale_temp_files(processed_dir)
+    cache = load_manifest(cache_path, processed_dir)
+    code_version = stage_code_version()
+
+    # --- Forget processed days whose raw table is gone
+    for table_name in list(cache["tables"]):
+        if table_name not in raw_manifest["tables"]:
+            entry = cache["tables"].pop(table_name)
+            path = os.path.join(processed_dir, entry["file"]) if entry.get("file") else None
+            if path and os.path.exists(path):
+                os.remove(path)
+    save_manifest(cache_path, cache)
+
+    frames = {}
+    reused = recomputed = 0
+    pending = sorted(raw_manifest["tables"])
+    while pending:
+        schema = load_param_schema(context.get("param_schema_path"))
+        for table_name in pending:
+            raw_entry = raw_manifest["tables"][table_name]
+            if not raw_entry.get("file"):
+                continue
+
+            key = processed_key(raw_entry, code_version, context)
+            entry = cache["tables"].get(table_name)
+            path = os.path.join(processed_dir, processed_file(table_name))
+
+            if (
+                entry and entry.get("key") == key and _is_current(entry, schema)
+                and (entry.get("file") is None or os.path.exists(path))
+            ):
+                reused += 1
+                if entry.get("file"):
+                    frames[table_name] = pd.read_pickle(path)
+                continue
+
+            logger.info(f"Processing {table_name}...")
+            recomputed += 1
+            frame = process_table(data_dir, raw_entry["file"], context)
+            schema = load_param_schema(context.get("param_schema_path"))
+            entry = {"file": None, "key": key, "rows": len(frame), "param_types": param_types(frame, schema)}
+            frames.pop(table_name, None)
+            if not frame.empty:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                frame.to_pickle(temp_path(path))
+                atomic_replace(temp_path(path), path)
+                entry["file"] = processed_file(table_name)
+                frames[table_name] = frame
+            cache["tables"][table_name] = entry
+            save_manifest(cache_path, cache)
+
+        # --- Days processed before a later day widened one of their types
+        pending = [name for name in sorted(frames) if not _is_current(cache["tables"][name], schema)]
+        if pending:
+            logger.info(f"Parameter types widened; reprocessing {len(pending)} days.")
+
+    logger.info(f"Reused {reused} processed days, recomputed {recomputed}.")
+    if not frames:
+        return pd.DataFrame()
+    return concat_flattened([frames[name] for name in sorted(frames)])
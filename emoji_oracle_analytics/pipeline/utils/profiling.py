@@ -0,0 +1,128 @@
+"""Opt-in profiling of pipeline stages, split functions and plots.
+
+With `PROFILE` on, every pipeline stage (see stage_graph), every
+`create_df_*` split and every report plot is run through `run_profiled`,
+which appends one record per call to `context["profile_records"]`:
+
+- `group` / `name`: "stage", "split" or "plot" and the function name
+- `wall_s` / `cpu_s`: elapsed and process CPU seconds
+- `peak_mb`: tracemalloc peak of Python allocations during the call (None
+  with `profile_memory` off)
+- `rss_delta_mb`: change of the process resident set size (Linux only)
+- `rows_in` / `cols_in` / `rows_out` / `cols_out`: frame shape before and after
+- `frame_mb`: deep memory usage of the output frame
+
+The records are written to `PROFILE_DIR` as `profile_<run>.json` and
+`profile_<run>.csv`, and summarised on the technical report page.
+
+tracemalloc slows allocations down (turn `PROFILE_MEMORY`, i.e. the
+`profile_memory` context key, off for timings close to an unprofiled run),
+and measuring the deep memory of a frame walks its object columns, so
+profiled runs are slower than normal ones. With
+`stage_workers` > 1, stages of one level overlap and their CPU, peak and RSS
+numbers include each other's work.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Any, Callable, Optional
+
+import pandas as pd
+
+from emoji_oracle_analytics.config.logging import get_logger
+
+logger = get_logger(__name__)
+
+PROFILE_COLUMNS = [
+    "group", "name", "wall_s", "cpu_s", "peak_mb", "rss_delta_mb",
+    "rows_in", "cols_in", "rows_out", "cols_out", "frame_mb",
+]
+
+
+def _rss_bytes() -> Optional[int]:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return None
+
+
+def _first_frame(value) -> Optional[pd.DataFrame]:
+    """The frame a function took or returned (the first one of a tuple or list)."""
+    if isinstance(value, pd.DataFrame):
+        return value
+    if isinstance(value, (tuple, list)):
+        return next((v for v in value if isinstance(v, pd.DataFrame)), None)
+    return None
+
+
+def _shape(df: Optional[pd.DataFrame]) -> tuple[Optional[int], Optional[int]]:
+    return df.shape if df is not None else (None, None)
+
+
+def run_profiled(context: Optional[dict], group: str, name: str, func: Callable, /, *args, **kwargs):
+    """Call `func(*args, **kwargs)`, recording its cost when profiling is on."""
+    records = (context or {}).get("profile_records")
+    if records is None:
+        return func(*args, **kwargs)
+
+    trace = context.get("profile_memory", True)
+    if trace and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    df_in = _first_frame(kwargs["df"]) if "df" in kwargs else _first_frame(list(args))
+    rows_in, cols_in = _shape(df_in)
+
+    rss_before = _rss_bytes()
+    if trace:
+        tracemalloc.reset_peak()
+        traced_before = tracemalloc.get_traced_memory()[0]
+    wall, cpu = time.perf_counter(), time.process_time()
+
+    result = func(*args, **kwargs)
+
+    wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+    peak = tracemalloc.get_traced_memory()[1] - traced_before if trace else None
+    rss_after = _rss_bytes()
+    df_out = _first_frame(result)
+    rows_out, cols_out = _shape(df_out)
+
+    records.append({
+        "group": group,
+        "name": name,
+        "wall_s": round(wall, 4),
+        "cpu_s": round(cpu, 4),
+        "peak_mb": round(peak / 2**20, 2) if peak is not None else None,
+        "rss_delta_mb": round((rss_after - rss_before) / 2**20, 2) if rss_before is not None else None,
+        "rows_in": rows_in,
+        "cols_in": cols_in,
+        "rows_out": rows_out,
+        "cols_out": cols_out,
+        "frame_mb": round(df_out.memory_usage(deep=True).sum() / 2**20, 2) if df_out is not None else None,
+    })
+    return result
+
+
+def profile_frame(records: list[dict[str, Any]]) -> pd.DataFrame:
+    shapes = ["rows_in", "cols_in", "rows_out", "cols_out"]
+    return pd.DataFrame(records, columns=PROFILE_COLUMNS).astype({col: "Int64" for col in shapes})
+
+
+def save_profile(records: list[dict[str, Any]], profile_dir: str) -> str:
+    """Write the records as JSON and CSV; returns the JSON path."""
+    os.makedirs(profile_dir, exist_ok=True)
+    run = datetime.now().strftime("%Y%m%d_%H%M%S")
+    json_path = os.path.join(profile_dir, f"profile_{run}.json")
+    with open(json_path, "w", encoding="utf-8") as f:
+        json.dump({"run": run, "records": records}, f, indent=2)
+    profile_frame(records).to_csv(os.path.join(profile_dir, f"profile_{run}.csv"), index=False)
+
+    slowest = profile_frame(records).nlargest(5, "wall_s")
+    for row in slowest.itertuples():
+        logger.info(f"Slowest: {row.group} {row.name} {row.wall_s:.2f}s, peak {row.peak_mb} MB.")
+    logger.info(f"Profile written to {json_path}")
+    return json_path
@@ -1,89 +1,464 @@
 from google.cloud import bigquery
 from google.oauth2 import service_account
 import pandas as pd
-import numpy as np
 import pyarrow.parquet as pq
+import pyarrow.compute as pc
 import pyarrow as pa
+import pyarrow.json as pj
 import os
 import json
+import hashlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta, timezone
 
 from emoji_oracle_analytics.config.logging import get_logger
+from emoji_oracle_analytics.pipeline.utils.lists_and_maps import extract_columns
+from emoji_oracle_analytics.pipeline.utils.manifest import (
+    atomic_replace,
+    describe_parquet,
+    empty_entry,
+    forget_table,
+    load_manifest,
+    manifest_files,
+    manifest_schemas,
+    record_schemas,
+    remove_stale_temp_files,
+    save_manifest,
+    temp_path,
+    verify_entries,
+)
+from emoji_oracle_analytics.pipeline.utils.parquet_store import (
+    migrate_flat_layout,
+    scan_events,
+    table_date,
+    table_file,
+)
 
 logger = get_logger(__name__)
 
-def pull_from_bq(df, context):
-    client = context["client"]
-    log_path = context["log_path"]
-    data_dir = context["data_dir"]
-    dataset = context["dataset"]
-    start_date = context["start_date"]  # datetime.date object
+def _with_source_table(batch, table_name):
+    source = pa.array([table_name] * batch.num_rows, type=pa.string())
+    return pa.RecordBatch.from_arrays(
+        batch.columns + [source],
+        names=batch.schema.names + ["source_table"],
+    )
+
+
+def write_batches_to_parquet(batches, path, table_name):
+    """Stream Arrow record batches into a parquet file, one row group per batch.
+
+    Nested GA4 columns (`event_params`, `user_properties`, ...) stay native
+    list<struct> Arrow types, and only one batch is held in memory at a time.
+    The file is written under a temporary name and renamed into place once
+    complete. Returns the number of rows written, or None if the stream was
+    empty and no file was written.
+    """
+    tmp = temp_path(path)
+    writer = None
+    row_count = 0
+    try:
+        for batch in batches:
+            batch = _with_source_table(batch, table_name)
+            if writer is None:
+                writer = pq.ParquetWriter(tmp, batch.schema)
+            writer.write_batch(batch)
+            row_count += batch.num_rows
+    except Exception:
+        if writer is not None:
+            writer.close()
+            os.remove(tmp)
+        raise
+
+    if writer is None:
+        return None
+    writer.close()
+    atomic_replace(tmp, path)
+    return row_count
+
+
+def _without_column(batch, name):
+    keep = [i for i, field in enumerate(batch.schema) if field.name != name]
+    return pa.RecordBatch.from_arrays(
+        [batch.column(i) for i in keep],
+        names=[batch.schema.field(i).name for i in keep],
+    )
+
+
+def write_batches_by_suffix(batches, data_dir, suffix_column="table_suffix"):
+    """Split a wildcard-query result stream into one parquet file per table suffix.
+
+    Each batch is partitioned on `suffix_column` and appended as a row group to
+    that table's file in the store; writers stay open until the stream is exhausted,
+    and files are only renamed into place once the whole stream has been read.
+    Returns a {table_name: row_count} dict.
+    """
+    writers = {}
+    temp_paths = {}
+    row_counts = {}
+    try:
+        for batch in batches:
+            suffixes = batch.column(suffix_column)
+            data = _without_column(batch, suffix_column)
+            for suffix in pc.unique(suffixes).to_pylist():
+                table_name = f"events_{suffix}"
+                part = _with_source_table(data.filter(pc.equal(suffixes, suffix)), table_name)
+                if table_name not in writers:
+                    path = os.path.join(data_dir, table_file(table_name))
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    temp_paths[table_name] = temp_path(path)
+                    writers[table_name] = pq.ParquetWriter(temp_paths[table_name], part.schema)
+                    row_counts[table_name] = 0
+                writers[table_name].write_batch(part)
+                row_counts[table_name] += part.num_rows
+    except Exception:
+        for table_name, writer in writers.items():
+            writer.close()
+            os.remove(temp_paths[table_name])
+        raise
+
+    for table_name, writer in writers.items():
+        writer.close()
+        atomic_replace(temp_paths[table_name], os.path.join(data_dir, table_file(table_name)))
+    return row_counts
+
+
+def _sql_literal(value):
+    escaped = str(value).replace("\\", "\\\\").replace("'", "\\'")
+    return f"'{escaped}'"
+
+
+def _padded_version(version, width=8):
+    """Zero-pad each part of a dotted version so string order matches `vers` order."""
+    return ".".join(part.zfill(width) for part in str(version).split("."))
+
+
+def _select_list(columns):
+    if not columns:
+        return "*"
+
+    select = []
+    for column, fields in columns.items():
+        if fields is None:
+            select.append(column)
+        else:
+            subfields = ", ".join(f"{column}.{field} AS {field}" for field in fields)
+            select.append(f"STRUCT({subfields}) AS {column}")
+    return ",\n  ".join(select)
+
+
+def build_events_query(
+    dataset,
+    table_name,
+    columns=None,
+    country=None,
+    not_user=None,
+    version_filter=None,
+    table_suffixes=None,
+):
+    """Build the extraction SQL for one GA4 events table.
+
+    `columns` maps top-level columns to the struct fields to keep (None keeps
+    the whole column); when omitted every column is selected. `country`,
+    `not_user` and `version_filter` mirror the pipeline filters in
+    main_functions and are pushed into the WHERE clause when set.
+
+    With `table_suffixes`, `table_name` is expected to be a wildcard such as
+    `events_*`; the query is restricted to those suffixes and returns each
+    row's suffix as `table_suffix`.
+    """
+    select = _select_list(columns)
+    conditions = []
+    if table_suffixes:
+        select += ",\n  _TABLE_SUFFIX AS table_suffix"
+        suffixes = ", ".join(_sql_literal(t) for t in table_suffixes)
+        conditions.append(f"_TABLE_SUFFIX IN ({suffixes})")
+    if country:
+        countries = ", ".join(_sql_literal(c) for c in country)
+        conditions.append(f"geo.country IN ({countries})")
+    if not_user:
+        users = ", ".join(_sql_literal(u) for u in not_user)
+        conditions.append(f"user_pseudo_id NOT IN ({users})")
+    if version_filter:
+        # Compare zero-padded version parts, matching main_functions.vers().
+        conditions.append(
+            "(SELECT STRING_AGG(LPAD(part, 8, '0'), '.' ORDER BY pos) "
+            "FROM UNNEST(SPLIT(app_info.version, '.')) AS part WITH OFFSET AS pos) "
+            f">= {_sql_literal(_padded_version(version_filter))}"
+        )
 
-    # --- Load downloaded tables log
-    if os.path.exists(log_path):
-        with open(log_path) as f:
-            downloaded = {line.strip() for line in f if line.strip()}
+    query = f"SELECT\n  {select}\nFROM `{dataset}.{table_name}`"
+    if conditions:
+        query += "\nWHERE " + "\n  AND ".join(conditions)
+    return query
+
+
+def events_query_for(context, table_name, table_suffixes=None):
+    """Extraction SQL for `table_name`, pruned and filtered if `extract_pruned` is on."""
+    if not context.get("extract_pruned"):
+        return build_events_query(context["dataset"], table_name, table_suffixes=table_suffixes)
+
+    return build_events_query(
+        context["dataset"],
+        table_name,
+        columns=extract_columns,
+        country=context.get("country"),
+        not_user=context.get("not_user"),
+        version_filter=context.get("version_filter"),
+        table_suffixes=table_suffixes,
+    )
+
+
+def extraction_fingerprint(context):
+    """Hash of what `events_query_for` keeps: the column set and pushed-down filters.
+
+    Files downloaded with a different fingerprint hold other columns or rows
+    and are downloaded again (see `select_tables_to_download`).
+    """
+    if not context.get("extract_pruned"):
+        values = {"extract_pruned": False}
     else:
-        downloaded = set()
+        values = {
+            "extract_pruned": True,
+            "columns": extract_columns,
+            "country": sorted(context.get("country") or []),
+            "not_user": sorted(context.get("not_user") or []),
+            "version_filter": context.get("version_filter") or None,
+        }
+    return hashlib.sha256(json.dumps(values, sort_keys=True).encode("utf-8")).hexdigest()
 
-    # --- Format start_date as YYYYMMDD string
-    start_date_str = start_date.strftime("%Y%m%d")
 
-    # --- Get all existing tables
+# Entries recorded before extractions were fingerprinted came from full-table queries.
+UNPRUNED_EXTRACTION = extraction_fingerprint({})
+
+
+def download_table(client, query, table_name, data_dir, page_rows=None, source=None):
+    """Run `query` for one daily events table into `data_dir` and return its manifest entry.
+
+    `source` is the table's `__TABLES__` listing (last_modified_time, row_count),
+    stored in the entry so later runs can tell whether the table changed.
+    """
+    logger.info(f"Processing {table_name}...")
+    source = source or {}
+
+    rows = client.query(query).result(page_size=page_rows)
+
+    # --- Save as parquet, batch by batch
+    path = os.path.join(data_dir, table_file(table_name))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if write_batches_to_parquet(rows.to_arrow_iterable(), path, table_name) is None:
+        return empty_entry(source.get("last_modified_time"), source.get("row_count"))
+    return describe_parquet(data_dir, table_file(table_name), source.get("last_modified_time"), source.get("row_count"))
+
+
+def _download_per_table(client, context, new_tables, data_dir, record):
+    """One query job per table, run concurrently on `download_workers` threads."""
+    # Each worker writes its own parquet file and the table is only recorded
+    # once that file has been fully written.
+    workers = max(1, int(context.get("download_workers", 1)))
+    page_rows = context.get("download_page_rows")
+    failures = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(
+                download_table,
+                client,
+                events_query_for(context, table_name),
+                table_name,
+                data_dir,
+                page_rows,
+                source,
+            ): table_name
+            for table_name, source in new_tables.items()
+        }
+        for future in as_completed(futures):
+            table_name = futures[future]
+            try:
+                entry = future.result()
+            except Exception as e:
+                logger.error(f"Failed to download {table_name}: {e}", exc_info=True)
+                failures.append(e)
+                continue
+
+            logger.info(f"Fetched {entry['rows']} rows from {table_name}")
+            record(table_name, entry)
+
+    if failures:
+        raise failures[0]
+
+
+def _download_wildcard(client, context, new_tables, data_dir, record):
+    """A single `events_*` job for all new tables, split back into daily files."""
+    if not new_tables:
+        return
+
+    suffixes = [t[len("events_"):] for t in new_tables]
+    query = events_query_for(context, "events_*", table_suffixes=suffixes)
+    logger.info(f"Processing {len(new_tables)} tables with one wildcard query...")
+
+    rows = client.query(query).result(page_size=context.get("download_page_rows"))
+    row_counts = write_batches_by_suffix(rows.to_arrow_iterable(), data_dir)
+
+    # Tables with no matching rows still count as downloaded.
+    for table_name, source in new_tables.items():
+        last_modified_time, source_rows = source.get("last_modified_time"), source.get("row_count")
+        if table_name in row_counts:
+            entry = describe_parquet(data_dir, table_file(table_name), last_modified_time, source_rows)
+        else:
+            entry = empty_entry(last_modified_time, source_rows)
+        logger.info(f"Fetched {entry['rows']} rows from {table_name}")
+        record(table_name, entry)
+
+
+def is_intraday(table_id):
+    return table_id.startswith("events_intraday_")
+
+
+def list_event_tables(client, dataset):
+    """Return {table_id: {"last_modified_time", "row_count"}} for the dataset's event tables."""
     query = f"""
-    SELECT table_id
+    SELECT table_id, last_modified_time, row_count
     FROM `{dataset}.__TABLES__`
     WHERE table_id LIKE 'events_%'
     """
-    tables = [row.table_id for row in client.query(query)]
+    return {
+        row.table_id: {"last_modified_time": row.last_modified_time, "row_count": row.row_count}
+        for row in client.query(query)
+    }
+
+
+def select_tables_to_download(tables, manifest, refresh_window_days=0, today=None, extraction=None):
+    """Pick tables that are missing from the manifest or changed since they were cached.
+
+    A cached table is re-downloaded when BigQuery reports a newer
+    `last_modified_time` or a different `row_count` than the manifest recorded,
+    or, with `extraction` given, when it was downloaded with another
+    `extraction_fingerprint` (other columns or pushed-down filters).
+    Entries without recorded source metadata (migrated from the legacy log) are
+    only refreshed when their date falls within the last `refresh_window_days`
+    days; older ones simply adopt the listing's metadata.
+    """
+    today = today or datetime.now(timezone.utc).date()
+    window_start = (today - timedelta(days=refresh_window_days)).strftime("%Y%m%d")
+
+    selected = {}
+    for t, source in sorted(tables.items()):
+        entry = manifest["tables"].get(t)
+        if entry is None:
+            selected[t] = source
+            continue
+
+        if extraction is not None and entry.get("extraction", UNPRUNED_EXTRACTION) != extraction:
+            logger.info(f"{t} was downloaded with other extraction columns or filters; re-downloading.")
+            selected[t] = source
+            continue
+
+        cached_modified = entry.get("last_modified_time")
+        if cached_modified is None:
+            if table_date(t) >= window_start:
+                selected[t] = source
+            else:
+                entry["last_modified_time"] = source.get("last_modified_time")
+                entry["source_rows"] = source.get("row_count")
+            continue
+
+        newer = (source.get("last_modified_time") or 0) > cached_modified
+        resized = entry.get("source_rows") is not None and source.get("row_count") != entry.get("source_rows")
+        if newer or resized:
+            logger.info(f"{t} changed in BigQuery since it was cached; re-downloading.")
+            selected[t] = source
+
+    return selected
+
+
+def sync_store(context):
+    """Bring the local parquet store up to date and return its manifest.
+
+    Lists the event tables in BigQuery, downloads those that are new or changed
+    since they were cached, and drops superseded intraday tables. With
+    `store_synced` set (run_pipeline already synced it), only loads the manifest.
+    """
+    manifest_path = context["manifest_path"]
+    data_dir = context["data_dir"]
+    if context.get("store_synced"):
+        return load_manifest(manifest_path, data_dir)
+
+    client = context["client"]
+    dataset = context["dataset"]
+    start_date = context["start_date"]  # datetime.date object
+
+    # --- Load the download manifest (migrating the legacy log.txt on first run)
+    remove_stale_temp_files(data_dir)
+    manifest = load_manifest(manifest_path, data_dir, legacy_log_path=context.get("log_path"))
+    if migrate_flat_layout(manifest, data_dir):
+        save_manifest(manifest_path, manifest)
+    # --- Only trust entries whose file is still the one recorded
+    if verify_entries(manifest, data_dir):
+        save_manifest(manifest_path, manifest)
 
-    # --- Filter tables by start_date
-    tables = [t for t in tables if t.split("_")[1] >= start_date_str]
+    extraction = extraction_fingerprint(context)
 
-    # --- Determine which tables are new
-    new_tables = [t for t in tables if t not in downloaded]
+    def record(table_name, entry):
+        entry["extraction"] = extraction
+        manifest["tables"][table_name] = entry
+        save_manifest(manifest_path, manifest)
+
+    # --- Format start_date as YYYYMMDD string
+    start_date_str = start_date.strftime("%Y%m%d")
+
+    # --- Get all existing tables with their modification metadata
+    tables = {
+        t: source
+        for t, source in list_event_tables(client, dataset).items()
+        if table_date(t) >= start_date_str
+        and (context.get("include_intraday") or not is_intraday(t))
+    }
+
+    # --- Intraday tables are superseded once the daily export for that date lands
+    daily_dates = {table_date(t) for t in tables if not is_intraday(t)}
+    tables = {t: s for t, s in tables.items() if not (is_intraday(t) and table_date(t) in daily_dates)}
+    for t in list(manifest["tables"]):
+        if is_intraday(t) and t not in tables:
+            logger.info(f"Dropping {t}; superseded by the daily table or no longer available.")
+            forget_table(manifest, data_dir, t)
+            save_manifest(manifest_path, manifest)
+
+    # --- Determine which tables are new or changed since they were cached
+    new_tables = select_tables_to_download(
+        tables,
+        manifest,
+        refresh_window_days=context.get("refresh_window_days", 0),
+        extraction=extraction,
+    )
+    save_manifest(manifest_path, manifest)
 
     if not new_tables:
         logger.info("No new tables to process.")
 
-    for table_name in new_tables:
-        logger.info(f"Processing {table_name}...")
+    if context.get("download_mode") == "wildcard":
+        _download_wildcard(client, context, new_tables, data_dir, record)
+    else:
+        _download_per_table(client, context, new_tables, data_dir, record)
 
-        df = client.query(f"SELECT * FROM `{dataset}.{table_name}`").to_dataframe()
+    if record_schemas(manifest, data_dir):
+        save_manifest(manifest_path, manifest)
+    return manifest
 
-        # --- Example transformation (replace with yours)
-        df["source_table"] = table_name
 
-        # --- Save as parquet
-        path = os.path.join(data_dir, f"{table_name}.parquet")
-        table = pa.Table.from_pandas(df)
-        pq.write_table(table, path)
-        logger.info(f"Fetched {df.shape[0]} rows from {table_name}")
+def pull_from_bq(df, context):
+    manifest_path = context["manifest_path"]
+    data_dir = context["data_dir"]
 
-        # --- Update log
-        with open(log_path, "a") as f:
-            f.write(table_name + "\n")
+    manifest = sync_store(context)
 
-    # --- Combine all Parquets for report
+    # --- Scan the store for the report, with the pipeline filters pushed down
     logger.info(f"Merging data...")
 
-    if not os.path.exists(data_dir):
-        logger.warning(f"Data directory {data_dir} does not exist.")
-        all_data = pd.DataFrame()
-    else:
-        parquet_files = [
-            os.path.join(data_dir, f)
-            for f in os.listdir(data_dir)
-            if f.endswith(".parquet")
-        ]
-        
-        if not parquet_files:
-            logger.warning(f"No parquet files found in {data_dir}.")
-            all_data = pd.DataFrame()
-        else:
-            dfs = [pd.read_parquet(f) for f in parquet_files]
-            all_data = pd.concat(dfs, ignore_index=True)
-
-    all_data = normalize_bq_types(all_data)
+    parquet_files = manifest_files(manifest, data_dir)
+    if not parquet_files:
+        logger.warning(f"No downloaded tables recorded in {manifest_path}.")
+    schemas = manifest_schemas(manifest, data_dir)
+    events = normalize_bq_types(scan_events(data_dir, parquet_files, context, schemas))
+    all_data = events_to_pandas(events)
 
     sample = all_data["event_params"].iloc[0] if not all_data.empty else None
     if sample is not None and not isinstance(sample, (list, dict)):
@@ -93,16 +468,124 @@ def pull_from_bq(df, context):
 
 
 
-def normalize_bq_types(df):
-    for col in ["event_params", "user_properties", "items", "item_params"]:
-        if col not in df.columns:
+# --- Canonical Arrow types for the repeated key/value columns
+_PARAM_VALUE_FIELDS = [
+    ("string_value", pa.string()),
+    ("int_value", pa.int64()),
+    ("float_value", pa.float64()),
+    ("double_value", pa.float64()),
+]
+
+PARAM_COLUMN_TYPES = {
+    "event_params": pa.list_(pa.struct([
+        ("key", pa.string()),
+        ("value", pa.struct(_PARAM_VALUE_FIELDS)),
+    ])),
+    "user_properties": pa.list_(pa.struct([
+        ("key", pa.string()),
+        ("value", pa.struct(_PARAM_VALUE_FIELDS + [("set_timestamp_micros", pa.int64())])),
+    ])),
+    "item_params": pa.list_(pa.struct([
+        ("key", pa.string()),
+        ("value", pa.struct(_PARAM_VALUE_FIELDS)),
+    ])),
+}
+
+NESTED_LIST_COLUMNS = ["event_params", "user_properties", "items", "item_params"]
+
+
+def _conform(array, target):
+    """Cast `array` to `target`, matching struct fields by name and null-filling missing ones."""
+    if pa.types.is_null(array.type):
+        return pa.nulls(len(array), target)
+    if pa.types.is_list(target):
+        values = _conform(array.values, target.value_type)
+        return pa.ListArray.from_arrays(array.offsets, values, type=target, mask=array.is_null())
+    if pa.types.is_struct(target):
+        present = {array.type.field(i).name for i in range(array.type.num_fields)}
+        children = [
+            _conform(array.field(f.name), f.type) if f.name in present else pa.nulls(len(array), f.type)
+            for f in target
+        ]
+        return pa.StructArray.from_arrays(children, fields=list(target), mask=array.is_null())
+    return array.cast(target)
+
+
+def _read_json_values(text):
+    """Parse non-null JSON strings with the Arrow JSON reader, as one document."""
+    wrapped = pc.binary_join_element_wise('{"v":', text, "}", "")
+    document = pc.binary_join(pa.ListArray.from_arrays([0, len(wrapped)], wrapped), "\n")
+    parsed = pj.read_json(
+        pa.BufferReader(document[0].as_buffer()),
+        parse_options=pj.ParseOptions(newlines_in_values=True),
+    ).column("v").combine_chunks()
+    if len(parsed) != len(text):
+        raise pa.ArrowInvalid("row count changed while parsing")
+    return parsed
+
+
+def _is_json(value):
+    try:
+        json.loads(value)
+        return True
+    except json.JSONDecodeError:
+        return False
+
+
+def _parse_json_column(strings, target=None):
+    """Parse a column of JSON strings in one vectorized pass.
+
+    Every value is wrapped as `{"v": <json>}` and the whole column is handed to
+    the Arrow JSON reader as newline-delimited JSON. If the reader rejects the
+    column, the malformed values are located, nulled out and the pass is rerun.
+    """
+    strings = strings.cast(pa.string())
+    blank = pc.equal(pc.utf8_trim_whitespace(strings), "")
+    text = pc.if_else(blank, None, strings).fill_null("null")
+    try:
+        parsed = _read_json_values(text)
+    except pa.ArrowInvalid:
+        valid = pa.array([_is_json(value) for value in text.to_pylist()])
+        logger.warning(f"Dropping {pc.sum(pc.invert(valid)).as_py()} malformed JSON values.")
+        parsed = _read_json_values(pc.if_else(valid, text, "null"))
+    return parsed if target is None else _conform(parsed, target)
+
+
+def normalize_bq_types(table):
+    """Bring the repeated GA4 columns to one Arrow representation.
+
+    JSON strings (from older caches) are parsed, and key/value columns are cast
+    to the canonical `list<struct<key, value<...>>>` type in
+    `PARAM_COLUMN_TYPES`, so every file and every row carries the same value
+    fields regardless of which ones were all-null on a given day.
+    """
+    for col in NESTED_LIST_COLUMNS:
+        if col not in table.column_names:
             continue
-        def fix(x):
-            if isinstance(x, str):
-                try: return json.loads(x)
-                except: return None
-            if isinstance(x, np.ndarray):
-                return x.tolist()
-            return x
-        df[col] = df[col].apply(fix)
-    return df
\ No newline at end of file
+        index = table.column_names.index(col)
+        array = table.column(col).combine_chunks()
+        target = PARAM_COLUMN_TYPES.get(col)
+
+        if pa.types.is_string(array.type) or pa.types.is_large_string(array.type):
+            array = _parse_json_column(array, target)
+        elif target is not None:
+            array = _conform(array, target)
+
+        table = table.set_column(index, col, array)
+    return table
+
+
+def events_to_pandas(table):
+    """Convert scanned events to pandas, keeping the nested columns as Arrow types.
+
+    List and struct columns (`event_params`, `device`, `geo`, ...) become
+    `pd.ArrowDtype` columns instead of object columns of numpy arrays and
+    dicts; a cell reads back as a plain list or dict, and the columnar
+    flattener can use the Arrow data without converting it again.
+    """
+    nested = {
+        field.type
+        for field in table.schema
+        if pa.types.is_list(field.type) or pa.types.is_struct(field.type)
+    }
+    return table.to_pandas(types_mapper=lambda t: pd.ArrowDtype(t) if t in nested else None)
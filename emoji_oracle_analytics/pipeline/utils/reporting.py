@@ -8,6 +8,7 @@ import numpy as np
 
 
 from emoji_oracle_analytics.pipeline.utils.lists_and_maps import conversion_events
+from emoji_oracle_analytics.pipeline.utils.profiling import PROFILE_COLUMNS, profile_frame, run_profiled
 
 logger = get_logger(__name__)
 
@@ -82,43 +83,53 @@ def generate_report(df, dfs_dict, kpis, context):
     df_conversion_stages = list(conversion_events.values())
 
     # --- Visualizations ---
-    questions_heatmap = create_wrong_answers_heatmap(df_by_questions)
-    ads_per_question_heatmap = create_ads_per_question_heatmap(df_by_questions)
-    users_per_day_chart = create_users_per_day_chart(df_by_date)
-    session_duration_histogram = create_session_duration_histogram(df_by_sessions)
-    item_histograms = [create_item_per_question_heatmap(item, df_by_questions) for item in item_list]
-    ads_per_day_chart = create_ads_per_day_chart(df_by_date)
-    sessions_per_day_chart = create_sessions_per_day_chart(df_by_date)
-    session_last_event_chart = create_session_last_event_chart(df_by_sessions)
-    user_behaviour_per_day_chart = create_user_behaviour_per_day_chart(df)
-    total_playtime_histogram = create_total_playtime_histogram(df_by_users)
-    user_last_event_chart = create_user_last_event_chart(df_by_users)
-    question_progress_histogram = create_question_progress_histogram(df_by_users)
-    character_progress_histogram = create_character_progress_histogram(df_by_users)
-    session_counts_histogram = create_session_counts_histogram(df_by_users)
+    def plot(func, *args, **kwargs):
+        return run_profiled(context, "plot", func.__name__, func, *args, **kwargs)
+
+    questions_heatmap = plot(create_wrong_answers_heatmap, df_by_questions)
+    ads_per_question_heatmap = plot(create_ads_per_question_heatmap, df_by_questions)
+    users_per_day_chart = plot(create_users_per_day_chart, df_by_date)
+    session_duration_histogram = plot(create_session_duration_histogram, df_by_sessions)
+    item_histograms = [plot(create_item_per_question_heatmap, item, df_by_questions) for item in item_list]
+    ads_per_day_chart = plot(create_ads_per_day_chart, df_by_date)
+    sessions_per_day_chart = plot(create_sessions_per_day_chart, df_by_date)
+    session_last_event_chart = plot(create_session_last_event_chart, df_by_sessions)
+    user_behaviour_per_day_chart = plot(create_user_behaviour_per_day_chart, df)
+    total_playtime_histogram = plot(create_total_playtime_histogram, df_by_users)
+    user_last_event_chart = plot(create_user_last_event_chart, df_by_users)
+    question_progress_histogram = plot(create_question_progress_histogram, df_by_users)
+    character_progress_histogram = plot(create_character_progress_histogram, df_by_users)
+    session_counts_histogram = plot(create_session_counts_histogram, df_by_users)
 
 
     # Funnel
 
-    funnel_user_lifetime = create_funnel_chart('User Lifecycle (WIP)', df_by_users, funnel_stages)
+    funnel_user_lifetime = plot(create_funnel_chart, 'User Lifecycle (WIP)', df_by_users, funnel_stages)
     
 
     # Inferential
 
-    inferential_user_last_event_chart = create_inferential_user_last_event_chart(df_by_users)
-    inferential_session_last_event_chart = create_inferential_session_last_event_chart(df_by_sessions)
-    inferential_user_behaviour_per_day_chart = create_inferential_user_behaviour_per_day_chart(df)
-    funnel_bar_with_ci = create_funnel_bar_with_ci('First Few Seconds (with CI)',df_conversion, df_conversion_stages, 'user_pseudo_id', version='1.0.6')
+    inferential_user_last_event_chart = plot(create_inferential_user_last_event_chart, df_by_users)
+    inferential_session_last_event_chart = plot(create_inferential_session_last_event_chart, df_by_sessions)
+    inferential_user_behaviour_per_day_chart = plot(create_inferential_user_behaviour_per_day_chart, df)
+    funnel_bar_with_ci = plot(create_funnel_bar_with_ci, 'First Few Seconds (with CI)',df_conversion, df_conversion_stages, 'user_pseudo_id', version='1.0.6')
 
     # Conversion
     
-    cum_install_uninstall_chart = create_cum_install_uninstall_chart(df)
-    uninstall_last_event_chart = create_uninstall_last_event_chart(df_by_users)
-    daily_install_uninstall_delta_chart = create_daily_install_uninstall_delta_chart(df)
-    funnel_new_user_events = create_funnel_chart(f'First Few Seconds (ver. >= 1.0.6)', df_conversion, df_conversion_stages, 'user_pseudo_id', version='1.0.6')
+    cum_install_uninstall_chart = plot(create_cum_install_uninstall_chart, df)
+    uninstall_last_event_chart = plot(create_uninstall_last_event_chart, df_by_users)
+    daily_install_uninstall_delta_chart = plot(create_daily_install_uninstall_delta_chart, df)
+    funnel_new_user_events = plot(create_funnel_chart, f'First Few Seconds (ver. >= 1.0.6)', df_conversion, df_conversion_stages, 'user_pseudo_id', version='1.0.6')
     
     user_summary_df = create_user_summary_df(df_by_users)
 
+    # Stages, splits and plots so far, slowest first
+    profile_records = context.get("profile_records")
+    profile_summary = (
+        profile_frame(profile_records).sort_values("wall_s", ascending=False).to_dict(orient="records")
+        if profile_records else []
+    )
+
     # --- Jinja2 setup ---
     from jinja2 import Environment, FileSystemLoader
     env = Environment(loader=FileSystemLoader('templates'))
@@ -220,6 +231,8 @@ def generate_report(df, dfs_dict, kpis, context):
                                        .to_dict(orient="records")
                 ),
                 technical_cols=list(df_technical_events.columns),
+                profile=profile_summary,
+                profile_cols=PROFILE_COLUMNS,
                 kpis=kpis
             )
         ),
@@ -0,0 +1,243 @@
+"""Vectorized sessionization over frames sorted by session.
+
+Per-session values are computed in one pass over sorted arrays instead of a
+Python function per session group:
+
+- `sort_by_session` sorts the frame once by the session columns (see
+  `user_keys.session_keys`) and `event_datetime`. Rows with a missing session
+  column sort after the present ones, as with `sort_values`.
+- `session_runs` returns the offsets where each run of equal session keys
+  starts in that order, and whether the run is a session (runs of rows with a
+  missing key are not, just as groupbys drop them).
+- Per-session reductions then use `np.minimum.reduceat` / `np.maximum.reduceat`
+  over the run offsets and are broadcast back to rows by run number.
+
+The pipeline sorts once, in the `sort_events` stage, into `SESSION_ORDER`:
+(`session_key`, `event_datetime`), which is (`user_code`, session,
+`event_datetime`) order since the key packs the user code in its high bits.
+The stage runner records the order in `context["row_order"]` (see
+stage_graph); `is_session_sorted` lets later stages and the splits skip
+sorting again and work on contiguous sessions with `session_runs` instead of
+grouping.
+
+Events without a `ga_session_id` (GA4 leaves it out of some events) would
+otherwise be dropped from every session groupby. `infer_sessions` gives them
+an `inferred_session_id`: each user's unsessioned events are sorted by time
+and a new session starts after a gap longer than `session_gap_minutes` (30, as
+GA's own session timeout). The id is the session's first event time in Unix
+seconds, as GA session ids are; events with a GA session id keep it.
+"""
+
+from __future__ import annotations
+
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from emoji_oracle_analytics.config.logging import get_logger
+from emoji_oracle_analytics.pipeline.utils.user_keys import (
+    INFERRED_SESSION_COLUMN,
+    SESSION_COLUMN,
+    SESSION_KEY,
+    USER_CODE,
+    USER_COLUMN,
+    pack_session_key,
+    session_keys,
+    user_key,
+)
+
+logger = get_logger(__name__)
+
+# Firebase logs these events at the end of the last session, so they do not
+# extend a session's duration.
+SESSION_END_EXCLUDED_EVENTS = ['app_remove', 'app_update', 'app_clear_data']
+
+DEFAULT_SESSION_GAP_MINUTES = 30
+
+# `row_order` of frames sorted by `sort_by_session`.
+SESSION_ORDER = "session"
+
+_NAT = np.iinfo(np.int64).min
+_LATEST = np.iinfo(np.int64).max
+
+
+def sort_by_session(df: pd.DataFrame) -> pd.DataFrame:
+    """The frame sorted by session and event time (a stable sort)."""
+    return df.sort_values(by=session_keys(df) + ['event_datetime'], kind='stable')
+
+
+def sort_events(df: pd.DataFrame, context=None) -> pd.DataFrame:
+    """Stage putting the rows in `SESSION_ORDER`."""
+    df = sort_by_session(df)
+    logger.info(f"Sorted {len(df)} events by {session_keys(df) + ['event_datetime']}.")
+    return df
+
+
+def is_session_sorted(context: Optional[dict]) -> bool:
+    """Whether the frame of this context is in `SESSION_ORDER`."""
+    return (context or {}).get("row_order") == SESSION_ORDER
+
+
+def session_runs(df: pd.DataFrame) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Runs of equal session keys in a frame sorted by `sort_by_session`.
+
+    Returns the start offset of each run, the run number of each row and
+    whether each run is a session (all its session columns present).
+    """
+    n = len(df)
+    change = np.zeros(n, dtype=bool)
+    present = np.ones(n, dtype=bool)
+    for col in session_keys(df):
+        codes = pd.factorize(df[col], use_na_sentinel=True)[0]
+        change[1:] |= codes[1:] != codes[:-1]
+        present &= codes != -1
+    if n:
+        change[0] = True
+    starts = np.flatnonzero(change)
+    return starts, np.cumsum(change) - 1, present[starts]
+
+
+def ffill_within_sessions(df: pd.DataFrame, columns: list[str]) -> pd.DataFrame:
+    """Forward-fill `columns` within each session of a frame in `SESSION_ORDER`.
+
+    Like `groupby(session_keys).ffill()`: values do not carry over from one
+    session to the next, and rows outside a session come back missing.
+    """
+    starts, run, is_session = session_runs(df)
+    positions = np.arange(len(df))
+    run_start = starts[run]
+    in_session = is_session[run]
+    for col in columns:
+        present = df[col].notna().to_numpy()
+        last = np.maximum.accumulate(np.where(present, positions, -1)) if len(df) else positions
+        source = np.where(in_session & (last >= run_start), last, -1)
+        df[col] = pd.Series(df[col].array.take(source, allow_fill=True), index=df.index)
+    return df
+
+
+def shift_within_sessions(df: pd.DataFrame, column: str) -> pd.Series:
+    """`column` of each session's previous row in a frame in `SESSION_ORDER`.
+
+    Like `groupby(session_keys)[column].shift(1)`: missing for the first row
+    of each session and for rows outside a session. `df` is not modified.
+    """
+    starts, run, is_session = session_runs(df)
+    source = np.arange(len(df)) - 1
+    first = np.zeros(len(df), dtype=bool)
+    first[starts] = True
+    source[first | ~is_session[run]] = -1
+    return pd.Series(df[column].array.take(source, allow_fill=True), index=df.index, name=column)
+
+
+def _datetime_values(values: pd.Series) -> tuple[np.ndarray, str]:
+    """int64 values (NaT as int64 min) and unit of a datetime column."""
+    index = pd.DatetimeIndex(values)
+    return index.asi8, index.unit
+
+
+def _to_datetimes(values: np.ndarray, like: pd.Series) -> pd.Series:
+    """Datetimes with the unit and time zone of `like` from int64 values."""
+    index = pd.DatetimeIndex(like)
+    out = pd.DatetimeIndex(values.view(f'M8[{index.unit}]'))
+    if index.tz is not None:
+        out = out.tz_localize('UTC').tz_convert(index.tz)
+    return pd.Series(out, index=like.index)
+
+
+def _seconds(end: np.ndarray, start: np.ndarray, valid: np.ndarray, per_second: float, missing: float):
+    """`end - start` in seconds where `valid`, else `missing`."""
+    delta = np.where(valid, end, 0) - np.where(valid, start, 0)
+    return np.where(valid, delta / per_second, missing).round(3)
+
+
+def add_session_times(df: pd.DataFrame) -> pd.DataFrame:
+    """Add session durations and start/end times and event durations.
+
+    `df` must be sorted by `sort_by_session`. Adds:
+
+    - `session_duration_seconds` / `_minutes` / `_hours`: from the first
+      `session_start` to the last event that is not in
+      `SESSION_END_EXCLUDED_EVENTS`; missing for sessions without a
+      `session_start`
+    - `session_start_time` / `session_end_time`: first and last event
+    - `event_duration_seconds`: time to the session's next event (0 for the
+      last event and for rows outside a session)
+    """
+    starts, run, is_session = session_runs(df)
+    times, unit = _datetime_values(df['event_datetime'])
+    per_second = np.timedelta64(1, 's') / np.timedelta64(1, unit)
+    has_time = times != _NAT
+    row_in_session = is_session[run]
+
+    def per_session(values, reduce, empty):
+        reduced = reduce.reduceat(values, starts) if len(values) else values
+        return np.where(is_session & (reduced != empty), reduced, _NAT)
+
+    first = per_session(np.where(has_time, times, _LATEST), np.minimum, _LATEST)
+    last = per_session(times, np.maximum, _NAT)
+
+    is_start = (df['event_name'] == 'session_start').to_numpy() & has_time
+    counted = ~df['event_name'].isin(SESSION_END_EXCLUDED_EVENTS).to_numpy()
+    first_start = per_session(np.where(is_start, times, _LATEST), np.minimum, _LATEST)
+    last_counted = per_session(np.where(counted, times, _NAT), np.maximum, _NAT)
+
+    timed = (first_start != _NAT) & (last_counted != _NAT)
+    duration = _seconds(last_counted, first_start, timed, per_second, np.nan)
+    df['session_duration_seconds'] = duration[run]
+    df['session_duration_minutes'] = (df['session_duration_seconds'] / 60).round(2)
+    df['session_duration_hours'] = (df['session_duration_seconds'] / 3600).round(3)
+    df['session_start_time'] = _to_datetimes(first[run], df['event_datetime'])
+    df['session_end_time'] = _to_datetimes(last[run], df['event_datetime'])
+
+    # Time to the next event of the same session
+    next_in_session = np.zeros(len(df), dtype=bool)
+    next_in_session[:-1] = (run[1:] == run[:-1]) & row_in_session[:-1]
+    next_times = np.empty_like(times)
+    next_times[:-1] = times[1:]
+    next_times[-1:] = _NAT
+    timed = next_in_session & has_time & (next_times != _NAT)
+    df['event_duration_seconds'] = _seconds(next_times, times, timed, per_second, 0.0)
+    return df
+
+
+def infer_sessions(df: pd.DataFrame, context=None) -> pd.DataFrame:
+    """Add `inferred_session_id`, splitting unsessioned events by inactivity gaps.
+
+    `session_key` is repacked from the inferred ids when present.
+    """
+    context = context or {}
+    gap_minutes = context.get("session_gap_minutes", DEFAULT_SESSION_GAP_MINUTES)
+
+    if SESSION_COLUMN in df.columns:
+        session_ids = pd.to_numeric(df[SESSION_COLUMN], errors="coerce").astype("Int64")
+    else:
+        session_ids = pd.Series(pd.NA, index=df.index, dtype="Int64")
+    times, unit = _datetime_values(df['event_datetime'])
+    per_second = int(np.timedelta64(1, 's') / np.timedelta64(1, unit))
+    if user_key(df) == USER_CODE:
+        users = df[USER_CODE].to_numpy(dtype=np.int64)
+        has_user = users >= 0
+    else:
+        users = pd.factorize(df[USER_COLUMN], use_na_sentinel=True)[0]
+        has_user = users != -1
+
+    rows = np.flatnonzero(session_ids.isna().to_numpy() & has_user & (times != _NAT))
+    order = rows[np.lexsort((times[rows], users[rows]))]
+    user, time = users[order], times[order]
+
+    # A session breaks at each new user and after each gap longer than the limit
+    breaks = np.ones(len(order), dtype=bool)
+    breaks[1:] = (user[1:] != user[:-1]) | (np.diff(time) > gap_minutes * 60 * per_second)
+    session = np.cumsum(breaks) - 1
+    starts = time[breaks] // per_second
+
+    inferred = session_ids.copy()
+    inferred.iloc[order] = starts[session]
+    df[INFERRED_SESSION_COLUMN] = inferred
+    if SESSION_KEY in df.columns:
+        df[SESSION_KEY] = pack_session_key(df[USER_CODE], inferred)
+
+    logger.info(f"Inferred {breaks.sum()} sessions for {len(order)} events without a GA session id "
+                f"({gap_minutes} minute gap).")
+    return df
@@ -1,20 +1,81 @@
+import numpy as np
 import pandas as pd
 
+from emoji_oracle_analytics.pipeline.utils.sessions import is_session_sorted, session_runs, shift_within_sessions
 from emoji_oracle_analytics.pipeline.utils.utils import summarize_gold  # summarize_energy
+from emoji_oracle_analytics.pipeline.utils.versions import version_dtype
 from emoji_oracle_analytics.config.logging import get_logger
+from emoji_oracle_analytics.pipeline.utils.user_keys import (
+    MISSING_USER,
+    SESSION_COLUMN,
+    SESSION_KEY,
+    USER_CODE,
+    USER_COLUMN,
+    session_id_column,
+    session_keys,
+    user_key,
+)
 
 
 
 
 logger = get_logger(__name__)
 
-def create_df_by_sessions(df: pd.DataFrame) -> pd.DataFrame:
+
+def _last_session_events(df: pd.DataFrame, skip_events: list[str]) -> pd.DataFrame:
+    """Latest event of each session not in `skip_events` (else its latest event).
+
+    `df` must be in session order (see sessions.is_session_sorted).
+    """
+    starts, _, is_session = session_runs(df)
+    ends = np.append(starts[1:], len(df)) - 1
+    positions = np.where(~df['event_name'].isin(skip_events).to_numpy(), np.arange(len(df)), -1)
+    last_kept = np.maximum.reduceat(positions, starts) if len(df) else positions
+    picked = np.where(last_kept >= starts, last_kept, ends)[is_session]
+
+    last_events = df[session_keys(df)].iloc[starts[is_session]].reset_index(drop=True)
+    last_events['last_event_name'] = df['event_name'].astype(object).to_numpy()[picked]
+    last_events['last_event_time'] = df['event_datetime'].iloc[picked].to_numpy()
+    return last_events
+
+
+def _pick_last_events(df: pd.DataFrame, session_groups: list[str], skip_events: list[str]) -> pd.DataFrame:
+    """Latest event of each session not in `skip_events` (else its latest event), for rows in any order."""
+    df_l_sorted = df.sort_values(['event_datetime'], ascending=False)
+
+    def pick_last_valid(g):
+        non_skip = g[~g['event_name'].isin(skip_events)]
+        row = non_skip.iloc[0] if len(non_skip) > 0 else g.iloc[0]
+
+        group_keys = g.name
+        if not isinstance(group_keys, tuple):
+            group_keys = (group_keys,)
+        group_map = dict(zip(session_groups, group_keys))
+        return pd.DataFrame({
+            **{col: [group_map[col]] for col in session_groups},
+            'last_event_name': [row['event_name']],
+            'last_event_time': [row['event_datetime']],
+        })
+
+    grouped_last = df_l_sorted.groupby(session_groups, group_keys=False)
+    try:
+        return grouped_last.apply(pick_last_valid, include_groups=False).reset_index(drop=True)
+    except TypeError:
+        return grouped_last.apply(pick_last_valid).reset_index(drop=True)
+
+
+def create_df_by_sessions(df: pd.DataFrame, context=None) -> pd.DataFrame:
     try:
-        session_groups = ['event_params__ga_session_id', 'user_pseudo_id']
+        # Sessions are identified by the inferred session id when infer_sessions ran
+        session_id = session_id_column(df)
+        id_columns = list(dict.fromkeys([SESSION_COLUMN, USER_COLUMN, session_id]))
+        # Group on the packed integer key when add_user_keys ran; the ids are kept for output
+        keyed = SESSION_KEY in df.columns
+        session_groups = [SESSION_KEY] if keyed else [session_id, USER_COLUMN]
 
         # --- Ensure required columns exist ---
         required_cols = ['session_duration_seconds', 'event_name', 'event_datetime']
-        if not all(col in df.columns for col in required_cols + session_groups):
+        if not all(col in df.columns for col in required_cols + id_columns + session_groups):
             logger.warning("Missing required columns for df_by_sessions.")
             return pd.DataFrame()
 
@@ -22,7 +83,14 @@ def create_df_by_sessions(df: pd.DataFrame) -> pd.DataFrame:
         df = df[df['session_duration_seconds'] > 15]
 
         # --- Base sessions ---
-        base_sessions = df[session_groups].drop_duplicates().reset_index(drop=True)
+        if keyed:
+            base_sessions = (
+                df[id_columns + [SESSION_KEY, USER_CODE]]
+                  .drop_duplicates(subset=[USER_CODE, session_id])
+                  .reset_index(drop=True)
+            )
+        else:
+            base_sessions = df[id_columns].drop_duplicates(subset=session_groups).reset_index(drop=True)
 
         # --- Session duration ---
         session_duration = (
@@ -44,6 +112,11 @@ def create_df_by_sessions(df: pd.DataFrame) -> pd.DataFrame:
 
         # --- Question Started metrics ---
         q_started = df.loc[df['event_name'] == 'Question Started']
+        # Aggregating a categorical column into lists fails (pandas casts the
+        # lists back to the categories), so collect plain values.
+        q_started = q_started.assign(
+            event_params__character_name=q_started['event_params__character_name'].astype(object)
+        )
         qs_metrics = (
             q_started.groupby(session_groups, as_index=False)
             .agg(
@@ -121,28 +194,11 @@ def create_df_by_sessions(df: pd.DataFrame) -> pd.DataFrame:
             'User Engagement', 'Screen Viewed', 'Earned Virtual Currency', 'Firebase Campaign',
             'App Removed', 'App Data Cleared', 'App Updated', 'Starting Currencies'
         ]
-        df_l_sorted = df.sort_values(['event_datetime'], ascending=False)
-
-        def pick_last_valid(g):
-            non_skip = g[~g['event_name'].isin(skip_events)]
-            row = non_skip.iloc[0] if len(non_skip) > 0 else g.iloc[0]
-
-            group_keys = g.name
-            if not isinstance(group_keys, tuple):
-                group_keys = (group_keys,)
-            group_map = dict(zip(session_groups, group_keys))
-            return pd.DataFrame({
-                'event_params__ga_session_id': [group_map.get('event_params__ga_session_id')],
-                'user_pseudo_id': [group_map.get('user_pseudo_id')],
-                'last_event_name': [row['event_name']],
-                'last_event_time': [row['event_datetime']],
-            })
-
-        grouped_last = df_l_sorted.groupby(session_groups, group_keys=False)
-        try:
-            session_last_event = grouped_last.apply(pick_last_valid, include_groups=False).reset_index(drop=True)
-        except TypeError:
-            session_last_event = grouped_last.apply(pick_last_valid).reset_index(drop=True)
+        if is_session_sorted(context):
+            # Sessions are contiguous and in time order: no sort or per-session apply
+            session_last_event = _last_session_events(df, skip_events)
+        else:
+            session_last_event = _pick_last_events(df, session_groups, skip_events)
 
         # --- Merge everything ---
         result = (
@@ -183,6 +239,13 @@ def create_df_by_sessions(df: pd.DataFrame) -> pd.DataFrame:
         else:
             result['bought_new_customer'] = 0
 
+        if keyed:
+            result = (
+                result.drop(columns=[SESSION_KEY, USER_CODE])
+                      .sort_values(by=[USER_COLUMN, session_id])
+                      .reset_index(drop=True)
+            )
+
         logger.info(
             f"Session-level dataframe created with {result.shape[0]} records "
             f"and {result.shape[1]} columns."
@@ -197,8 +260,6 @@ def create_df_by_sessions(df: pd.DataFrame) -> pd.DataFrame:
 
 def create_df_by_users(df: pd.DataFrame) -> tuple[pd.DataFrame, pd.DataFrame]:
     try:
-        user_key = "user_pseudo_id"
-
         # --- Ensure required columns ---
         required = [
             "event_name", "event_date", "session_duration_seconds",
@@ -211,12 +272,18 @@ def create_df_by_users(df: pd.DataFrame) -> tuple[pd.DataFrame, pd.DataFrame]:
         # Unified session duration
         df["session_duration_minutes"] = df["session_duration_seconds"] / 60
 
+        # Group on the integer user code when add_user_keys ran
+        user_col = user_key(df)
+        session_id = session_id_column(df)
+        if user_col == USER_CODE and (df[USER_CODE] == MISSING_USER).any():
+            df = df[df[USER_CODE] != MISSING_USER]
+
         # --- Base per-user fields (unique-based metrics) ---
         user_df = (
-            df.groupby(user_key, as_index=False)
+            df.groupby(user_col, as_index=False)
               .agg(
                   first_event_date=("event_date", "min"),
-                  total_sessions=("event_params__ga_session_id", "nunique"),
+                  total_sessions=(session_id, "nunique"),
                   total_characters_opened=("event_params__character_name", "nunique"),
                   country=("geo__country", "first") if "geo__country" in df.columns else ("event_name", "first"),
                   install_source=("app_info__install_source", "first") if "app_info__install_source" in df.columns else ("event_name", "first"),
@@ -231,34 +298,40 @@ def create_df_by_users(df: pd.DataFrame) -> tuple[pd.DataFrame, pd.DataFrame]:
 
         # --- Correct total playtime (one entry per session) ---
         df_sessions = (
-            df[["user_pseudo_id", "event_params__ga_session_id", "session_duration_minutes"]]
-            .drop_duplicates(subset=["user_pseudo_id", "event_params__ga_session_id"])
+            df[[user_col, session_id, "session_duration_minutes"]]
+            .drop_duplicates(subset=[user_col, session_id])
         )
 
         user_playtime = (
-            df_sessions.groupby(user_key, as_index=False)
+            df_sessions.groupby(user_col, as_index=False)
                        .agg(total_playtime_minutes=("session_duration_minutes", "sum"))
         )
 
-        user_df = user_df.merge(user_playtime, on=user_key, how="left")
+        user_df = user_df.merge(user_playtime, on=user_col, how="left")
+
+        # Ordered by version rather than as strings, so both columns compare with >=
+        if "app_info__version" in df.columns:
+            versions = version_dtype(pd.concat([user_df["start_version"], user_df["version"]]))
+            user_df["start_version"] = user_df["start_version"].astype(versions)
+            user_df["version"] = user_df["version"].astype(versions)
 
         # --- Per-user event counts (robust) ---
         def count_events(event):
             return (
                 df[df["event_name"] == event]
-                .groupby(user_key)
+                .groupby(user_col)
                 .size()
                 .rename(event)
             )
 
-        counts = pd.DataFrame({user_key: user_df[user_key]})
+        counts = pd.DataFrame({user_col: user_df[user_col]})
 
         # Add each event safely
-        counts = counts.merge(count_events("Ad Rewarded"), on=user_key, how="left")
-        counts = counts.merge(count_events("Question Completed"), on=user_key, how="left")
-        counts = counts.merge(count_events("Game Ended"), on=user_key, how="left")
-        counts = counts.merge(count_events("App Removed"), on=user_key, how="left")
-        counts = counts.merge(count_events("Session Started"), on=user_key, how="left")
+        counts = counts.merge(count_events("Ad Rewarded"), on=user_col, how="left")
+        counts = counts.merge(count_events("Question Completed"), on=user_col, how="left")
+        counts = counts.merge(count_events("Game Ended"), on=user_col, how="left")
+        counts = counts.merge(count_events("App Removed"), on=user_col, how="left")
+        counts = counts.merge(count_events("Session Started"), on=user_col, how="left")
 
         conversion_events = [
             "event_params__pp_accepted",
@@ -277,7 +350,7 @@ def create_df_by_users(df: pd.DataFrame) -> tuple[pd.DataFrame, pd.DataFrame]:
 
             if event not in df.columns:
                 # Column missing → NA for all users
-                return pd.Series(0, index=user_df[user_key], name=event)
+                return pd.Series(0, index=user_df[user_col], name=event)
 
             # Normalize all "truthy" values
             s = df[event].astype(str).str.lower()
@@ -285,37 +358,37 @@ def create_df_by_users(df: pd.DataFrame) -> tuple[pd.DataFrame, pd.DataFrame]:
 
             # Per-user boolean reduction
             return (
-                col.groupby(df[user_key])
+                col.groupby(df[user_col])
                 .max()              # robust for bool/int
                 .rename(event)
             )
 
         for event in conversion_events:
             bool_event_series = check_bool_event(df, event)
-            counts = counts.merge(bool_event_series, on=user_key, how="left")
+            counts = counts.merge(bool_event_series, on=user_col, how="left")
 
         # Tutorial detection (robust)
         if "event_params__tutorial_video" in df.columns:
             tutorials = (
                 df[(df["event_params__tutorial_video"] == "tutorial_video") & (df["event_name"] == "Video Watched")]
-                .groupby(user_key)
+                .groupby(user_col)
                 .size()
                 .rename("tutorial_completed")
             )
         else:
-            tutorials = pd.Series(0, index=user_df[user_key], name="tutorial_completed")
+            tutorials = pd.Series(0, index=user_df[user_col], name="tutorial_completed")
 
         # Welcome video detection (robust)
         if "event_params__wecolme_video" in df.columns:
             wecolme_video_played = (
                 (df["event_params__wecolme_video"] == "wecolme_video")
-                .groupby(df[user_key])
+                .groupby(df[user_col])
                 .any()                # True if any row matches
                 .astype(int)          # Convert True/False → 1/0
                 .rename("wecolme_video_played")
             )
         else:
-            wecolme_video_played = pd.Series(0, index=user_df[user_key], name="wecolme_video_played")
+            wecolme_video_played = pd.Series(0, index=user_df[user_col], name="wecolme_video_played")
         
         # Did encounter which Menu_opened event
 
@@ -327,19 +400,19 @@ def create_df_by_users(df: pd.DataFrame) -> tuple[pd.DataFrame, pd.DataFrame]:
             col_name = f"menu_opened__{menu.replace(' ', '_').lower()}"
             menu_opened_series = (
                 (df['event_params__menu_name'] == menu) & (df['event_name'] == 'Menu Opened')
-            ).groupby(df[user_key]).any().astype(int).rename(col_name)
+            ).groupby(df[user_col]).any().astype(int).rename(col_name)
             menu_opened_data[col_name] = menu_opened_series
 
         for col_name, series in menu_opened_data.items():
-            counts = counts.merge(series, on=user_key, how="left")
+            counts = counts.merge(series, on=user_col, how="left")
 
         
 
-        counts = counts.merge(wecolme_video_played, on=user_key, how="left")
-        counts = counts.merge(tutorials, on=user_key, how="left")
+        counts = counts.merge(wecolme_video_played, on=user_col, how="left")
+        counts = counts.merge(tutorials, on=user_col, how="left")
 
         # Replace NaN from users with no events
-        count_cols = [c for c in counts.columns if c != user_key]
+        count_cols = [c for c in counts.columns if c != user_col]
         counts[count_cols] = counts[count_cols].fillna(0).astype(int)
 
         # --- Last event (excluding system noise) ---
@@ -353,8 +426,8 @@ def create_df_by_users(df: pd.DataFrame) -> tuple[pd.DataFrame, pd.DataFrame]:
 
         last_event = (
             df_no_end.sort_values("event_date")
-                     .drop_duplicates(subset=[user_key], keep="last")
-                     [[user_key, "event_date", "event_name"]]
+                     .drop_duplicates(subset=[user_col], keep="last")
+                     [[user_col, "event_date", "event_name"]]
                      .rename(columns={
                          "event_date": "last_event_date",
                          "event_name": "last_event_name"
@@ -364,10 +437,15 @@ def create_df_by_users(df: pd.DataFrame) -> tuple[pd.DataFrame, pd.DataFrame]:
         # Final merge
         user_df = (
             user_df
-            .merge(counts, on=user_key, how="left")
-            .merge(last_event, on=user_key, how="left")
+            .merge(counts, on=user_col, how="left")
+            .merge(last_event, on=user_col, how="left")
         )
 
+        if user_col == USER_CODE:
+            user_ids = df.drop_duplicates(subset=[USER_CODE]).set_index(USER_CODE)[USER_COLUMN]
+            user_df.insert(0, USER_COLUMN, user_df.pop(USER_CODE).map(user_ids))
+            user_df = user_df.sort_values(by=USER_COLUMN).reset_index(drop=True)
+
         # Derived KPI
         
         user_df['answered_first_question'] = (user_df['Question Completed'] > 0).astype(int)
@@ -633,7 +711,7 @@ def create_df_by_date(df: pd.DataFrame) -> pd.DataFrame:
         logger.error(f"Error in df_by_date: {e}", exc_info=True)
         return pd.DataFrame()
 
-def create_df_technical_events(df: pd.DataFrame) -> pd.DataFrame:
+def create_df_technical_events(df: pd.DataFrame, context=None) -> pd.DataFrame:
     try:
         # --- Ensure required columns exist ---
         required_cols = [
@@ -649,22 +727,26 @@ def create_df_technical_events(df: pd.DataFrame) -> pd.DataFrame:
             logger.warning("Missing required columns for df_technical_events.")
             return pd.DataFrame()
 
-        # --- Sort by user, session, and event time ---
-        df = df.sort_values(required_cols)
-
-        # --- Create previous event columns within the same session ---
-        df['prev_event_name'] = (
-            df.groupby(['user_pseudo_id', 'event_params__ga_session_id'])['event_name'].shift(1)
-        )
-        if 'event_params__menu_name' in df.columns:
-            df['prev_event_menu'] = (
-                df.groupby(['user_pseudo_id', 'event_params__ga_session_id'])['event_params__menu_name'].shift(1)
-            )
+        # --- Previous event columns within the same session ---
+        # Built as Series so the caller's frame is not modified
+        session_groups = session_keys(df)
+        has_menu = 'event_params__menu_name' in df.columns
+        if is_session_sorted(context):
+            prev_name = shift_within_sessions(df, 'event_name')
+            prev_menu = shift_within_sessions(df, 'event_params__menu_name') if has_menu else None
         else:
-            df['prev_event_menu'] = pd.NA
+            df = df.sort_values(session_groups + [c for c in required_cols if c not in session_groups])
+            prev_name = df.groupby(session_groups)['event_name'].shift(1)
+            prev_menu = df.groupby(session_groups)['event_params__menu_name'].shift(1) if has_menu else None
 
         # --- Filter technical events ---
-        tech_events = df[df['event_name'].isin(['App Exception', 'Ad Load Failed'])].copy()
+        is_technical = df['event_name'].isin(['App Exception', 'Ad Load Failed'])
+        tech_events = df[is_technical].copy()
+        tech_events['prev_event_name'] = prev_name[is_technical]
+        tech_events['prev_event_menu'] = prev_menu[is_technical] if has_menu else pd.NA
+        if SESSION_KEY in session_groups:
+            # Keep the output ordered by the readable ids
+            tech_events = tech_events.sort_values(required_cols)
 
         logger.info(
             f"Technical events dataframe created with {tech_events.shape[0]} records and "
@@ -0,0 +1,242 @@
+"""Dependency graph of pipeline stages declared by the columns they touch.
+
+Every stage in `staging.PIPELINE_STAGES` declares:
+
+- `requires`: columns it cannot run without; a stage whose required columns
+  are missing is skipped with a warning instead of failing inside the stage
+- `reads`: columns it uses when present
+- `writes`: columns it creates or overwrites
+
+A stage that replaces the frame (loading, flattening, renaming, filtering or
+reordering rows) writes `FRAME` instead. It depends on every earlier stage
+and every later stage depends on it. A stage that sorts the rows also
+declares the `row_order` it leaves them in (e.g. `sessions.SESSION_ORDER`).
+
+From the declarations the runner derives:
+
+- levels: stage B depends on an earlier stage A if B uses a column A writes,
+  both write the same column, or B overwrites a column A uses. Stages in
+  the same level are independent; with `stage_workers` > 1 they run on
+  threads, each on a copy of only the columns it declares, and their outputs
+  are written back
+- targets: to produce only some columns, the stages that (transitively)
+  feed them are kept and the rest are skipped
+- pruning: columns listed in `columns_to_drop` are dropped as soon as no
+  remaining stage uses them, unless an output still needs them
+- checkpoints: with `checkpoints` on, the frame after each level is saved
+  (see checkpoints.py) and a rerun resumes after the last saved level, or
+  before the level of `invalidate_from`
+- row order: `context["row_order"]` holds the order the rows are in, so later
+  stages and the splits can skip sorting again. It is set by a stage that
+  declares a `row_order` and cleared by any other stage that replaces the frame
+"""
+
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, NamedTuple, Optional
+
+import pandas as pd
+
+from emoji_oracle_analytics.config.logging import get_logger
+from emoji_oracle_analytics.pipeline.utils.checkpoints import (
+    level_key,
+    load_checkpoint,
+    load_checkpoint_index,
+    save_checkpoint,
+)
+from emoji_oracle_analytics.pipeline.utils.profiling import run_profiled
+
+logger = get_logger(__name__)
+
+FRAME = "*"
+
+
+class Stage(NamedTuple):
+    func: Callable
+    description: str
+    requires: tuple[str, ...] = ()
+    reads: tuple[str, ...] = ()
+    writes: tuple[str, ...] = (FRAME,)
+    row_order: Optional[str] = None
+
+    @property
+    def name(self) -> str:
+        return self.func.__name__
+
+    @property
+    def uses(self) -> set[str]:
+        return set(self.requires) | set(self.reads)
+
+    @property
+    def replaces_frame(self) -> bool:
+        return FRAME in self.writes
+
+
+def depends_on(later: Stage, earlier: Stage) -> bool:
+    if later.replaces_frame or earlier.replaces_frame:
+        return True
+    writes = set(earlier.writes)
+    return bool(writes & later.uses or writes & set(later.writes) or earlier.uses & set(later.writes))
+
+
+def stage_levels(stages: list[Stage]) -> list[list[Stage]]:
+    """Group stages into levels that only depend on earlier levels, keeping declared order."""
+    level_of = []
+    for j, stage in enumerate(stages):
+        deps = [level_of[i] for i in range(j) if depends_on(stage, stages[i])]
+        level_of.append(max(deps, default=-1) + 1)
+
+    levels = [[] for _ in range(max(level_of, default=-1) + 1)]
+    for stage, level in zip(stages, level_of):
+        levels[level].append(stage)
+    return levels
+
+
+def stages_for_targets(stages: list[Stage], targets: Optional[list[str]]) -> list[Stage]:
+    """The stages needed to produce the `targets` columns (all stages when None)."""
+    if not targets:
+        return list(stages)
+
+    needed = set(targets)
+    selected = []
+    for stage in reversed(stages):
+        if stage.replaces_frame or needed & set(stage.writes):
+            selected.append(stage)
+            needed |= stage.uses
+    selected.reverse()
+
+    skipped = [s.name for s in stages if s not in selected]
+    if skipped:
+        logger.info(f"Not needed for {targets}: {skipped}")
+    return selected
+
+
+def row_order_after(stage: Stage, order: Optional[str]) -> Optional[str]:
+    """The row order after `stage` ran on rows in `order`."""
+    if stage.row_order:
+        return stage.row_order
+    return None if stage.replaces_frame else order
+
+
+def missing_inputs(stage: Stage, df: pd.DataFrame) -> list[str]:
+    return [col for col in stage.requires if col not in df.columns]
+
+
+def _run_stage(stage: Stage, df: pd.DataFrame, context: dict) -> pd.DataFrame:
+    logger.info(f"Running {stage.name}...")
+    df = run_profiled(context, "stage", stage.name, stage.func, df=df, context=context)
+    logger.info(f"{stage.name} done.")
+    return df
+
+
+def _run_level_in_threads(level: list[Stage], df: pd.DataFrame, context: dict, workers: int) -> pd.DataFrame:
+    def narrow(stage):
+        cols = [c for c in df.columns if c in stage.uses or c in stage.writes]
+        return df[cols].copy()
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_run_stage, stage, narrow(stage), context) for stage in level]
+        outputs = [future.result() for future in futures]
+
+    for stage, out in zip(level, outputs):
+        for col in stage.writes:
+            if col in out.columns:
+                df[col] = out[col]
+    return df
+
+
+def _prune(df: pd.DataFrame, candidates: set[str], still_used: set[str]) -> pd.DataFrame:
+    drop = [c for c in df.columns if c in candidates and c not in still_used]
+    if drop:
+        logger.info(f"Dropping {len(drop)} columns no later stage or output uses: {drop}")
+        df = df.drop(columns=drop)
+    return df
+
+
+def _resume_level(levels: list[list[Stage]], keys: list[str], index: dict, invalidate_from: Optional[str]) -> int:
+    """Index of the last level with a usable checkpoint (-1 for none)."""
+    usable = len(levels)
+    if invalidate_from:
+        names = [s.name for level in levels for s in level]
+        if invalidate_from not in names:
+            raise ValueError(f"Unknown stage '{invalidate_from}'; expected one of {names}.")
+        usable = next(i for i, level in enumerate(levels) if invalidate_from in [s.name for s in level])
+        logger.info(f"Ignoring checkpoints from {invalidate_from} onward.")
+
+    for i in reversed(range(usable)):
+        if keys[i] in index["entries"]:
+            return i
+    return -1
+
+
+def run_stages(
+    df: pd.DataFrame,
+    stages: list[Stage],
+    context: dict,
+    prune: Optional[list[str]] = None,
+    keep: Optional[list[str]] = None,
+    checkpoint_key: Optional[str] = None,
+) -> pd.DataFrame:
+    """Run `stages` level by level, skipping stages with missing inputs.
+
+    `prune` lists columns that may be dropped once no later stage uses them;
+    `keep` lists columns needed after the pipeline, which are never dropped.
+    `checkpoint_key` identifies the input; when given and `checkpoints` is on,
+    each level's output is checkpointed and reused on later runs. The order
+    of the returned rows is left in `context["row_order"]`.
+    """
+    workers = context.get("stage_workers", 1)
+    levels = stage_levels(stages)
+    candidates = set(prune or [])
+
+    checkpoint_dir = context.get("checkpoint_dir")
+    use_checkpoints = bool(context.get("checkpoints") and checkpoint_key and checkpoint_dir)
+    start = 0
+    context["row_order"] = None
+    if use_checkpoints:
+        index = load_checkpoint_index(checkpoint_dir)
+        keys = []
+        for level in levels:
+            keys.append(level_key(keys[-1] if keys else checkpoint_key, level))
+        resume = _resume_level(levels, keys, index, context.get("invalidate_from"))
+        if resume >= 0:
+            df = load_checkpoint(checkpoint_dir, index, keys[resume])
+            context["row_order"] = index["entries"][keys[resume]].get("row_order")
+            start = resume + 1
+            logger.info(f"Resuming after level {resume} of {len(levels)}.")
+
+    for i, level in enumerate(levels):
+        if i < start:
+            continue
+        runnable = []
+        for stage in level:
+            missing = missing_inputs(stage, df)
+            if missing:
+                logger.warning(f"Skipping {stage.name}: missing columns {missing}.")
+            else:
+                runnable.append(stage)
+
+        if workers > 1 and len(runnable) > 1:
+            logger.info(f"Running {[s.name for s in runnable]} together.")
+            df = _run_level_in_threads(runnable, df, context, workers)
+        else:
+            for stage in runnable:
+                df = _run_stage(stage, df, context)
+                context["row_order"] = row_order_after(stage, context["row_order"])
+
+        if candidates:
+            later = [s for next_level in levels[i + 1:] for s in next_level]
+            if not any(s.replaces_frame and not s.uses for s in later):
+                still_used = set(keep or []).union(*(s.uses for s in later))
+                df = _prune(df, candidates, still_used)
+
+        if use_checkpoints:
+            save_checkpoint(
+                checkpoint_dir, index, keys[i], df,
+                stages=[s.name for s in level],
+                max_bytes=context.get("checkpoint_max_bytes"),
+                row_order=context["row_order"],
+            )
+
+    return df
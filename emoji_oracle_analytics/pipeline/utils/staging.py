@@ -1,99 +1,193 @@
 import pandas as pd
 from emoji_oracle_analytics.config.logging import get_logger
+from emoji_oracle_analytics.pipeline.utils.checkpoints import input_key
+from emoji_oracle_analytics.pipeline.utils.cleaning_functions import (
+    question_index_cleanup,
+    dots_to_underscores,
+    apply_value_maps,
+    compact_categoricals,
+)
+from emoji_oracle_analytics.pipeline.utils.feature_engineering import (
+    forward_fill_progress,
+    question_cumulative_qi,
+    mini_game_features,
+    mini_game_reward_split,
+    mini_game_buffs,
+    mini_game_dolls,
+    currency_define_permanent,
+    currency_define_consumable,
+    currency_define_board,
+    currency_define_keys,
+    question_addressable_index,
+    question_answer_wrong_zeros,
+)
+from emoji_oracle_analytics.pipeline.utils.filters import apply_event_filters
+from emoji_oracle_analytics.pipeline.utils.flattening_functions import flatten_dataframe
+from emoji_oracle_analytics.pipeline.utils.lists_and_maps import (
+    categorical_columns,
+    columns_to_drop,
+    map_of_maps,
+    split_columns,
+)
+from emoji_oracle_analytics.pipeline.utils.param_schema import apply_param_schema
+from emoji_oracle_analytics.pipeline.utils.processed_cache import (
+    ROW_LOCAL_STAGES,
+    filter_fingerprint,
+    load_processed_events,
+)
+from emoji_oracle_analytics.pipeline.utils.pull_functions import pull_from_bq, sync_store
+from emoji_oracle_analytics.pipeline.utils.sessions import SESSION_ORDER, infer_sessions, sort_events
+from emoji_oracle_analytics.pipeline.utils.stage_graph import Stage, run_stages, stages_for_targets
+from emoji_oracle_analytics.pipeline.utils.time_and_date_functions import (
+    transform_datetime_fields,
+    add_time_based_features,
+    add_durations,
+    time_features_fingerprint,
+)
+from emoji_oracle_analytics.pipeline.utils.user_keys import add_user_keys
 
 logger = get_logger(__name__)
 
+SESSION_COLUMNS = ('user_pseudo_id', 'event_params__ga_session_id', 'inferred_session_id', 'session_key')
+PROGRESS_COLUMNS = ('event_params__character_name', 'event_params__current_tier', 'event_params__current_qi')
+SPENT_TO = 'event_params__spent_to'
+MINI_GAME_RI = 'event_params__mini_game_ri'
 
 
+# Stages in pipeline order, with the columns each one requires, reads and writes
+# (see stage_graph). Stages that replace the whole frame write FRAME (the default).
 PIPELINE_STAGES = [
-    ("pull_from_bq", "Pull data from BigQuery"),
-    ("flatten_dataframe", "Flatten dataframe"),
-    ("dots_to_underscores", "Convert dots in column names to underscores"),
-    ("transform_datetime_fields", "Transform datetime fields"),
-    ("add_time_based_features", "Add time-based features"),
-    ("add_durations", "Add durations"),
-    ("forward_fill_progress", "Forward-fill progress"),
-    ("question_index_cleanup", "Clean up question index"),
-    ("calculate_cumulative_qi", "Calculate cumulative question index"),
-    ("mini_game_features", "Engineer mini-game features"),
-    ("mini_game_reward_split", "Split mini-game reward info"),
-    ("mini_game_buffs", "Engineer mini-game buff features"),
-    ("mini_game_dolls", "Engineer mini-game doll features"),
-    ("currency_define_permanent", "Define permanent currency"),
-    ("currency_define_consumable", "Define consumable currency")
+    Stage(pull_from_bq, "Pull data from BigQuery"),
+    Stage(flatten_dataframe, "Flatten dataframe"),
+    Stage(dots_to_underscores, "Convert dots in column names to underscores"),
+    Stage(apply_param_schema, "Cast parameter columns to their registered types"),
+    Stage(apply_event_filters, "Filter events by date, country, user and version",
+          reads=('event_timestamp', 'geo__country', 'user_pseudo_id', 'app_info__version')),
+    Stage(add_user_keys, "Add integer user and session keys",
+          requires=('user_pseudo_id',),
+          reads=('event_params__ga_session_id',),
+          writes=('user_code', 'session_key')),
+    Stage(transform_datetime_fields, "Transform datetime fields",
+          reads=('event_date', 'event_timestamp', 'event_previous_timestamp', 'user_first_touch_timestamp',
+                 'user__first_open_time', 'device__time_zone_offset_seconds',
+                 'event_params__engagement_time_msec', 'event_server_timestamp_offset',
+                 'event_params__time_spent'),
+          writes=('event_datetime', 'event_previous_datetime', 'event_first_touch_datetime',
+                  'user__first_open_datetime', 'time_delta',
+                  'event_date', 'event_time', 'event_previous_date', 'event_previous_time',
+                  'event_first_touch_date', 'event_first_touch_time',
+                  'user__first_open_date', 'user__first_open_time',
+                  'device__time_zone_offset_hours', 'event_params__engagement_time_seconds',
+                  'event_server_delay_seconds', 'event_params__time_spent_seconds')),
+    Stage(add_time_based_features, "Add time-based features",
+          requires=('event_datetime',),
+          reads=('device__time_zone_offset_seconds',),
+          writes=('ts_weekday', 'ts_local_time', 'ts_hour', 'ts_daytime_named', 'ts_is_weekend')),
+    Stage(infer_sessions, "Infer sessions of events without a session id",
+          requires=('user_pseudo_id', 'event_datetime'),
+          reads=('event_params__ga_session_id', 'user_code', 'session_key'),
+          writes=('inferred_session_id', 'session_key')),
+    # Sorts the rows once; later stages and the splits rely on the order
+    Stage(sort_events, "Sort events by session and time",
+          requires=('event_datetime',),
+          reads=SESSION_COLUMNS,
+          row_order=SESSION_ORDER),
+    Stage(add_durations, "Add durations",
+          requires=('event_datetime', 'event_name'),
+          reads=SESSION_COLUMNS,
+          writes=('session_duration_seconds', 'session_duration_minutes', 'session_duration_hours',
+                  'session_start_time', 'session_end_time', 'event_duration_seconds')),
+    Stage(forward_fill_progress, "Forward-fill progress",
+          requires=('event_datetime',) + PROGRESS_COLUMNS,
+          reads=SESSION_COLUMNS,
+          writes=PROGRESS_COLUMNS),
+    Stage(question_index_cleanup, "Clean up question index",
+          requires=PROGRESS_COLUMNS,
+          writes=('event_params__current_question_index', 'event_params__current_tier', 'event_params__current_qi')),
+    Stage(question_cumulative_qi, "Calculate cumulative question index",
+          requires=('event_params__current_question_index',),
+          reads=('event_params__current_tier', 'event_params__character_name'),
+          writes=('cumulative_question_index',)),
+    Stage(mini_game_features, "Engineer mini-game features",
+          requires=(MINI_GAME_RI,),
+          writes=('maze_gender', 'maze_hand', 'maze_level')),
+    Stage(mini_game_reward_split, "Split mini-game reward info",
+          requires=(MINI_GAME_RI,),
+          writes=('buff_type', 'buff_gift', 'buff_gold')),
+    Stage(mini_game_buffs, "Engineer mini-game buff features",
+          requires=(MINI_GAME_RI,),
+          writes=('earned_buff_type',)),
+    Stage(mini_game_dolls, "Engineer mini-game doll features",
+          requires=(SPENT_TO,),
+          writes=('doll_name', SPENT_TO)),
+    Stage(currency_define_permanent, "Define permanent currency",
+          requires=(SPENT_TO,),
+          writes=('shop_permanent_item', SPENT_TO)),
+    Stage(currency_define_consumable, "Define consumable currency",
+          requires=(SPENT_TO,),
+          writes=('shop_consumable_item', SPENT_TO)),
+    Stage(currency_define_board, "Define board items",
+          requires=(SPENT_TO, 'event_params__where_its_spent'),
+          writes=('board_item', SPENT_TO)),
+    Stage(currency_define_keys, "Define keys",
+          requires=(SPENT_TO,),
+          writes=(SPENT_TO,)),
+    Stage(apply_value_maps, "Map raw values to display names",
+          reads=tuple(map_of_maps),
+          writes=tuple(map_of_maps)),
+    Stage(question_addressable_index, "Build question addresses",
+          requires=('event_params__character_name', 'event_params__current_tier',
+                    'event_params__current_question_index'),
+          writes=('question_address',)),
+    Stage(question_answer_wrong_zeros, "Fill missing wrong-answer counts",
+          requires=('event_name', 'event_params__answered_wrong'),
+          writes=('event_params__answered_wrong',)),
+    Stage(compact_categoricals, "Store low-cardinality strings as categoricals",
+          reads=tuple(categorical_columns),
+          writes=tuple(categorical_columns)),
 ]
 
-def run_pipeline(df: pd.DataFrame, context: dict) -> pd.DataFrame:
-    from emoji_oracle_analytics.pipeline.utils.main_functions import (filter_events_by_date, 
-                                               filter_events_by_country,
-                                               filter_events_by_user,
-                                               filter_events_by_version
-    )
-    from emoji_oracle_analytics.pipeline.utils.lists_and_maps import map_of_maps
-    from emoji_oracle_analytics.pipeline.utils.pull_functions import pull_from_bq
-    from emoji_oracle_analytics.pipeline.utils.flattening_functions import flatten_dataframe
-    from emoji_oracle_analytics.pipeline.utils.time_and_date_functions import (
-        transform_datetime_fields,
-        add_time_based_features,
-        add_durations
-    )
-
-       
-    from emoji_oracle_analytics.pipeline.utils.feature_engineering import (              
-        forward_fill_progress,
-        question_cumulative_qi,
-        mini_game_features,
-        mini_game_reward_split,
-        mini_game_buffs,
-        mini_game_dolls,
-        currency_define_permanent,
-        currency_define_consumable,
-        currency_define_board,
-        currency_define_keys,
-        question_addressable_index,
-        question_answer_wrong_zeros
-    )
-    from emoji_oracle_analytics.pipeline.utils.cleaning_functions import (
-        question_index_cleanup,
-        dots_to_underscores,
-        apply_value_maps)
-
 
-    # Put the stage functions in a list in the right order
-    stages = [
-        pull_from_bq,
-        filter_events_by_date,
-        flatten_dataframe,
-        dots_to_underscores,
-        filter_events_by_version,
-        filter_events_by_country,
-        filter_events_by_user,
-        transform_datetime_fields,
-        add_time_based_features,
-        add_durations,
-        forward_fill_progress,
-        question_index_cleanup,
-        question_cumulative_qi,
-        mini_game_features,
-        mini_game_reward_split,
-        mini_game_buffs,
-        mini_game_dolls,
-        currency_define_permanent,
-        currency_define_consumable,
-        currency_define_board,
-        currency_define_keys,
-        apply_value_maps,
-        question_addressable_index,
-        question_answer_wrong_zeros
-    ]
+def pipeline_stages(context: dict) -> list[Stage]:
+    """The stages to run for this context, in order."""
+    stages = PIPELINE_STAGES
+    if context.get("processed_cache"):
+        # Row-local stages come from the per-day cache; only cross-day stages run here.
+        stages = [Stage(load_processed_events, "Load processed days from the cache")] + [
+            stage for stage in stages
+            if stage.func is not pull_from_bq and stage.func not in ROW_LOCAL_STAGES
+        ]
+    return stages_for_targets(stages, context.get("pipeline_targets"))
 
-    for stage in stages:
-        stage_name = stage.__name__
-        logger.info(f"Running {stage_name}...")
 
-        # Each stage accepts df and context
-        df = stage(df=df, context=context)
+def run_pipeline(df: pd.DataFrame, context: dict) -> pd.DataFrame:
+    stages = pipeline_stages(context)
+    prune = context.get("prune_columns", True)
 
-        logger.info(f"{stage_name} done.")
+    caller_context = context
+    checkpoint_key = None
+    if context.get("checkpoints"):
+        # Sync first so the checkpoint key reflects newly downloaded tables,
+        # even when the run resumes past the loading stage.
+        manifest = sync_store(context)
+        context = {**context, "store_synced": True}
+        checkpoint_key = input_key(manifest, {
+            "filters": filter_fingerprint(context),
+            "prune_columns": prune,
+            "processed_cache": bool(context.get("processed_cache")),
+            "session_gap_minutes": context.get("session_gap_minutes"),
+            "time_features": time_features_fingerprint(context),
+        })
 
+    # Each stage accepts df and context; independent stages may run together
+    df = run_stages(
+        df,
+        stages,
+        context,
+        prune=columns_to_drop if prune else None,
+        keep=context.get("pipeline_targets") or split_columns,
+        checkpoint_key=checkpoint_key,
+    )
+    # The splits skip sorting when the frame is already in session order
+    caller_context["row_order"] = context["row_order"]
     return df
@@ -0,0 +1,473 @@
+"""Deterministic synthetic GA4 export, for benchmarks and tests.
+
+`write_synthetic_store` writes daily `events_YYYYMMDD` tables in the parquet
+store layout (see parquet_store) together with their manifest, so the
+pipeline reads them exactly like downloaded tables. The events follow the
+shape of the real export:
+
+- nested `event_params` / `user_properties` lists and `device`, `geo` and
+  `app_info` structs, with the canonical types of `PARAM_COLUMN_TYPES`
+- event names from `event_name_map` and the tutorial events, mixed roughly
+  like the real data, with each session opened by `session_start` and each
+  user's first session by `first_open`
+- parameter values drawn from the maps in lists_and_maps (characters, menus,
+  mini-games, currencies, shop items), so value mapping and feature
+  engineering find what they expect
+- per-user session numbers and question progress that carry over from day to
+  day
+
+Users join on a random day and keep their country, device and time zone; they
+upgrade through `VERSIONS` over the period. The same arguments and seed always
+produce the same files. Tables are built column-wise with numpy and Arrow, so
+millions of events take seconds, not minutes.
+"""
+
+from __future__ import annotations
+
+import os
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Optional
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from emoji_oracle_analytics.config.logging import get_logger
+from emoji_oracle_analytics.pipeline.utils import lists_and_maps as maps
+from emoji_oracle_analytics.pipeline.utils.manifest import MANIFEST_VERSION, describe_parquet, save_manifest
+from emoji_oracle_analytics.pipeline.utils.parquet_store import table_file
+from emoji_oracle_analytics.pipeline.utils.pull_functions import PARAM_COLUMN_TYPES
+
+logger = get_logger(__name__)
+
+EVENTS_PER_USER = 60
+EVENTS_PER_SESSION = 30
+QUESTIONS_PER_CHARACTER = 16
+TIERS = 4
+
+VERSIONS = ["1.0.3", "1.0.4", "1.0.5", "1.0.6"]
+CHARACTERS = [name for name in maps.event_params__character_name_map if name != "joe"]
+
+# country, continent, sub-continent, time zone offsets (s), share of users
+COUNTRIES = [
+    ("United States", "Americas", "Northern America", [-21600, -18000, -28800, -25200], 0.75),
+    ("Türkiye", "Asia", "Western Asia", [10800], 0.2),
+    ("Canada", "Americas", "Northern America", [-18000, -14400], 0.03),
+    ("Iraq", "Asia", "Western Asia", [10800], 0.02),
+]
+
+# brand, marketing name, model, OS version
+DEVICES = [
+    ("Samsung", "Galaxy A15", "SM-A155F", "Android 14"),
+    ("Samsung", "Galaxy S23", "SM-S911B", "Android 15"),
+    ("Xiaomi", "Redmi Note 13", "23129RAA4G", "Android 14"),
+    ("Realme", "C75", "RMX3941", "Android 15"),
+    ("Google", "Pixel 8", "Pixel 8", "Android 16"),
+    ("Motorola", "moto g play", "moto g play - 2024", "Android 14"),
+]
+LANGUAGES = ["en-us", "tr-tr", "en-gb", "ar-iq"]
+
+# Relative frequency of the sampled events; session_start and first_open are
+# placed at the start of sessions instead.
+EVENT_WEIGHTS = {
+    "question_started": 170, "question_completed": 155, "earn_virtual_currency": 145,
+    "menu_opened": 95, "menu_closed": 90, "user_engagement": 42, "screen_view": 41,
+    "start_currencies": 20, "mini_game_started": 20, "spend_virtual_currency": 18,
+    "helpdex": 18, "mini_game_completed": 17, "video_watched": 17, "firebase_campaign": 16,
+    "pp_accept": 6, "wv_start": 7, "wv_finish": 6, "t_enters": 6, "sm_shown": 6,
+    "option_drag": 6, "ad_loaded": 6, "ad_displayed": 6, "ad_closed": 5, "ad_clicked": 5,
+    "ad_rewarded": 5, "app_remove": 3, "app_clear_data": 1, "ad_load_failed": 1,
+    "mini_game_failed": 1, "video_rewatched": 1, "app_exception": 0.5, "app_update": 0.2,
+}
+
+MINI_GAME_RESULTS = list(maps.event_params__mini_game_ri_map) + [
+    "buff_Potion_gift_False_gold_False",
+    "buff_IncreaseXEnergy_gift_True_gold_False",
+    "earned_buff_Potion",
+    "maze_hand_ManHandOne_maze_level_2",
+    "maze_hand_WomanHandTwo_maze_level_3",
+]
+SPENT_TO = (
+    list(maps.event_params__spent_to_map)
+    + list(maps.shop_consumable_item_map)
+    + list(maps.shop_permanent_item_map)
+    + ["tdoll", "cjaydoll"]
+)
+AD_UNIT = ["6b570flp2ge9uxl8"]
+AD_NETWORK = ["unityads"]
+AD_PLACEMENTS = ["Crystal_Character", "Crystal_Energy", "Wheel_Placement", "EnergyGold_Exchange"]
+TRUE = ["True"]
+
+# Parameters per event: key -> (value type, choices list or (low, high) range)
+_AD = {"ad_unit_id": ("string", AD_UNIT), "ad_network": ("string", AD_NETWORK)}
+_PLACED_AD = {**_AD, "ad_placement": ("string", AD_PLACEMENTS)}
+_MINI_GAME = {
+    "mini_game_name": ("string", list(maps.event_params__mini_game_name_map)),
+    "mini_game_ri": ("string", MINI_GAME_RESULTS),
+}
+EVENT_PARAMS: dict[str, dict[str, tuple[str, Any]]] = {
+    "session_start": {"session_engaged": ("int", [1])},
+    "first_open": {
+        "firebase_conversion": ("int", [1]),
+        "previous_first_open_count": ("int", [0]),
+        "engagement_time_msec": ("int", [1]),
+    },
+    "question_completed": {
+        "answered_wrong": ("int", [0, 0, 0, 0, 1, 1, 2, 3]),
+        "time_spent": ("double", (1.0, 60.0)),
+    },
+    "earn_virtual_currency": {
+        "currency_name": ("string", ["gold"] * 9 + ["energy"]),
+        "earned_amount": ("double", [10.0, 20.0, 30.0, 40.0, 60.0, 80.0, 100.0]),
+        "where_its_earned": ("string", list(maps.event_params__where_its_earned_map)),
+        "how_its_earned": ("string", list(maps.event_params__how_its_earned_map)),
+    },
+    "spend_virtual_currency": {
+        "currency_name": ("string", ["gold"] * 3 + ["energy"]),
+        "spent_amount": ("double", [1.0, 2.0, 100.0, 200.0, 300.0]),
+        "where_its_spent": ("string", list(maps.event_params__where_its_spent_map)),
+        "spent_to": ("string", SPENT_TO),
+    },
+    "menu_opened": {"menu_name": ("string", list(maps.event_params__menu_name_map))},
+    "menu_closed": {
+        "menu_name": ("string", list(maps.event_params__menu_name_map)),
+        "time_spent": ("double", (0.5, 120.0)),
+    },
+    "mini_game_started": _MINI_GAME,
+    "mini_game_completed": {**_MINI_GAME, "time_spent": ("double", (5.0, 180.0))},
+    "mini_game_failed": {**_MINI_GAME, "time_spent": ("double", (5.0, 180.0))},
+    "user_engagement": {"engagement_time_msec": ("int", (1, 300000))},
+    "screen_view": {"entrances": ("int", [1]), "engagement_time_msec": ("int", (1, 60000))},
+    "start_currencies": {
+        "start_gold": ("int", (0, 5000)),
+        "max_energy": ("int", [100]),
+        "left_energy": ("int", (0, 100)),
+        "start_character": ("int", (0, 20)),
+    },
+    "video_watched": {"wecolme_video": ("string", ["wecolme_video"])},
+    "video_rewatched": {"tutorial_video": ("string", ["tutorial_video"])},
+    "firebase_campaign": {
+        "source": ("string", ["google-play"]),
+        "medium": ("string", ["organic"]),
+        "campaign_info_source": ("string", ["com.android.vending"]),
+    },
+    "pp_accept": {"pp_accepted": ("string", TRUE)},
+    "wv_start": {"video_start": ("string", TRUE)},
+    "wv_finish": {"video_finished": ("string", TRUE)},
+    "t_enters": {"entered": ("string", TRUE)},
+    "sm_shown": {"shown": ("string", TRUE)},
+    "helpdex": {"opened": ("string", TRUE), "return": ("string", TRUE), "closed": ("string", TRUE)},
+    "option_drag": {"drag": ("string", TRUE)},
+    "ad_loaded": {**_AD, "ad_instance": ("string", ["rewarded"]), "ad_revenue": ("string", ["0.0012"])},
+    "ad_displayed": _PLACED_AD,
+    "ad_clicked": _PLACED_AD,
+    "ad_closed": {**_PLACED_AD, "time_spent": ("double", (5.0, 35.0))},
+    "ad_rewarded": {
+        **_PLACED_AD,
+        "ad_reward_amount": ("int", [1]),
+        "ad_reward_type": ("string", ["energy"]),
+    },
+    "ad_load_failed": {**_AD, "ad_id": ("string", ["rewardedVideo"]), "ad_error_code": ("int", [1, 3])},
+    "app_exception": {"fatal": ("int", [0, 1]), "timestamp": ("int", (1, 10**12))},
+    "app_update": {"previous_app_version": ("string", VERSIONS)},
+}
+QUESTION_EVENTS = ("question_started", "question_completed")
+EVENT_NAMES = ["session_start", "first_open"] + list(EVENT_WEIGHTS)
+
+_DAY_US = 86_400 * 10**6
+
+
+def _epoch_us(day: date) -> int:
+    return int(datetime(day.year, day.month, day.day, tzinfo=timezone.utc).timestamp()) * 10**6
+
+
+def _strings(codes: np.ndarray, pool: list[str]) -> pa.Array:
+    """String array of `pool[codes]` (null where a code is negative)."""
+    indices = pa.array(codes.astype(np.int32), mask=codes < 0)
+    return pa.DictionaryArray.from_arrays(indices, pa.array(pool, pa.string())).cast(pa.string())
+
+
+def _user_pool(users: int, days: int, rng: np.random.Generator) -> dict[str, np.ndarray]:
+    """Fixed attributes of every synthetic user, plus counters carried across days."""
+    halves = rng.integers(0, 2**63, size=(users, 2), dtype=np.int64)
+    country = rng.choice(len(COUNTRIES), users, p=[c[4] for c in COUNTRIES])
+    tz = np.array([rng.choice(COUNTRIES[c][3]) for c in country], dtype=np.int64)
+    # More users join early in the period than late; someone is there on day one
+    first_day = (rng.random(users) ** 2 * days).astype(np.int64)
+    first_day[0] = 0
+    return {
+        "id": np.array([f"{a:016x}{b:016x}" for a, b in halves], dtype=object),
+        "first_day": first_day,
+        "country": country,
+        "time_zone": tz,
+        "device": rng.integers(0, len(DEVICES), users),
+        "language": rng.integers(0, len(LANGUAGES), users),
+        "upgrade_lag": rng.uniform(-1.0, 0.5, users),
+        "first_touch_us": np.zeros(users, dtype=np.int64),
+        "sessions": np.zeros(users, dtype=np.int64),
+        "questions": np.zeros(users, dtype=np.int64),
+    }
+
+
+def _event_params(
+    n: int,
+    names: np.ndarray,
+    rng: np.random.Generator,
+    common: dict[str, tuple[str, np.ndarray]],
+    progress: dict[str, tuple[np.ndarray, np.ndarray, list[str]]],
+) -> pa.Array:
+    """Build the `event_params` list column from per-key value arrays.
+
+    `common` holds parameters every event carries, `progress` the question
+    progress parameters as (rows, codes, string pool).
+    """
+    keys: list[str] = []
+    pool: list[str] = []
+    chunks = []  # (rows, key code, kind, values)
+
+    def add(rows, key, kind, values, strings=None):
+        if key not in keys:
+            keys.append(key)
+        if kind == "string":
+            values = np.asarray(values) + len(pool)
+            pool.extend(strings)
+        chunks.append((rows, keys.index(key), kind, values))
+
+    all_rows = np.arange(n)
+    for key, (kind, values) in common.items():
+        if kind == "string":
+            add(all_rows, key, kind, np.zeros(n, dtype=np.int64), [values])
+        else:
+            add(all_rows, key, kind, values)
+    for key, (rows, codes, strings) in progress.items():
+        add(rows, key, "string", codes, strings)
+
+    for code, name in enumerate(EVENT_NAMES):
+        rows = np.flatnonzero(names == code)
+        if not len(rows):
+            continue
+        for key, (kind, choices) in EVENT_PARAMS.get(name, {}).items():
+            if isinstance(choices, tuple):
+                low, high = choices
+                if kind == "int":
+                    values = rng.integers(low, high + 1, len(rows))
+                else:
+                    values = np.round(rng.uniform(low, high, len(rows)), 3)
+                add(rows, key, kind, values)
+            elif kind == "string":
+                add(rows, key, kind, rng.integers(0, len(choices), len(rows)), list(choices))
+            else:
+                add(rows, key, kind, np.asarray(choices)[rng.integers(0, len(choices), len(rows))])
+
+    rows = np.concatenate([c[0] for c in chunks])
+    key_codes = np.concatenate([np.full(len(c[0]), c[1]) for c in chunks])
+    typed = {}
+    for kind, dtype in (("string", np.int64), ("int", np.int64), ("double", np.float64)):
+        typed[kind] = np.concatenate([
+            np.asarray(c[3], dtype=dtype) if c[2] == kind else np.full(len(c[0]), -1, dtype=dtype)
+            for c in chunks
+        ])
+    is_kind = {kind: np.concatenate([np.full(len(c[0]), c[2] == kind) for c in chunks]) for kind in typed}
+
+    order = np.argsort(rows, kind="stable")
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(rows, minlength=n))]).astype(np.int32)
+    total = len(rows)
+    value = pa.StructArray.from_arrays(
+        [
+            _strings(np.where(is_kind["string"], typed["string"], -1)[order], pool),
+            pa.array(typed["int"][order], mask=~is_kind["int"][order]),
+            pa.nulls(total, pa.float64()),
+            pa.array(typed["double"][order], mask=~is_kind["double"][order]),
+        ],
+        names=["string_value", "int_value", "float_value", "double_value"],
+    )
+    element = pa.StructArray.from_arrays([_strings(key_codes[order], keys), value], names=["key", "value"])
+    return pa.ListArray.from_arrays(pa.array(offsets), element).cast(PARAM_COLUMN_TYPES["event_params"])
+
+
+def _user_properties(n: int, session_id, session_start_us, session_number, first_touch_us) -> pa.Array:
+    keys = np.tile([0, 1, 2], n)
+    first_open_ms = first_touch_us // 3_600_000_000 * 3_600_000
+    ints = np.column_stack([session_id, first_open_ms, session_number]).ravel()
+    set_us = np.column_stack([session_start_us, first_touch_us, session_start_us]).ravel()
+    value = pa.StructArray.from_arrays(
+        [
+            pa.nulls(3 * n, pa.string()),
+            pa.array(ints, pa.int64()),
+            pa.nulls(3 * n, pa.float64()),
+            pa.nulls(3 * n, pa.float64()),
+            pa.array(set_us, pa.int64()),
+        ],
+        names=["string_value", "int_value", "float_value", "double_value", "set_timestamp_micros"],
+    )
+    element = pa.StructArray.from_arrays(
+        [_strings(keys, ["ga_session_id", "first_open_time", "ga_session_number"]), value],
+        names=["key", "value"],
+    )
+    offsets = pa.array(np.arange(0, 3 * n + 1, 3, dtype=np.int32))
+    return pa.ListArray.from_arrays(offsets, element).cast(PARAM_COLUMN_TYPES["user_properties"])
+
+
+def synthetic_day(
+    day: date,
+    day_index: int,
+    days: int,
+    events: int,
+    pool: dict[str, np.ndarray],
+    rng: np.random.Generator,
+) -> pa.Table:
+    """One day of events for the users in `pool`, updating its per-user counters."""
+    # --- Sessions: every user joining today gets one, the rest go to active users
+    joining = np.flatnonzero(pool["first_day"] == day_index)
+    active = np.flatnonzero(pool["first_day"] <= day_index)
+    n_sessions = max(len(joining), events // EVENTS_PER_SESSION, 1)
+    session_user = np.concatenate([joining, rng.choice(active, n_sessions - len(joining))])
+    session_start = _epoch_us(day) + rng.integers(0, 86_400 - 3_600, n_sessions) * 10**6
+    by_user = np.lexsort((session_start, session_user))
+    session_user, session_start = session_user[by_user], session_start[by_user]
+
+    first_of_user = np.r_[True, session_user[1:] != session_user[:-1]]
+    starts = np.flatnonzero(first_of_user)
+    rank = np.arange(n_sessions) - np.repeat(starts, np.diff(np.r_[starts, n_sessions]))
+    session_number = pool["sessions"][session_user] + rank + 1
+    np.add.at(pool["sessions"], session_user, 1)
+    is_first_session = (session_number == 1)
+    new_touch = session_user[is_first_session]
+    pool["first_touch_us"][new_touch] = session_start[is_first_session]
+
+    # --- Events: at least one per session, timestamps spaced within the session
+    n = max(events, n_sessions)
+    sizes = rng.multinomial(n - n_sessions, np.full(n_sessions, 1 / n_sessions)) + 1
+    session = np.repeat(np.arange(n_sessions), sizes)
+    first_event = np.r_[0, np.cumsum(sizes)[:-1]]
+    position = np.arange(n) - first_event[session]
+    gaps = rng.exponential(20.0, n) * 10**6
+    gaps[first_event] = 0
+    elapsed = np.cumsum(gaps)
+    timestamp = session_start[session] + (elapsed - elapsed[first_event][session]).astype(np.int64)
+    user = session_user[session]
+
+    weights = np.array(list(EVENT_WEIGHTS.values()), dtype=float)
+    names = rng.choice(np.arange(2, len(EVENT_NAMES)), n, p=weights / weights.sum())
+    opens = is_first_session[session]
+    names[(position == 0) & opens] = EVENT_NAMES.index("first_open")
+    names[(position == np.where(opens, 1, 0))] = EVENT_NAMES.index("session_start")
+
+    # --- Question progress, continuing from earlier days
+    question_codes = [EVENT_NAMES.index(name) for name in QUESTION_EVENTS]
+    q_rows = np.flatnonzero(np.isin(names, question_codes))
+    q_rows = q_rows[np.lexsort((timestamp[q_rows], user[q_rows]))]
+    q_users = user[q_rows]
+    q_starts = np.flatnonzero(np.r_[True, q_users[1:] != q_users[:-1]]) if len(q_rows) else np.array([], int)
+    q_rank = np.arange(len(q_rows)) - np.repeat(q_starts, np.diff(np.r_[q_starts, len(q_rows)]))
+    # A started/completed pair per question
+    overall = (pool["questions"][q_users] + q_rank) // 2
+    np.add.at(pool["questions"], q_users, 1)
+    per_tier = QUESTIONS_PER_CHARACTER * len(CHARACTERS)
+    progress = {
+        "character_name": (q_rows, (overall // QUESTIONS_PER_CHARACTER) % len(CHARACTERS), CHARACTERS),
+        "current_tier": (q_rows, np.minimum(overall // per_tier, TIERS - 1), [str(t + 1) for t in range(TIERS)]),
+        "current_qi": (q_rows, overall % QUESTIONS_PER_CHARACTER,
+                       [str(q + 1) for q in range(QUESTIONS_PER_CHARACTER)]),
+    }
+
+    session_id = session_start // 10**6
+    common = {
+        "ga_session_id": ("int", session_id[session]),
+        "ga_session_number": ("int", session_number[session]),
+        "engaged_session_event": ("int", np.ones(n, dtype=np.int64)),
+        "firebase_event_origin": ("string", "app"),
+        "firebase_screen_class": ("string", "UnityPlayerGameActivity"),
+        "firebase_screen_id": ("int", np.full(n, -9011869056973121551, dtype=np.int64)),
+    }
+
+    # --- User attributes
+    version = np.clip(
+        np.floor(day_index / max(days, 1) * len(VERSIONS) + pool["upgrade_lag"][user]), 0, len(VERSIONS) - 1
+    ).astype(np.int64)
+    country = pool["country"][user]
+    device = pool["device"][user]
+    previous = np.r_[0, timestamp[:-1]]
+
+    columns = {
+        "event_date": _strings(np.zeros(n, dtype=np.int64), [day.strftime("%Y%m%d")]),
+        "event_timestamp": pa.array(timestamp),
+        "event_name": _strings(names, EVENT_NAMES),
+        "event_params": _event_params(n, names, rng, common, progress),
+        "event_previous_timestamp": pa.array(previous, mask=position == 0),
+        "event_server_timestamp_offset": pa.array(rng.integers(100_000, 3_000_000, n)),
+        "user_pseudo_id": _strings(user, list(pool["id"])),
+        "user_properties": _user_properties(
+            n, session_id[session], session_start[session], session_number[session], pool["first_touch_us"][user]
+        ),
+        "user_first_touch_timestamp": pa.array(pool["first_touch_us"][user]),
+        "device": pa.StructArray.from_arrays(
+            [
+                _strings(np.zeros(n, dtype=np.int64), ["mobile"]),
+                _strings(pool["language"][user], LANGUAGES),
+                _strings(np.zeros(n, dtype=np.int64), ["No"]),
+                _strings(device, [d[0] for d in DEVICES]),
+                _strings(device, [d[1] for d in DEVICES]),
+                _strings(device, [d[2] for d in DEVICES]),
+                _strings(np.zeros(n, dtype=np.int64), ["Android"]),
+                _strings(device, [d[3] for d in DEVICES]),
+                pa.array(pool["time_zone"][user]),
+            ],
+            names=["category", "language", "is_limited_ad_tracking", "mobile_brand_name",
+                   "mobile_marketing_name", "mobile_model_name", "operating_system",
+                   "operating_system_version", "time_zone_offset_seconds"],
+        ),
+        "geo": pa.StructArray.from_arrays(
+            [
+                _strings(country, [c[1] for c in COUNTRIES]),
+                _strings(country, [c[0] for c in COUNTRIES]),
+                _strings(country, [c[2] for c in COUNTRIES]),
+            ],
+            names=["continent", "country", "sub_continent"],
+        ),
+        "app_info": pa.StructArray.from_arrays(
+            [
+                _strings(np.zeros(n, dtype=np.int64), ["com.GlyphexGames.EmojiOracle"]),
+                _strings(np.zeros(n, dtype=np.int64), ["com.android.vending"]),
+                _strings(version, VERSIONS),
+            ],
+            names=["id", "install_source", "version"],
+        ),
+        "platform": _strings(np.zeros(n, dtype=np.int64), ["ANDROID"]),
+    }
+    return pa.table(columns)
+
+
+def write_synthetic_store(
+    data_dir: str,
+    manifest_path: str,
+    events: int,
+    start_date: date,
+    days: int = 14,
+    users: Optional[int] = None,
+    seed: int = 0,
+) -> dict[str, Any]:
+    """Write `events` synthetic events over `days` daily tables and their manifest.
+
+    `users` defaults to one per `EVENTS_PER_USER` events. Returns the manifest.
+    """
+    users = users or max(1, events // EVENTS_PER_USER)
+    rng = np.random.default_rng(seed)
+    pool = _user_pool(users, days, rng)
+    per_day = np.full(days, events // days)
+    per_day[: events % days] += 1
+
+    tables = {}
+    for i in range(days):
+        day = start_date + timedelta(days=i)
+        table = synthetic_day(day, i, days, int(per_day[i]), pool, np.random.default_rng([seed, i]))
+        name = f"events_{day.strftime('%Y%m%d')}"
+        path = os.path.join(data_dir, table_file(name))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        pq.write_table(table, path)
+        tables[name] = describe_parquet(data_dir, table_file(name), source_rows=table.num_rows)
+
+    manifest = {"version": MANIFEST_VERSION, "tables": tables}
+    save_manifest(manifest_path, manifest)
+    logger.info(f"Wrote {sum(per_day)} synthetic events for {users} users over {days} days to {data_dir}.")
+    return manifest
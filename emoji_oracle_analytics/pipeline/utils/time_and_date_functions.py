@@ -1,13 +1,60 @@
+import json
+
 import pandas as pd
 import numpy as np
 import datetime as dt
 
 from emoji_oracle_analytics.config.logging import get_logger
+from emoji_oracle_analytics.pipeline.utils.sessions import add_session_times, is_session_sorted, sort_by_session
 
 logger = get_logger(__name__)
 
+DATE_TIME_BASES = ['event', 'event_previous', 'event_first_touch', 'user__first_open']
+
+# Date columns the splits, KPIs and plots read; in "compact" mode the other
+# `_date` columns are only derived when listed in `pipeline_targets`.
+READ_DATE_COLUMNS = ['event_date']
+
+_SECONDS_PER_DAY = 86_400
+
+# Lookup tables of add_time_based_features, indexed by integer codes
+WEEKDAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+DAYPARTS = ['Gece', 'Sabah', 'Öğle', 'Öğleden Sonra', 'Akşam']
+# Daypart of each local hour: night before 6 and after 22, morning until 11,
+# noon until 14, afternoon until 17, evening until 23
+HOUR_DAYPARTS = np.array([0] * 6 + [1] * 5 + [2] * 3 + [3] * 3 + [4] * 6 + [0])
+WEEKEND_LABELS = ['Hafta İçi', 'Hafta Sonu']
+WEEKDAY_WEEKEND = np.array([0, 0, 0, 0, 0, 1, 1])
+
+
+def time_features_fingerprint(context: dict) -> str:
+    """The settings that change which date/time columns are derived, as a stable string."""
+    mode = context.get("time_features", "compact")
+    declared = sorted(set(context.get("pipeline_targets") or []) & {f'{b}_date' for b in DATE_TIME_BASES})
+    return json.dumps({"time_features": mode, "declared_dates": declared})
+
+
+def seconds_of_day(datetimes: pd.Series) -> pd.Series:
+    """Seconds since midnight (UTC) as Int32, missing where the datetime is."""
+    index = pd.DatetimeIndex(datetimes)
+    per_second = int(np.timedelta64(1, 's') / np.timedelta64(1, index.unit))
+    seconds = (index.asi8 // per_second) % _SECONDS_PER_DAY
+    values = pd.arrays.IntegerArray(seconds.astype(np.int32), np.asarray(index.isna()))
+    return pd.Series(values, index=datetimes.index)
+
+
 def transform_datetime_fields(df: pd.DataFrame, context=None) -> pd.DataFrame:
-    """Clean and transform timestamp and date/time-related columns."""
+    """Clean and transform timestamp and date/time-related columns.
+
+    With `time_features` "compact" (the default), the `_time` columns are
+    Int32 seconds since midnight instead of one `datetime.time` object per row,
+    and of the `_date` columns only those read downstream (`READ_DATE_COLUMNS`)
+    or declared in `pipeline_targets` are derived. "full" keeps the `time`
+    objects and every `_date` column.
+    """
+    context = context or {}
+    compact = context.get("time_features", "compact") == "compact"
+    declared = set(context.get("pipeline_targets") or [])
     
     # Drop redundant or conflicting columns
     df = df.drop(columns=['event_date'], errors='ignore')
@@ -21,8 +68,10 @@ def transform_datetime_fields(df: pd.DataFrame, context=None) -> pd.DataFrame:
         
     }
     
+    # Source columns can be absent from a single day's events (see processed_cache).
+    missing = pd.Series(np.nan, index=df.index)
     for new_col, (src_col, unit) in time_fields.items():
-        df[new_col] = pd.to_datetime(df[src_col], unit=unit, utc=True)
+        df[new_col] = pd.to_datetime(df.get(src_col, missing), unit=unit, utc=True)
     
     # Time delta in seconds
     df['time_delta'] = (
@@ -30,16 +79,21 @@ def transform_datetime_fields(df: pd.DataFrame, context=None) -> pd.DataFrame:
     ).dt.total_seconds()
     
     # Derive normalized date/time components
-    for base in ['event', 'event_previous', 'event_first_touch', 'user__first_open']:
-        # Use floor("D") instead of normalize() to keep behavior equivalent and
-        # avoid Pylance/stub false-positives about DatetimeProperties.normalize.
-        df[f'{base}_date'] = df[f'{base}_datetime'].dt.floor('D')
-        df[f'{base}_time'] = df[f'{base}_datetime'].dt.time
+    for base in DATE_TIME_BASES:
+        date_col, time_col = f'{base}_date', f'{base}_time'
+        if not compact or date_col in READ_DATE_COLUMNS or date_col in declared:
+            # Use floor("D") instead of normalize() to keep behavior equivalent and
+            # avoid Pylance/stub false-positives about DatetimeProperties.normalize.
+            df[date_col] = df[f'{base}_datetime'].dt.floor('D')
+        if compact:
+            df[time_col] = seconds_of_day(df[f'{base}_datetime'])
+        else:
+            df[time_col] = df[f'{base}_datetime'].dt.time
 
     # Unit conversions and renames
-    df['device__time_zone_offset_hours'] = df['device__time_zone_offset_seconds'] / 3600
-    df['event_params__engagement_time_seconds'] = df['event_params__engagement_time_msec'] / 1000
-    df['event_server_delay_seconds'] = df['event_server_timestamp_offset'] / 1000
+    df['device__time_zone_offset_hours'] = df.get('device__time_zone_offset_seconds', missing) / 3600
+    df['event_params__engagement_time_seconds'] = df.get('event_params__engagement_time_msec', missing) / 1000
+    df['event_server_delay_seconds'] = df.get('event_server_timestamp_offset', missing) / 1000
     df['event_params__time_spent_seconds'] = df.get('event_params__time_spent')
 
     logger.info("Date/time cleanup and transformation complete.")
@@ -49,69 +103,54 @@ def transform_datetime_fields(df: pd.DataFrame, context=None) -> pd.DataFrame:
 
 
 def add_time_based_features(df: pd.DataFrame, context=None) -> pd.DataFrame:
-    """Add time-based features derived from event_datetime and time zone offset."""
-    
-    # Ensure datetime and offset fields exist
-    if 'event_datetime' not in df or 'device__time_zone_offset_hours' not in df:
-        raise KeyError("Required columns 'event_datetime' or 'device__time_zone_offset_hours' missing.")
+    """Add time-based features derived from event_datetime and time zone offset.
+
+    Weekday, daypart and weekend labels are categoricals built from integer
+    codes through the `WEEKDAYS`, `HOUR_DAYPARTS` and `WEEKDAY_WEEKEND` lookup
+    tables; the local time shifts the int64 timestamps by the integer
+    `device__time_zone_offset_seconds` (0 where it is missing).
+    """
     
-    # Weekday name (ordered categorical)
-    df['ts_weekday'] = pd.Categorical(
-        df['event_datetime'].dt.day_name(),
-        categories=['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday'],
-        ordered=True
-    )
+    # Ensure the datetime field exists
+    if 'event_datetime' not in df:
+        raise KeyError("Required column 'event_datetime' missing.")
 
-    # Local timestamp and derived hour
-    df['ts_local_time'] = df['event_datetime'] + pd.to_timedelta(
-        df['device__time_zone_offset_hours'].fillna(0), unit='h'
-    )
-    df['ts_hour'] = df['ts_local_time'].dt.hour
-
-    # Named daypart (Turkish)
-    def _daytime_label(hour: int) -> str:
-        if hour < 6 or hour > 22:
-            return 'Gece'
-        elif hour < 11:
-            return 'Sabah'
-        elif hour < 14:
-            return 'Öğle'
-        elif hour < 17:
-            return 'Öğleden Sonra'
-        else:
-            return 'Akşam'
+    index = pd.DatetimeIndex(df['event_datetime'])
+    per_second = int(np.timedelta64(1, 's') / np.timedelta64(1, index.unit))
+    times = index.asi8
+    missing = np.asarray(index.isna())
 
-    df['ts_daytime_named'] = df['ts_hour'].apply(_daytime_label)
+    # Weekday of the UTC timestamp (1970-01-01 was a Thursday)
+    weekday = np.where(missing, -1, (times // (per_second * _SECONDS_PER_DAY) + 3) % 7)
+    df['ts_weekday'] = pd.Categorical.from_codes(weekday, categories=WEEKDAYS)
 
-    # Weekend / weekday flag (Turkish)
-    df['ts_is_weekend'] = df['ts_weekday'].astype(str).apply(
-        lambda x: 'Hafta Sonu' if x in ['Saturday', 'Sunday'] else 'Hafta İçi'
+    # Local timestamp and derived hour
+    if 'device__time_zone_offset_seconds' in df:
+        offset = df['device__time_zone_offset_seconds'].fillna(0).to_numpy(dtype=np.int64)
+    else:
+        offset = np.zeros(len(df), dtype=np.int64)
+    local = np.where(missing, times, times + offset * per_second)
+    df['ts_local_time'] = pd.Series(
+        pd.DatetimeIndex(local.view(f'M8[{index.unit}]')).tz_localize('UTC').tz_convert(index.tz),
+        index=df.index,
     )
+    hour = ((local // per_second) % _SECONDS_PER_DAY // 3600).astype(np.int32)
+    df['ts_hour'] = pd.arrays.IntegerArray(hour, missing) if missing.any() else hour
 
-    # Convert weekday to string for consistency
-    df['ts_weekday'] = df['ts_weekday'].astype(str)
+    # Named daypart and weekend / weekday flag (Turkish)
+    df['ts_daytime_named'] = pd.Categorical.from_codes(
+        np.where(missing, -1, HOUR_DAYPARTS[hour]), categories=DAYPARTS
+    )
+    df['ts_is_weekend'] = pd.Categorical.from_codes(
+        np.where(missing, -1, WEEKDAY_WEEKEND[weekday]), categories=WEEKEND_LABELS
+    )
 
     logger.info("Time-based features added successfully.")
     return df
 
 
 def add_durations(df: pd.DataFrame, context=None) -> pd.DataFrame:
-
-    def _squeeze_1d(value, *, label: str) -> pd.Series:
-        """Coerce a groupby/apply result into a 1D Series.
-
-        Local environments can sometimes end up with duplicate column names or
-        pandas returning a single-column DataFrame from apply/reindex.
-        """
-        if isinstance(value, pd.Series):
-            return value
-        if isinstance(value, pd.DataFrame):
-            if value.shape[1] == 1:
-                return value.iloc[:, 0]
-            raise ValueError(f"Expected 1D result for {label}, got DataFrame with shape={value.shape}")
-        # Fall back to Series constructor for array-likes/scalars
-        return pd.Series(value)
-
+    """Add session and event durations; sorts the rows by session unless they already are (see sessions)."""
     # If upstream filters removed all events, keep the pipeline moving with empty outputs.
     if df.empty:
         df['session_duration_seconds'] = pd.Series(dtype='float64')
@@ -126,52 +165,9 @@ def add_durations(df: pd.DataFrame, context=None) -> pd.DataFrame:
     # Ensure event_datetime is in datetime format
     df['event_datetime'] = pd.to_datetime(df['event_datetime'])
 
-    # Firebase assigns these events at the last session's end, hence the messy logic
-    exclude_session_end_events = ['app_remove', 'app_update', 'app_clear_data']
-
-    # Calculate session duration (ignoring session-end events)
-    grouped = df.groupby(['user_pseudo_id', 'event_params__ga_session_id'])
-    try:
-        durations = grouped.apply(
-            lambda g: (
-                g.loc[~g['event_name'].isin(exclude_session_end_events), 'event_datetime'].max()
-                - g.loc[g['event_name'] == 'session_start', 'event_datetime'].min()
-            ).total_seconds()
-            if not g.loc[g['event_name'] == 'session_start'].empty else np.nan,
-            include_groups=False,
-        )
-    except TypeError:
-        durations = grouped.apply(
-            lambda g: (
-                g.loc[~g['event_name'].isin(exclude_session_end_events), 'event_datetime'].max()
-                - g.loc[g['event_name'] == 'session_start', 'event_datetime'].min()
-            ).total_seconds()
-            if not g.loc[g['event_name'] == 'session_start'].empty else np.nan
-        )
-
-    if not df.columns.is_unique:
-        dupes = df.columns[df.columns.duplicated()].unique().tolist()
-        logger.warning("DataFrame has duplicate columns (showing up to 20): %s", dupes[:20])
-
-    durations = _squeeze_1d(durations, label="durations")
-
-    session_index = df.set_index(['user_pseudo_id', 'event_params__ga_session_id']).index
-    aligned = _squeeze_1d(durations.reindex(session_index), label="durations.reindex(session_index)")
-
-    # Ensure a flat 1D numpy array for assignment.
-    df['session_duration_seconds'] = pd.to_numeric(aligned, errors='coerce').round(3).to_numpy()
-    df['session_duration_minutes'] = (df['session_duration_seconds'] / 60).round(2)
-    df['session_duration_hours'] = (df['session_duration_seconds'] / 3600).round(3)
-    # Session start and end times
-    df['session_start_time'] = df.groupby(['user_pseudo_id', 'event_params__ga_session_id'])['event_datetime'].transform('min')
-    df['session_end_time'] = df.groupby(['user_pseudo_id', 'event_params__ga_session_id'])['event_datetime'].transform('max')
-    logger.info(f"Session IDs assigned and durations calculated for {df['event_params__ga_session_id'].nunique()} unique sessions.")
-
-    # Calculate event duration within sessions
-    df = df.sort_values(by=['user_pseudo_id', 'event_params__ga_session_id', 'event_datetime'])
-    df['event_duration_seconds'] = df.groupby(['user_pseudo_id', 'event_params__ga_session_id'])['event_datetime'].shift(-1) - df['event_datetime']
-    df['event_duration_seconds'] = df['event_duration_seconds'].dt.total_seconds().fillna(0).round(3)
-    logger.info("Event durations within sessions calculated successfully.")
+    # Every duration is a pass over rows sorted by session and time
+    if not is_session_sorted(context):
+        df = sort_by_session(df)
+    df = add_session_times(df)
+    logger.info(f"Durations calculated for {df['session_start_time'].notna().sum()} sessioned events.")
     return df
-
-
@@ -0,0 +1,138 @@
+"""Integer keys for users and sessions.
+
+`user_pseudo_id` is a 32-character hex string and sessions are identified by
+the pair (`user_pseudo_id`, `event_params__ga_session_id`), so every
+per-user and per-session groupby, sort and merge hashes and compares strings.
+This module maps each user to a stable int32 code and packs the code with the
+session id into one int64 key:
+
+- `user_code`: index of the user in an append-only JSON list stored next to
+  the parquet store. Codes never change once assigned, so they can be
+  compared across runs and across cached days.
+- `session_key`: `user_code << 32 | ga_session_id`. GA session ids are the
+  session start in Unix seconds and fit in 32 bits. The key is missing when
+  either part is missing, which groupbys drop just as they drop a missing
+  user or session id. Malformed session ids outside the 32-bit range are
+  logged and get a missing key rather than failing the run.
+
+When `sessions.infer_sessions` ran, sessions are identified by
+`inferred_session_id` instead of the GA session id (the two agree wherever
+the GA id is present) and `session_key` packs that id.
+
+Both columns are internal; the split dataframes keep showing the original ids.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from emoji_oracle_analytics.config.logging import get_logger
+from emoji_oracle_analytics.pipeline.utils.manifest import atomic_replace, temp_path
+
+logger = get_logger(__name__)
+
+USER_COLUMN = "user_pseudo_id"
+SESSION_COLUMN = "event_params__ga_session_id"
+USER_CODE = "user_code"
+SESSION_KEY = "session_key"
+INFERRED_SESSION_COLUMN = "inferred_session_id"
+
+# user_code for rows without a user_pseudo_id.
+MISSING_USER = -1
+
+_SESSION_BITS = 32
+
+
+def load_user_codes(path: Optional[str]) -> list[str]:
+    """Users in code order (the code of a user is its position)."""
+    if path and os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)["users"]
+    return []
+
+
+def save_user_codes(path: str, users: list[str]) -> None:
+    tmp = temp_path(path)
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"users": users}, f)
+    atomic_replace(tmp, path)
+
+
+def encode_users(ids: pd.Series, users: list[str]) -> tuple[np.ndarray, list[str]]:
+    """int32 codes for `ids`, appending unseen users to `users`."""
+    present = ids.notna()
+    codes = pd.Index(users, dtype=object).get_indexer(ids.astype(object))
+
+    unseen = present.to_numpy() & (codes == -1)
+    if unseen.any():
+        new_users = sorted(pd.unique(ids[unseen].astype(str)))
+        users = users + new_users
+        codes = pd.Index(users, dtype=object).get_indexer(ids.astype(object))
+
+    if len(users) > np.iinfo(np.int32).max:
+        raise ValueError(f"{len(users)} users do not fit in int32 user codes.")
+    codes = np.where(present, codes, MISSING_USER).astype(np.int32)
+    return codes, users
+
+
+def pack_session_key(user_code: pd.Series, session_id: pd.Series) -> pd.Series:
+    """int64 `user_code << 32 | session_id`, missing where either part is missing.
+
+    Session ids outside [0, 2**32) are treated as missing.
+    """
+    session = pd.to_numeric(session_id, errors="coerce").astype("Int64")
+    out_of_range = ((session < 0) | (session >= 1 << _SESSION_BITS)).fillna(False)
+    if out_of_range.any():
+        logger.warning(f"{out_of_range.sum()} {SESSION_COLUMN} values are outside the {_SESSION_BITS}-bit range "
+                       f"of session keys; their session key is left missing.")
+        session = session.mask(out_of_range)
+
+    user = pd.Series(user_code, index=session.index).astype("Int64")
+    user = user.mask(user == MISSING_USER)
+    return (user * (1 << _SESSION_BITS) + session).astype("Int64")
+
+
+def add_user_keys(df: pd.DataFrame, context=None) -> pd.DataFrame:
+    """Add `user_code` and `session_key`, registering users seen for the first time."""
+    context = context or {}
+    if USER_COLUMN not in df.columns:
+        logger.warning(f"'{USER_COLUMN}' not found; no user keys added.")
+        return df
+
+    path = context.get("user_codes_path")
+    users = load_user_codes(path)
+    codes, updated = encode_users(df[USER_COLUMN], users)
+    df[USER_CODE] = codes
+
+    if SESSION_COLUMN in df.columns:
+        df[SESSION_KEY] = pack_session_key(df[USER_CODE], df[SESSION_COLUMN])
+    else:
+        df[SESSION_KEY] = pd.Series(pd.NA, index=df.index, dtype="Int64")
+
+    if len(updated) > len(users):
+        logger.info(f"Registered {len(updated) - len(users)} new users ({len(updated)} in total).")
+        if path:
+            save_user_codes(path, updated)
+    return df
+
+
+def session_id_column(df: pd.DataFrame) -> str:
+    """Column with a user's session id: the inferred id when present, else the GA id."""
+    return INFERRED_SESSION_COLUMN if INFERRED_SESSION_COLUMN in df.columns else SESSION_COLUMN
+
+
+def session_keys(df: pd.DataFrame) -> list[str]:
+    """Columns identifying a session: the packed key when present, else the id pair."""
+    if SESSION_KEY in df.columns:
+        return [SESSION_KEY]
+    return [USER_COLUMN, session_id_column(df)]
+
+
+def user_key(df: pd.DataFrame) -> str:
+    """Column identifying a user: the integer code when present, else the id."""
+    return USER_CODE if USER_CODE in df.columns else USER_COLUMN
@@ -0,0 +1,71 @@
+"""Ordering of app version strings.
+
+Versions such as "1.0.12" do not sort as strings ("1.0.12" < "1.0.3"), and
+comparing them part by part for every event row repeats the same split and
+int parsing for the handful of versions a dataset holds. Here each distinct
+version is parsed once into an integer key with the same order as comparing
+the tuples of its parts (what `main_functions.vers` does):
+
+- each of up to four parts takes 15 bits, most significant first
+- the number of parts breaks ties, so "1.0" < "1.0.0" as with tuples
+
+"Version >= X" is then a single integer comparison on a column of keys.
+Strings that are not dotted integers get no key and never pass a filter.
+"""
+
+from __future__ import annotations
+
+from typing import Optional
+
+import pandas as pd
+
+_MAX_PARTS = 4
+_PART_BITS = 15
+_LENGTH_BITS = 3
+
+
+def parse_version(version) -> Optional[int]:
+    """Sortable integer key of a dotted version string, or None if it is not one."""
+    if version is None or pd.isna(version):
+        return None
+    try:
+        parts = [int(part) for part in str(version).split(".")]
+    except ValueError:
+        return None
+    if len(parts) > _MAX_PARTS or any(not 0 <= part < 1 << _PART_BITS for part in parts):
+        return None
+
+    key = 0
+    for part in parts + [0] * (_MAX_PARTS - len(parts)):
+        key = (key << _PART_BITS) | part
+    return (key << _LENGTH_BITS) | len(parts)
+
+
+def version_keys(values: pd.Series) -> pd.Series:
+    """Nullable Int64 key per row, parsing each distinct version once."""
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        codes, uniques = values.cat.codes.to_numpy(), values.cat.categories
+    else:
+        codes, uniques = pd.factorize(values)
+    keys = pd.array([parse_version(v) for v in uniques], dtype="Int64")
+    return pd.Series(keys.take(codes, allow_fill=True), index=values.index, name=values.name)
+
+
+def version_at_least(values: pd.Series, minimum: str) -> pd.Series:
+    """Boolean mask of rows whose version is >= `minimum`."""
+    minimum_key = parse_version(minimum)
+    if minimum_key is None:
+        raise ValueError(f"'{minimum}' is not a version.")
+    return (version_keys(values) >= minimum_key).fillna(False).astype(bool)
+
+
+def version_dtype(values) -> pd.CategoricalDtype:
+    """Ordered categorical dtype listing the distinct versions in version order.
+
+    Strings that are not versions come first, in string order.
+    """
+    distinct = pd.Series(pd.unique(pd.Series(values).dropna().astype(str)), dtype=object)
+    keys = version_keys(distinct)
+    invalid = sorted(distinct[keys.isna()])
+    valid = distinct[keys.notna()].iloc[keys.dropna().to_numpy(dtype="int64").argsort(kind="stable")]
+    return pd.CategoricalDtype(invalid + valid.tolist(), ordered=True)
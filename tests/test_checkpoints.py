@@ -0,0 +1,62 @@
+import pandas as pd
+import pytest
+
+from emoji_oracle_analytics.pipeline.utils.checkpoints import (
+    evict_checkpoints,
+    load_checkpoint_index,
+    save_checkpoint,
+)
+from emoji_oracle_analytics.pipeline.utils.stage_graph import Stage, run_stages
+
+CALLS = []
+
+
+def _double(df, context=None):
+    CALLS.append("double")
+    df["b"] = df["a"] * 2
+    return df
+
+
+def _label(df, context=None):
+    CALLS.append("label")
+    df["c"] = df["b"].map({2: "two", 4: "four"})
+    return df
+
+
+STAGES = [
+    Stage(_double, "b", requires=("a",), writes=("b",)),
+    Stage(_label, "c", requires=("b",), writes=("c",)),
+]
+
+
+def test_run_stages_resumes_from_checkpoints_and_invalidates_from_a_stage(tmp_path):
+    context = {"checkpoints": True, "checkpoint_dir": str(tmp_path)}
+    df = pd.DataFrame({"a": [1, 2]})
+    CALLS.clear()
+
+    first = run_stages(df.copy(), STAGES, context, checkpoint_key="input")
+    resumed = run_stages(df.copy(), STAGES, context, checkpoint_key="input")
+    assert CALLS == ["double", "label"]
+    pd.testing.assert_frame_equal(resumed, first)
+
+    rerun = run_stages(df.copy(), STAGES, {**context, "invalidate_from": "_label"}, checkpoint_key="input")
+    assert CALLS == ["double", "label", "label"]
+    pd.testing.assert_frame_equal(rerun, first)
+
+    run_stages(df.copy(), STAGES, context, checkpoint_key="other input")
+    assert CALLS == ["double", "label", "label", "double", "label"]
+
+    with pytest.raises(ValueError):
+        run_stages(df.copy(), STAGES, {**context, "invalidate_from": "nope"}, checkpoint_key="input")
+
+
+def test_checkpoints_use_arrow_when_possible_and_evict_least_recently_used(tmp_path):
+    index = load_checkpoint_index(str(tmp_path))
+    save_checkpoint(str(tmp_path), index, "numbers", pd.DataFrame({"a": [1.5, 2.5]}), ["first"])
+    save_checkpoint(str(tmp_path), index, "objects", pd.DataFrame({"a": [1, None]}, dtype=object), ["second"])
+    assert index["entries"]["numbers"]["format"] == "arrow"
+    assert index["entries"]["objects"]["format"] == "pickle"
+
+    evict_checkpoints(str(tmp_path), index, max_bytes=index["entries"]["objects"]["bytes"])
+    assert list(index["entries"]) == ["objects"]
+    assert list(load_checkpoint_index(str(tmp_path))["entries"]) == ["objects"]
@@ -0,0 +1,86 @@
+from datetime import date
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+from emoji_oracle_analytics.pipeline.utils.filters import apply_event_filters, scan_predicate
+
+CONTEXT = {
+    "event_filters": ["date", "country", "user", "version"],
+    "start_date": date(2025, 12, 1),
+    "country": ["Germany", "Spain"],
+    "not_user": ["u3"],
+    "version_filter": "1.0.10",
+}
+START = pd.Timestamp("2025-12-01", tz="UTC").value // 1000
+
+
+def test_apply_event_filters_combines_clauses_and_skips_empty_ones():
+    df = pd.DataFrame(
+        {
+            "event_timestamp": [START - 1, START, START, START, START],
+            "geo__country": ["Germany", "Germany", "France", "Spain", "Spain"],
+            "user_pseudo_id": ["u1", "u2", "u2", "u3", "u4"],
+            "app_info__version": ["1.0.12", "1.0.12", "1.0.12", "1.0.12", "1.0.9"],
+        }
+    )
+
+    assert apply_event_filters(df, CONTEXT)["user_pseudo_id"].tolist() == ["u2"]
+    loose = {**CONTEXT, "country": [], "version_filter": None}
+    assert apply_event_filters(df, loose)["user_pseudo_id"].tolist() == ["u2", "u2", "u4"]
+    assert apply_event_filters(df, {**CONTEXT, "event_filters": []}) is df
+
+
+def test_scan_predicate_matches_the_frame_mask():
+    table = pa.table(
+        {
+            "table_date": ["20251130", "20251201", "20251201", "20251201"],
+            "event_timestamp": [START - 1, START, START, START],
+            "geo": [{"country": c} for c in ["Germany", "Germany", "Spain", "Spain"]],
+            "user_pseudo_id": ["u1", "u2", "u3", "u4"],
+            "app_info": [{"version": v} for v in ["1.0.12", "1.0.12", "1.0.12", "1.0.2"]],
+        }
+    )
+    dataset = ds.dataset(table)
+
+    kept = dataset.to_table(filter=scan_predicate(dataset, CONTEXT))
+
+    assert kept.column("user_pseudo_id").to_pylist() == ["u2"]
+
+
+def test_scan_predicate_logs_clause_counts_from_one_scan(caplog):
+    class CountingDataset:
+        def __init__(self, dataset):
+            self.dataset, self.scans = dataset, 0
+
+        def to_batches(self, **kwargs):
+            self.scans += 1
+            return self.dataset.to_batches(**kwargs)
+
+        def __getattr__(self, name):
+            self.scans += name in ("count_rows", "to_table", "scanner")
+            return getattr(self.dataset, name)
+
+    table = pa.table(
+        {
+            "table_date": ["20251130", "20251201", "20251201", "20251201"],
+            "event_timestamp": [START - 1, START, START, START],
+            "geo": [{"country": c} for c in ["Germany", "Germany", "Germany", "Spain"]],
+            "user_pseudo_id": ["u1", "u2", "u3", "u4"],
+            "app_info": [{"version": v} for v in ["1.0.12", "1.0.12", "1.0.12", "1.0.2"]],
+        }
+    )
+    dataset = CountingDataset(ds.dataset(table))
+
+    with caplog.at_level("INFO"):
+        scan_predicate(dataset, CONTEXT)
+
+    assert dataset.scans == 1
+    lines = [r.getMessage() for r in caplog.records if r.getMessage().startswith("Scan filtered")]
+    assert [line.split(" based")[0] for line in lines] == [
+        "Scan filtered events from 4 to 3",
+        "Scan filtered events from 3 to 3",
+        "Scan filtered events from 3 to 2",
+        "Scan filtered events from 2 to 1",
+    ]
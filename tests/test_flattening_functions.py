@@ -0,0 +1,93 @@
+import pandas as pd
+import pyarrow as pa
+
+
+def _flatten_both(df):
+    from emoji_oracle_analytics.pipeline.utils.flattening_functions import flatten_dataframe
+
+    rows = flatten_dataframe(df, {"flatten_engine": "rows"})
+    arrow = flatten_dataframe(df, {"flatten_engine": "arrow"})
+    return rows, arrow
+
+
+def test_arrow_flattening_matches_flatten_row_on_python_objects():
+    df = pd.DataFrame(
+        [
+            {
+                "event_timestamp": 1,
+                "event_name": "a",
+                "event_params": [
+                    {"key": "level", "value": {"int_value": 1}},
+                    {"key": "mode", "value": {"string_value": "x", "int_value": 9}},
+                    {"key": "level", "value": {"int_value": 2}},
+                    {"key": "", "value": {"int_value": 3}},
+                ],
+                "user_properties": [{"key": "tier", "value": {"double_value": 1.5}}],
+                "device": '{"category": "mobile"}',
+                "geo": None,
+                "items": [],
+            },
+            {
+                "event_timestamp": 2,
+                "event_name": "b",
+                "event_params": [
+                    {"key": "mode", "value": {"int_value": 4}},
+                    {"key": "flag", "value": {"int_value": None}},
+                    {"key": "extra", "value": None},
+                ],
+                "user_properties": [],
+                "device": {"category": "tablet"},
+                "geo": {"country": "US"},
+                "items": [{"item_id": "sku"}],
+            },
+        ]
+    )
+
+    rows, arrow = _flatten_both(df)
+
+    pd.testing.assert_frame_equal(rows, arrow)
+    assert arrow.loc[0, "event_params.level"] == 2
+    assert list(arrow["event_params.mode"]) == ["x", 4]
+
+
+def test_arrow_flattening_matches_flatten_row_on_arrow_columns():
+    from emoji_oracle_analytics.pipeline.utils.pull_functions import events_to_pandas, normalize_bq_types
+
+    params = [
+        [{"key": "score", "value": {"int_value": 5}}, {"key": "ratio", "value": {"double_value": 0.5}}],
+        None,
+        [{"key": "score", "value": {"string_value": "high"}}],
+    ]
+    table = pa.table(
+        {
+            "event_timestamp": [1, 2, 3],
+            "event_params": params,
+            "geo": [{"country": "US", "city": None}, None, {"country": "DE", "city": "Berlin"}],
+        }
+    )
+    df = events_to_pandas(normalize_bq_types(table))
+
+    rows, arrow = _flatten_both(df)
+
+    pd.testing.assert_frame_equal(rows, arrow)
+
+
+def test_chunked_flattening_in_processes_matches_single_pass():
+    from emoji_oracle_analytics.pipeline.utils.flattening_functions import flatten_dataframe
+
+    df = pd.DataFrame(
+        {
+            "event_timestamp": range(6),
+            "event_params": [
+                [{"key": "score", "value": {"int_value": i}}] if i < 3 else
+                [{"key": "label", "value": {"string_value": f"l{i}"}}, {"key": "score", "value": {"string_value": "x"}}]
+                for i in range(6)
+            ],
+            "geo": [{"country": "US"} if i % 2 else None for i in range(6)],
+        }
+    )
+
+    single = flatten_dataframe(df, {"flatten_engine": "rows"})
+    chunked = flatten_dataframe(df, {"flatten_workers": 2, "flatten_chunk_rows": 2})
+
+    pd.testing.assert_frame_equal(single, chunked)
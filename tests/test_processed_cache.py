@@ -0,0 +1,95 @@
+import os
+from datetime import date
+
+import pandas as pd
+
+from emoji_oracle_analytics.pipeline.utils import processed_cache
+from emoji_oracle_analytics.pipeline.utils.manifest import describe_parquet
+from emoji_oracle_analytics.pipeline.utils.parquet_store import table_file
+
+
+def _write_raw(data_dir, table_name, n, params=None):
+    day = table_name.rsplit("_", 1)[1]
+    df = pd.DataFrame(
+        {
+            "event_timestamp": [pd.Timestamp(day, tz="UTC").value // 1000 + i for i in range(n)],
+            "event_name": ["test"] * n,
+            "user_pseudo_id": [f"u{i}" for i in range(n)],
+            "event_params": params or [[{"key": "spent_to", "value": {"string_value": "potion"}}]] * n,
+        }
+    )
+    path = os.path.join(data_dir, table_file(table_name))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    df.to_parquet(path)
+    return describe_parquet(data_dir, table_file(table_name))
+
+
+def test_load_processed_events_reuses_unchanged_days(tmp_path, monkeypatch):
+    raw_dir = tmp_path / "raw"
+    manifest = {
+        "tables": {
+            "events_20251201": _write_raw(str(raw_dir), "events_20251201", 2),
+            "events_20251202": _write_raw(str(raw_dir), "events_20251202", 3),
+        }
+    }
+    monkeypatch.setattr(processed_cache, "sync_store", lambda context: manifest)
+
+    processed = []
+    real_process_table = processed_cache.process_table
+
+    def counting_process_table(data_dir, raw_file, context):
+        processed.append(raw_file)
+        return real_process_table(data_dir, raw_file, context)
+
+    monkeypatch.setattr(processed_cache, "process_table", counting_process_table)
+    context = {
+        "data_dir": str(raw_dir),
+        "processed_dir": str(tmp_path / "processed"),
+        "start_date": date(2025, 12, 1),
+    }
+
+    first = processed_cache.load_processed_events(pd.DataFrame(), context)
+    assert len(processed) == 2
+    assert len(first) == 5
+    assert (first["event_params__spent_to"] == "Consumable Item").all()
+
+    processed.clear()
+    second = processed_cache.load_processed_events(pd.DataFrame(), context)
+    assert processed == []
+    pd.testing.assert_frame_equal(first, second)
+
+    manifest["tables"]["events_20251202"] = _write_raw(str(raw_dir), "events_20251202", 4)
+    third = processed_cache.load_processed_events(pd.DataFrame(), context)
+    assert processed == [table_file("events_20251202")]
+    assert len(third) == 6
+
+
+def test_load_processed_events_reprocesses_days_when_a_type_widens(tmp_path, monkeypatch):
+    raw_dir = tmp_path / "raw"
+
+    def level(value):
+        return [[{"key": "level_name", "value": {"string_value": value}}]]
+
+    manifest = {
+        "tables": {
+            "events_20251201": _write_raw(str(raw_dir), "events_20251201", 1, level("12")),
+            "events_20251202": _write_raw(str(raw_dir), "events_20251202", 1, level("boss")),
+        }
+    }
+    monkeypatch.setattr(processed_cache, "sync_store", lambda context: manifest)
+    context = {
+        "data_dir": str(raw_dir),
+        "processed_dir": str(tmp_path / "processed"),
+        "param_schema_path": str(tmp_path / "param_schema.json"),
+        "start_date": date(2025, 12, 1),
+    }
+
+    first = processed_cache.load_processed_events(pd.DataFrame(), context)
+    # The first day was typed float64, then reprocessed once the second widened the key
+    assert first["event_params__level_name"].tolist() == ["12", "boss"]
+
+    processed = []
+    monkeypatch.setattr(processed_cache, "process_table", lambda *args: processed.append(args))
+    second = processed_cache.load_processed_events(pd.DataFrame(), context)
+    assert processed == []
+    pd.testing.assert_frame_equal(first, second)
@@ -0,0 +1,30 @@
+import json
+
+import pandas as pd
+
+from emoji_oracle_analytics.pipeline.utils.profiling import run_profiled, save_profile
+
+
+def _add_column(df, context=None):
+    df = df.copy()
+    df["b"] = df["a"] + 1
+    return df
+
+
+def test_run_profiled_records_only_when_profiling(tmp_path):
+    df = pd.DataFrame({"a": [1, 2, 3]})
+
+    assert run_profiled({}, "stage", "add", _add_column, df=df)["b"].tolist() == [2, 3, 4]
+
+    context = {"profile_records": []}
+    run_profiled(context, "stage", "add", _add_column, df=df, context=context)
+    run_profiled(context, "plot", "title", lambda title, frame: f"<div>{title}</div>", "t", df)
+    stage, plot = context["profile_records"]
+    assert (stage["rows_in"], stage["cols_in"], stage["rows_out"], stage["cols_out"]) == (3, 1, 3, 2)
+    assert stage["wall_s"] >= 0 and stage["frame_mb"] is not None
+    assert (plot["rows_in"], plot["rows_out"]) == (3, None)
+
+    json_path = save_profile(context["profile_records"], str(tmp_path))
+    with open(json_path) as f:
+        assert [r["name"] for r in json.load(f)["records"]] == ["add", "title"]
+    assert len(list(tmp_path.glob("profile_*.csv"))) == 1
@@ -0,0 +1,387 @@
+import json
+import re
+from datetime import date
+from types import SimpleNamespace
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+class _QueryResult(list):
+    def __init__(self, rows=(), frame=None):
+        super().__init__(rows)
+        self._frame = frame
+        self._page_size = None
+
+    def result(self, page_size=None):
+        self._page_size = page_size
+        return self
+
+    def to_arrow_iterable(self):
+        table = pa.Table.from_pandas(self._frame, preserve_index=False)
+        return iter(table.to_batches(max_chunksize=self._page_size))
+
+
+class FakeBigQueryClient:
+    """Local stand-in for `bigquery.Client` serving in-memory daily tables."""
+
+    def __init__(self, tables, last_modified=None):
+        self.tables = tables
+        self.last_modified = last_modified or {}
+        self.queries = []
+
+    def query(self, sql):
+        self.queries.append(sql)
+        if "__TABLES__" in sql:
+            return _QueryResult(
+                SimpleNamespace(
+                    table_id=name,
+                    last_modified_time=self.last_modified.get(name, 1_700_000_000_000),
+                    row_count=len(frame),
+                )
+                for name, frame in self.tables.items()
+            )
+        table_name = re.search(r"FROM `[^`]*\.([\w*]+)`", sql).group(1)
+        if table_name == "events_*":
+            suffixes = re.findall(r"'(\w+)'", re.search(r"_TABLE_SUFFIX IN \(([^)]*)\)", sql).group(1))
+            frames = [
+                self.tables[f"events_{suffix}"].assign(table_suffix=suffix)
+                for suffix in suffixes
+                if f"events_{suffix}" in self.tables
+            ]
+            # Interleave days so the stream has to be split back by suffix.
+            frame = pd.concat(frames, ignore_index=True).sort_values("event_timestamp", kind="stable")
+            return _QueryResult(frame=frame)
+        return _QueryResult(frame=self.tables[table_name])
+
+
+def _events(day, n):
+    return pd.DataFrame(
+        {
+            "event_date": [day] * n,
+            "event_timestamp": [pd.Timestamp(day, tz="UTC").value // 1000 + i for i in range(n)],
+            "event_name": ["test"] * n,
+            "event_params": [[{"key": "count", "value": {"int_value": i}}] for i in range(n)],
+        }
+    )
+
+
+def _context(tmp_path, client, workers, page_rows=None):
+    return {
+        "client": client,
+        "manifest_path": str(tmp_path / "manifest.json"),
+        "log_path": str(tmp_path / "log.txt"),
+        "data_dir": str(tmp_path),
+        "dataset": "project.dataset",
+        "start_date": date(2025, 12, 1),
+        "download_workers": workers,
+        "download_page_rows": page_rows,
+    }
+
+
+def _stored(tmp_path, table_name):
+    return tmp_path / f"table_date={table_name.rsplit('_', 1)[1]}" / f"{table_name}.parquet"
+
+
+def _manifest(tmp_path):
+    return json.loads((tmp_path / "manifest.json").read_text())["tables"]
+
+
+def test_pull_from_bq_concurrent_download_writes_files_and_manifest(tmp_path):
+    from emoji_oracle_analytics.pipeline.utils.pull_functions import pull_from_bq
+
+    client = FakeBigQueryClient(
+        {
+            "events_20251130": _events("20251130", 1),
+            "events_20251201": _events("20251201", 2),
+            "events_20251202": _events("20251202", 3),
+            "events_20251203": _events("20251203", 4),
+        }
+    )
+
+    out = pull_from_bq(pd.DataFrame(), _context(tmp_path, client, workers=3))
+
+    manifest = _manifest(tmp_path)
+    logged = sorted(manifest)
+    assert logged == ["events_20251201", "events_20251202", "events_20251203"]
+    assert sorted(tmp_path.rglob("*.parquet")) == [_stored(tmp_path, t) for t in logged]
+    assert [manifest[t]["rows"] for t in logged] == [2, 3, 4]
+    assert manifest["events_20251201"]["last_modified_time"] == 1_700_000_000_000
+    assert len(manifest["events_20251201"]["checksum"]) == 64
+    assert len(out) == 9
+    assert set(out["source_table"]) == set(logged)
+    assert isinstance(out["event_params"].iloc[0], list)
+
+
+def test_pull_from_bq_skips_logged_tables(tmp_path):
+    from emoji_oracle_analytics.pipeline.utils.pull_functions import pull_from_bq
+
+    client = FakeBigQueryClient({"events_20251201": _events("20251201", 2)})
+    context = _context(tmp_path, client, workers=2)
+
+    pull_from_bq(pd.DataFrame(), context)
+    client.queries.clear()
+    out = pull_from_bq(pd.DataFrame(), context)
+
+    assert len(client.queries) == 1  # table listing only
+    assert len(out) == 2
+
+
+def test_pull_from_bq_streams_row_groups_and_keeps_nested_types(tmp_path):
+    from emoji_oracle_analytics.pipeline.utils.pull_functions import pull_from_bq
+
+    client = FakeBigQueryClient({"events_20251201": _events("20251201", 5)})
+
+    pull_from_bq(pd.DataFrame(), _context(tmp_path, client, workers=1, page_rows=2))
+
+    parquet_file = pq.ParquetFile(_stored(tmp_path, "events_20251201"))
+    assert parquet_file.metadata.num_row_groups == 3
+    assert parquet_file.metadata.num_rows == 5
+    event_params_type = parquet_file.schema_arrow.field("event_params").type
+    assert pa.types.is_list(event_params_type)
+    assert pa.types.is_struct(event_params_type.value_type)
+
+
+def test_build_events_query_prunes_columns_and_pushes_filters():
+    from emoji_oracle_analytics.pipeline.utils.pull_functions import build_events_query
+
+    sql = build_events_query(
+        "project.dataset",
+        "events_20251201",
+        columns={"event_name": None, "geo": ["country"]},
+        country=["TR", "US"],
+        not_user=["o'brien"],
+        version_filter="1.0.4",
+    )
+
+    assert "SELECT\n  event_name,\n  STRUCT(geo.country AS country) AS geo\n" in sql
+    assert "FROM `project.dataset.events_20251201`" in sql
+    assert "geo.country IN ('TR', 'US')" in sql
+    assert "user_pseudo_id NOT IN ('o\\'brien')" in sql
+    assert ">= '00000001.00000000.00000004'" in sql
+    assert build_events_query("project.dataset", "events_20251201") == (
+        "SELECT\n  *\nFROM `project.dataset.events_20251201`"
+    )
+
+
+def test_padded_version_order_matches_vers():
+    from emoji_oracle_analytics.pipeline.utils.main_functions import vers
+    from emoji_oracle_analytics.pipeline.utils.pull_functions import _padded_version
+
+    versions = ["1.0", "1.0.0", "1.0.3", "1.0.12", "1.1", "2.0.1", "1.0.04"]
+    for a in versions:
+        for b in versions:
+            padded = (_padded_version(a) > _padded_version(b)) - (_padded_version(a) < _padded_version(b))
+            assert padded == vers(a, b)
+
+
+def test_pull_from_bq_wildcard_mode_uses_one_job_and_splits_by_suffix(tmp_path):
+    from emoji_oracle_analytics.pipeline.utils.pull_functions import pull_from_bq
+
+    client = FakeBigQueryClient(
+        {
+            "events_20251201": _events("20251201", 2),
+            "events_20251202": _events("20251202", 3),
+        }
+    )
+    context = _context(tmp_path, client, workers=1, page_rows=2)
+    context["download_mode"] = "wildcard"
+
+    out = pull_from_bq(pd.DataFrame(), context)
+
+    assert len(client.queries) == 2  # table listing + one wildcard job
+    assert "FROM `project.dataset.events_*`" in client.queries[1]
+    for table_name, n in [("events_20251201", 2), ("events_20251202", 3)]:
+        written = pq.read_table(_stored(tmp_path, table_name))
+        assert written.num_rows == n
+        assert "table_suffix" not in written.column_names
+        assert set(written.column("source_table").to_pylist()) == {table_name}
+    assert sorted(_manifest(tmp_path)) == ["events_20251201", "events_20251202"]
+    assert len(out) == 5
+
+
+def test_pull_from_bq_ignores_unrecorded_and_partial_files(tmp_path):
+    from emoji_oracle_analytics.pipeline.utils.pull_functions import pull_from_bq
+
+    # A file written by a run that died before recording it, plus a half-written temp file.
+    _events("20251201", 7).to_parquet(tmp_path / "events_20251201.parquet")
+    (tmp_path / "events_20251202.parquet.tmp").write_bytes(b"PAR1 truncated")
+    client = FakeBigQueryClient({"events_20251201": _events("20251201", 2)})
+
+    out = pull_from_bq(pd.DataFrame(), _context(tmp_path, client, workers=1))
+
+    assert len(out) == 2
+    assert _manifest(tmp_path)["events_20251201"]["rows"] == 2
+    assert not list(tmp_path.glob("*.tmp"))
+
+
+def test_load_manifest_migrates_legacy_log(tmp_path):
+    from emoji_oracle_analytics.pipeline.utils.manifest import load_manifest, manifest_files
+
+    _events("20251201", 3).to_parquet(tmp_path / "events_20251201.parquet")
+    (tmp_path / "log.txt").write_text("events_20251201\nevents_20251202\n")
+
+    manifest = load_manifest(str(tmp_path / "manifest.json"), str(tmp_path), str(tmp_path / "log.txt"))
+
+    assert list(manifest["tables"]) == ["events_20251201"]  # file for 20251202 is missing
+    assert manifest["tables"]["events_20251201"]["rows"] == 3
+    assert manifest_files(manifest, str(tmp_path)) == [str(tmp_path / "events_20251201.parquet")]
+    assert (tmp_path / "manifest.json").exists()
+
+
+def test_pull_from_bq_moves_flat_files_into_partitions_and_pushes_filters(tmp_path):
+    from emoji_oracle_analytics.pipeline.utils.pull_functions import pull_from_bq
+
+    legacy = _events("20251201", 4)
+    legacy["user_pseudo_id"] = ["u1", "u2", "u1", "u3"]
+    legacy.to_parquet(tmp_path / "events_20251201.parquet")
+    (tmp_path / "log.txt").write_text("events_20251201\n")
+    client = FakeBigQueryClient({"events_20251201": legacy})
+    context = _context(tmp_path, client, workers=1)
+    context["not_user"] = ["u1"]
+
+    out = pull_from_bq(pd.DataFrame(), context)
+
+    assert not (tmp_path / "events_20251201.parquet").exists()
+    assert _stored(tmp_path, "events_20251201").exists()
+    assert _manifest(tmp_path)["events_20251201"]["file"] == "table_date=20251201/events_20251201.parquet"
+    assert sorted(out["user_pseudo_id"]) == ["u2", "u3"]
+
+
+def test_pull_from_bq_refreshes_tables_modified_since_cached(tmp_path):
+    from emoji_oracle_analytics.pipeline.utils.pull_functions import pull_from_bq
+
+    client = FakeBigQueryClient(
+        {"events_20251201": _events("20251201", 2), "events_20251202": _events("20251202", 2)}
+    )
+    context = _context(tmp_path, client, workers=1)
+    pull_from_bq(pd.DataFrame(), context)
+
+    # GA4 rewrites the newest day with late events.
+    client.tables["events_20251202"] = _events("20251202", 5)
+    client.last_modified["events_20251202"] = 1_700_000_999_000
+    client.queries.clear()
+    out = pull_from_bq(pd.DataFrame(), context)
+
+    assert len(client.queries) == 2  # listing + only the changed table
+    assert "events_20251202" in client.queries[1]
+    assert _manifest(tmp_path)["events_20251202"]["rows"] == 5
+    assert len(out) == 7
+
+
+def test_pull_from_bq_intraday_tables_are_replaced_by_daily(tmp_path):
+    from emoji_oracle_analytics.pipeline.utils.pull_functions import pull_from_bq
+
+    client = FakeBigQueryClient(
+        {"events_20251201": _events("20251201", 2), "events_intraday_20251202": _events("20251202", 1)}
+    )
+    context = _context(tmp_path, client, workers=1)
+    context["include_intraday"] = True
+
+    pull_from_bq(pd.DataFrame(), context)
+    assert sorted(_manifest(tmp_path)) == ["events_20251201", "events_intraday_20251202"]
+
+    client.tables["events_20251202"] = _events("20251202", 3)
+    del client.tables["events_intraday_20251202"]
+    out = pull_from_bq(pd.DataFrame(), context)
+
+    assert sorted(_manifest(tmp_path)) == ["events_20251201", "events_20251202"]
+    assert not _stored(tmp_path, "events_intraday_20251202").exists()
+    assert len(out) == 5
+
+
+def test_pull_from_bq_trusts_recorded_schemas_and_checks_file_sizes(tmp_path, monkeypatch):
+    from emoji_oracle_analytics.pipeline.utils import manifest as manifest_module
+    from emoji_oracle_analytics.pipeline.utils import parquet_store
+    from emoji_oracle_analytics.pipeline.utils.pull_functions import pull_from_bq
+
+    client = FakeBigQueryClient(
+        {"events_20251201": _events("20251201", 2), "events_20251202": _events("20251202", 3)}
+    )
+    context = _context(tmp_path, client, workers=1)
+    pull_from_bq(pd.DataFrame(), context)
+    stored = json.loads((tmp_path / "manifest.json").read_text())
+    assert len(stored["schemas"]) == 1
+
+    def no_footers(path):
+        raise AssertionError(f"read the footer of {path}")
+
+    monkeypatch.setattr(parquet_store.pq, "read_schema", no_footers)
+    assert len(pull_from_bq(pd.DataFrame(), context)) == 5
+    monkeypatch.undo()
+
+    # A file replaced behind the manifest's back is downloaded again
+    _events("20251202", 1).to_parquet(_stored(tmp_path, "events_20251202"))
+    client.queries.clear()
+    out = pull_from_bq(pd.DataFrame(), context)
+
+    assert len(client.queries) == 2  # listing + the changed file's table
+    assert "events_20251202" in client.queries[1]
+    assert len(out) == 5
+    assert manifest_module.file_checksum(str(_stored(tmp_path, "events_20251202"))) == \
+        _manifest(tmp_path)["events_20251202"]["checksum"]
+
+
+def test_pull_from_bq_redownloads_tables_extracted_with_other_filters(tmp_path):
+    from emoji_oracle_analytics.pipeline.utils.pull_functions import pull_from_bq
+
+    client = FakeBigQueryClient({"events_20251201": _events("20251201", 2).assign(user_pseudo_id=["u1", "u2"])})
+    context = _context(tmp_path, client, workers=1)
+    pull_from_bq(pd.DataFrame(), context)
+
+    def queries_after_pull(**settings):
+        context.update(settings)
+        client.queries.clear()
+        pull_from_bq(pd.DataFrame(), context)
+        return client.queries
+
+    pruned = queries_after_pull(extract_pruned=True, not_user=["u1"])
+    assert len(pruned) == 2 and "NOT IN ('u1')" in pruned[1]
+    assert len(queries_after_pull()) == 1  # listing only
+    loosened = queries_after_pull(not_user=[])
+    assert len(loosened) == 2 and "NOT IN" not in loosened[1]
+
+
+def test_select_tables_to_download_only_refreshes_recent_legacy_entries():
+    from datetime import date as _date
+
+    from emoji_oracle_analytics.pipeline.utils.pull_functions import select_tables_to_download
+
+    tables = {
+        "events_20251201": {"last_modified_time": 10, "row_count": 1},
+        "events_20251230": {"last_modified_time": 10, "row_count": 1},
+    }
+    manifest = {"tables": {t: {"last_modified_time": None} for t in tables}}
+
+    selected = select_tables_to_download(tables, manifest, refresh_window_days=3, today=_date(2025, 12, 31))
+
+    assert list(selected) == ["events_20251230"]
+    assert manifest["tables"]["events_20251201"]["last_modified_time"] == 10
+
+
+def test_normalize_bq_types_casts_params_and_repairs_json_strings():
+    from emoji_oracle_analytics.pipeline.utils.pull_functions import (
+        PARAM_COLUMN_TYPES,
+        events_to_pandas,
+        normalize_bq_types,
+    )
+
+    native = pa.array(
+        [[{"key": "level", "value": {"int_value": 3, "float_value": None}}], []],
+        type=pa.list_(pa.struct([
+            ("key", pa.string()),
+            ("value", pa.struct([("int_value", pa.int64()), ("float_value", pa.null())])),
+        ])),
+    )
+    as_json = pa.array(['[{"key": "tier", "value": {"int_value": "2"}}]', "[{not json"])
+
+    table = normalize_bq_types(pa.table({"event_params": native, "user_properties": as_json}))
+
+    assert table.schema.field("event_params").type == PARAM_COLUMN_TYPES["event_params"]
+    assert table.schema.field("user_properties").type == PARAM_COLUMN_TYPES["user_properties"]
+    df = events_to_pandas(table)
+    assert isinstance(df["event_params"].dtype, pd.ArrowDtype)
+    assert df["event_params"].iloc[0][0]["value"]["int_value"] == 3
+    assert df["user_properties"].iloc[0][0]["value"]["int_value"] == 2
+    assert pd.isna(df["user_properties"].iloc[1])
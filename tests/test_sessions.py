@@ -0,0 +1,97 @@
+import numpy as np
+import pandas as pd
+
+from emoji_oracle_analytics.pipeline.utils.feature_engineering import forward_fill_progress
+from emoji_oracle_analytics.pipeline.utils.sessions import (
+    SESSION_ORDER,
+    infer_sessions,
+    session_runs,
+    sort_by_session,
+)
+from emoji_oracle_analytics.pipeline.utils.split_functions import create_df_technical_events
+from emoji_oracle_analytics.pipeline.utils.time_and_date_functions import add_durations
+from emoji_oracle_analytics.pipeline.utils.user_keys import add_user_keys
+
+
+def _events():
+    return pd.DataFrame(
+        {
+            "user_pseudo_id": ["a", "a", "a", "a", "b", "b", "b"],
+            "event_params__ga_session_id": pd.array([1, 1, 1, None, 2, 2, 2], dtype="Int64"),
+            "event_name": ["x", "session_start", "app_remove", "x", "x", "x", "x"],
+            "event_datetime": pd.to_datetime([30, 0, 90, 40, 0, 20, 50], unit="s", utc=True),
+        },
+        index=[6, 5, 4, 3, 2, 1, 0],
+    )
+
+
+def test_session_runs_mark_runs_of_missing_keys():
+    starts, run, is_session = session_runs(sort_by_session(_events()))
+    assert starts.tolist() == [0, 3, 4]
+    assert run.tolist() == [0, 0, 0, 1, 2, 2, 2]
+    assert is_session.tolist() == [True, False, True]
+
+
+def test_add_durations_in_one_pass_over_sorted_sessions():
+    df = add_durations(_events())
+
+    assert df.index.tolist() == [5, 6, 4, 3, 2, 1, 0]
+    # The app_remove at 90s does not extend the session; b has no session_start
+    np.testing.assert_array_equal(df["session_duration_seconds"], [30, 30, 30, np.nan, np.nan, np.nan, np.nan])
+    assert df["session_end_time"].iloc[0] == pd.Timestamp(90, unit="s", tz="UTC")
+    assert df["session_start_time"].isna().tolist() == [False, False, False, True, False, False, False]
+    assert df["event_duration_seconds"].tolist() == [30, 60, 0, 0, 20, 30, 0]
+
+
+def test_infer_sessions_splits_unsessioned_events_by_inactivity_gap():
+    df = pd.DataFrame(
+        {
+            "user_pseudo_id": ["a", "a", "a", "a", "b", None],
+            "event_params__ga_session_id": pd.array([7, None, None, None, None, None], dtype="Int64"),
+            "event_name": ["x"] * 6,
+            "event_datetime": pd.to_datetime([0, 600, 0, 1200, 60, 0], unit="s", utc=True),
+        }
+    )
+    keyed = add_user_keys(df.copy())
+
+    plain = infer_sessions(df.copy(), {"session_gap_minutes": 5})
+    assert plain["inferred_session_id"].tolist() == [7, 600, 0, 1200, 60, pd.NA]
+
+    keyed = infer_sessions(keyed, {"session_gap_minutes": 15})
+    assert keyed["inferred_session_id"].tolist() == [7, 0, 0, 0, 60, pd.NA]
+    assert keyed["session_key"].tolist() == [7, 0, 0, 0, (1 << 32) + 60, pd.NA]
+
+
+def test_forward_fill_in_session_order_matches_grouped_fill():
+    df = _events()
+    df["event_params__character_name"] = ["t", None, None, None, "k", None, "m"]
+    df["event_params__current_tier"] = pd.array([None, 1, None, None, None, 2, None], dtype="Int64")
+    df["event_params__current_qi"] = np.nan
+    df = sort_by_session(df)
+
+    grouped = forward_fill_progress(df.copy())
+    contiguous = forward_fill_progress(df.copy(), {"row_order": SESSION_ORDER})
+
+    pd.testing.assert_frame_equal(contiguous, grouped)
+    assert contiguous["event_params__character_name"].tolist()[1:3] == ["t", "t"]
+    assert contiguous["event_params__current_tier"].tolist()[4:] == [pd.NA, 2, 2]
+
+
+def test_technical_events_in_session_order_leave_the_input_frame_unchanged():
+    df = _events()
+    df["event_name"] = ["x", "session_start", "App Exception", "Ad Load Failed", "x", "App Exception", "x"]
+    df["event_params__menu_name"] = ["m1", "m0", None, "m3", "m4", "m5", "m6"]
+    for col in ["app_info__version", "device__mobile_marketing_name", "device__operating_system_version"]:
+        df[col] = "v"
+    df = sort_by_session(df)
+    columns = df.columns.tolist()
+
+    grouped = create_df_technical_events(df.copy())
+    contiguous = create_df_technical_events(df, {"row_order": SESSION_ORDER})
+
+    assert df.columns.tolist() == columns
+    pd.testing.assert_frame_equal(contiguous, grouped)
+    # The Ad Load Failed event has no session, so no previous event
+    assert contiguous.index.tolist() == [4, 3, 1]
+    assert contiguous["prev_event_name"].fillna("-").tolist() == ["x", "-", "x"]
+    assert contiguous["prev_event_menu"].fillna("-").tolist() == ["m1", "-", "m4"]
@@ -155,3 +155,69 @@ def test_create_df_by_questions_smoke():
     if not out.empty:
         assert "wrong_answer_ratio" in out.columns
         assert "ads_watch_ratio" in out.columns
+
+
+def test_apply_param_schema_casts_declared_and_registers_new_keys(tmp_path):
+    import json
+
+    from emoji_oracle_analytics.pipeline.utils.param_schema import apply_param_schema
+
+    registry = tmp_path / "param_schema.json"
+    df = pd.DataFrame(
+        {
+            "event_params__current_tier": [1.0, None, 3.0],
+            "event_params__character_name": ["t", None, "aturtle"],
+            "event_params__brand_new": ["1,5", "2", None],
+            "event_params__free_text": ["a", 2, None],
+            "event_name": ["x", "y", "z"],
+        }
+    )
+
+    out = apply_param_schema(df, {"param_schema_path": str(registry)})
+
+    assert str(out["event_params__current_tier"].dtype) == "Int64"
+    assert out["event_params__brand_new"].tolist()[:2] == [1.5, 2.0]
+    assert out["event_params__free_text"].tolist()[:2] == ["a", "2"]
+    assert out["event_name"].tolist() == ["x", "y", "z"]
+    registered = json.loads(registry.read_text())["columns"]
+    assert registered["event_params__brand_new"] == "float64"
+    assert registered["event_params__free_text"] == "string"
+
+
+def test_int64_params_keep_integers_above_float_precision():
+    from emoji_oracle_analytics.pipeline.utils.param_schema import convert_param
+
+    big = 2**53 + 1
+    assert convert_param(pd.Series([big, None], dtype=object), "Int64").tolist() == [big, pd.NA]
+    assert convert_param(pd.Series([str(big), "3"], dtype=object), "Int64").tolist() == [big, 3]
+    assert convert_param(pd.Series([1.5, None]), "Int64") is None
+
+
+def test_widening_a_declared_param_type_is_kept_on_later_runs(tmp_path, caplog):
+    from emoji_oracle_analytics.pipeline.utils.param_schema import apply_param_schema, load_param_schema
+
+    context = {"param_schema_path": str(tmp_path / "param_schema.json")}
+    df = pd.DataFrame({"event_params__current_tier": ["3", "boss"]})
+
+    with caplog.at_level("WARNING"):
+        apply_param_schema(df.copy(), context)
+    assert "widening it to string" in caplog.text
+    assert load_param_schema(context["param_schema_path"])["event_params__current_tier"] == "string"
+
+    caplog.clear()
+    with caplog.at_level("WARNING"):
+        out = apply_param_schema(df.copy(), context)
+    assert "widening" not in caplog.text
+    assert out["event_params__current_tier"].tolist() == ["3", "boss"]
+
+
+def test_compact_categoricals_respects_cardinality_limit():
+    from emoji_oracle_analytics.pipeline.utils.cleaning_functions import compact_categoricals
+
+    df = pd.DataFrame({"event_name": ["a", "b", "a", None], "geo__city": ["w", "x", "y", "z"]})
+
+    out = compact_categoricals(df, categorical_columns={"event_name": 5, "geo__city": 2, "absent": 3})
+
+    assert isinstance(out["event_name"].dtype, pd.CategoricalDtype)
+    assert out["event_name"].isna().tolist() == [False, False, False, True]
+    assert not isinstance(out["geo__city"].dtype, pd.CategoricalDtype)
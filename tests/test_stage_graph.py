@@ -0,0 +1,70 @@
+import pandas as pd
+
+from emoji_oracle_analytics.pipeline.utils.stage_graph import Stage, run_stages, stage_levels, stages_for_targets
+
+
+def _double(df, context=None):
+    df["b"] = df["a"] * 2
+    return df
+
+
+def _triple(df, context=None):
+    df["c"] = df["a"] * 3
+    return df
+
+
+def _sum(df, context=None):
+    df["d"] = df["b"] + df["c"]
+    return df
+
+
+def _needs_x(df, context=None):
+    df["y"] = df["x"]
+    return df
+
+
+STAGES = [
+    Stage(_double, "b", requires=("a",), writes=("b",)),
+    Stage(_triple, "c", requires=("a",), writes=("c",)),
+    Stage(_sum, "d", requires=("b", "c"), writes=("d",)),
+    Stage(_needs_x, "y", requires=("x",), writes=("y",)),
+]
+
+
+def test_stage_levels_and_targets_follow_declared_columns():
+    levels = [[s.name for s in level] for level in stage_levels(STAGES)]
+    assert levels == [["_double", "_triple", "_needs_x"], ["_sum"]]
+
+    assert [s.name for s in stages_for_targets(STAGES, ["b"])] == ["_double"]
+    assert [s.name for s in stages_for_targets(STAGES, ["d"])] == ["_double", "_triple", "_sum"]
+
+
+def test_run_stages_skips_missing_inputs_prunes_and_runs_levels_in_threads():
+    df = pd.DataFrame({"a": [1, 2], "tmp": [0, 0]})
+
+    sequential = run_stages(df.copy(), STAGES, {}, prune=["a", "tmp"], keep=["tmp"])
+    threaded = run_stages(df.copy(), STAGES, {"stage_workers": 4})
+
+    assert list(sequential.columns) == ["tmp", "b", "c", "d"]
+    assert sequential["d"].tolist() == [5, 10]
+    assert threaded["d"].tolist() == [5, 10]
+    assert "y" not in threaded.columns
+
+
+def _sort(df, context=None):
+    return df.sort_values("a")
+
+
+def _filter(df, context=None):
+    return df[df["a"] > 1]
+
+
+def test_run_stages_records_the_row_order_until_the_frame_is_replaced():
+    df = pd.DataFrame({"a": [2, 1, 3]})
+    context = {}
+
+    run_stages(df.copy(), [Stage(_sort, "sort", row_order="by a"), Stage(_double, "b", writes=("b",))], context)
+    assert context["row_order"] == "by a"
+
+    run_stages(df.copy(), [Stage(_sort, "sort", row_order="by a"), Stage(_filter, "filter")], context)
+    assert context["row_order"] is None
@@ -0,0 +1,27 @@
+from datetime import date
+
+import pyarrow.parquet as pq
+
+from emoji_oracle_analytics.pipeline.utils.synthetic_events import EVENT_NAMES, write_synthetic_store
+
+
+def _write(path, seed=0):
+    return write_synthetic_store(str(path), str(path / "manifest.json"), 2000, date(2024, 5, 1), days=3, seed=seed)
+
+
+def test_synthetic_store_is_deterministic_and_covers_the_events(tmp_path):
+    first = _write(tmp_path / "a")
+    again = _write(tmp_path / "b")
+    other = _write(tmp_path / "c", seed=1)
+
+    def checksums(manifest):
+        return [entry["checksum"] for entry in manifest["tables"].values()]
+
+    assert sorted(first["tables"]) == ["events_20240501", "events_20240502", "events_20240503"]
+    assert sum(entry["rows"] for entry in first["tables"].values()) == 2000
+    assert checksums(first) == checksums(again)
+    assert checksums(first) != checksums(other)
+
+    table = pq.read_table(tmp_path / "a" / first["tables"]["events_20240501"]["file"])
+    assert {"event_params", "user_properties", "user_pseudo_id", "event_timestamp"} <= set(table.column_names)
+    assert set(table.column("event_name").to_pylist()) <= set(EVENT_NAMES)
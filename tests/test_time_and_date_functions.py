@@ -0,0 +1,67 @@
+import pandas as pd
+
+from emoji_oracle_analytics.pipeline.utils.time_and_date_functions import (
+    add_time_based_features,
+    transform_datetime_fields,
+)
+
+
+def _raw():
+    return pd.DataFrame(
+        {
+            "event_timestamp": [1_764_547_261_500_000, 1_764_633_599_000_000],
+            "event_previous_timestamp": [None, 1_764_547_261_500_000],
+            "user_first_touch_timestamp": [1_764_547_200_000_000, 1_764_547_200_000_000],
+        }
+    )
+
+
+def test_compact_time_features_match_the_full_ones():
+    full = transform_datetime_fields(_raw(), {"time_features": "full"})
+    compact = transform_datetime_fields(_raw(), {"time_features": "compact"})
+
+    for base in ["event", "event_previous", "event_first_touch", "user__first_open"]:
+        expected = [t.hour * 3600 + t.minute * 60 + t.second if pd.notna(t) else pd.NA for t in full[f"{base}_time"]]
+        assert compact[f"{base}_time"].dtype == "Int32"
+        assert compact[f"{base}_time"].tolist() == expected
+    assert compact["event_time"].tolist() == [61, 86399]
+
+    pd.testing.assert_series_equal(compact["event_date"], full["event_date"])
+    assert "event_first_touch_date" not in compact.columns
+    declared = transform_datetime_fields(_raw(), {"pipeline_targets": ["event_first_touch_date"]})
+    pd.testing.assert_series_equal(declared["event_first_touch_date"], full["event_first_touch_date"])
+
+
+def test_time_based_features_come_from_lookup_tables():
+    # Monday 2025-12-01 00:30 UTC, hourly for a week
+    df = pd.DataFrame({"event_datetime": pd.date_range("2025-12-01 00:30", periods=7 * 24, freq="h", tz="UTC")})
+    df["device__time_zone_offset_seconds"] = pd.array([19800, None] * (7 * 12), dtype="Int64")
+
+    df = add_time_based_features(df)
+
+    local = df["event_datetime"] + pd.to_timedelta(df["device__time_zone_offset_seconds"].fillna(0), unit="s")
+    pd.testing.assert_series_equal(df["ts_local_time"], local.astype(df["event_datetime"].dtype), check_names=False)
+    assert df["ts_hour"].tolist() == local.dt.hour.tolist()
+    assert df["ts_weekday"].astype(str).tolist() == df["event_datetime"].dt.day_name().tolist()
+    assert isinstance(df["ts_daytime_named"].dtype, pd.CategoricalDtype)
+    assert df.loc[df["ts_hour"] == 22, "ts_daytime_named"].unique().tolist() == ["Akşam"]
+    assert df.loc[df["ts_hour"] == 23, "ts_daytime_named"].unique().tolist() == ["Gece"]
+    assert df.loc[df["ts_hour"] == 11, "ts_daytime_named"].unique().tolist() == ["Öğle"]
+    assert df.groupby("ts_is_weekend", observed=True).size().to_dict() == {"Hafta İçi": 120, "Hafta Sonu": 48}
+
+
+def test_weekday_labels_of_missing_times_survive_value_maps():
+    from emoji_oracle_analytics.pipeline.utils.cleaning_functions import apply_value_maps
+
+    df = pd.DataFrame(
+        {
+            "event_datetime": pd.to_datetime(["2025-12-01 10:00", None], utc=True),
+            "device__time_zone_offset_hours": [0.0, None],
+        }
+    )
+
+    out = apply_value_maps(add_time_based_features(df))
+
+    assert out["ts_weekday"].tolist()[0] == "Pazartesi"
+    assert out["ts_weekday"].isna().tolist() == [False, True]
+    assert isinstance(out["ts_weekday"].dtype, pd.CategoricalDtype)
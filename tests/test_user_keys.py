@@ -0,0 +1,47 @@
+import pandas as pd
+
+from emoji_oracle_analytics.pipeline.utils.time_and_date_functions import add_durations
+from emoji_oracle_analytics.pipeline.utils.user_keys import MISSING_USER, add_user_keys
+
+
+def _events(users, sessions):
+    return pd.DataFrame(
+        {
+            "user_pseudo_id": users,
+            "event_params__ga_session_id": pd.array(sessions, dtype="Int64"),
+            "event_name": ["session_start", "x", "x", "session_start"][: len(users)],
+            "event_datetime": pd.date_range("2025-12-01", periods=len(users), freq="min"),
+        }
+    )
+
+
+def test_add_user_keys_keeps_codes_across_runs(tmp_path):
+    context = {"user_codes_path": str(tmp_path / "user_codes.json")}
+
+    first = add_user_keys(_events(["b", "a", None], [1764547200, 1764547200, 7]), context)
+    second = add_user_keys(_events(["c", "a", "b"], [5, None, 1764547200]), context)
+
+    assert first["user_code"].tolist() == [1, 0, MISSING_USER]
+    assert first["session_key"].tolist() == [(1 << 32) + 1764547200, 1764547200, pd.NA]
+    assert second["user_code"].tolist() == [2, 0, 1]
+    assert second["user_code"].dtype == "int32"
+    assert second["session_key"].tolist() == [(2 << 32) + 5, pd.NA, (1 << 32) + 1764547200]
+
+
+def test_add_durations_matches_with_and_without_keys():
+    events = _events(["b", "b", "a", "a"], [10, 10, 20, 20])
+
+    plain = add_durations(events.copy())
+    keyed = add_durations(add_user_keys(events.copy())).drop(columns=["user_code", "session_key"])
+
+    pd.testing.assert_frame_equal(plain.sort_index(), keyed.sort_index())
+
+
+def test_malformed_session_ids_get_a_missing_key(caplog):
+    events = _events(["a", "a", "b"], [-5, 1 << 32, 1764547200])
+
+    with caplog.at_level("WARNING"):
+        keyed = add_user_keys(events)
+
+    assert keyed["session_key"].tolist() == [pd.NA, pd.NA, (1 << 32) + 1764547200]
+    assert "2 event_params__ga_session_id values are outside" in caplog.text
@@ -0,0 +1,27 @@
+import itertools
+
+import pandas as pd
+
+from emoji_oracle_analytics.pipeline.utils.main_functions import filter_events_by_version, vers
+from emoji_oracle_analytics.pipeline.utils.versions import parse_version, version_dtype
+
+
+def test_version_keys_order_like_vers():
+    versions = ["1.0.3", "1.0.12", "1.0", "1.0.0", "2", "0.9.9.9"]
+
+    for a, b in itertools.product(versions, versions):
+        ka, kb = parse_version(a), parse_version(b)
+        assert (ka > kb) - (ka < kb) == vers(a, b)
+
+    assert list(version_dtype(versions + ["beta", None]).categories) == [
+        "beta", "0.9.9.9", "1.0", "1.0.0", "1.0.3", "1.0.12", "2",
+    ]
+
+
+def test_filter_events_by_version_is_a_vectorized_mask():
+    df = pd.DataFrame({"app_info__version": ["1.0.12", "1.0.3", "1.0.2", None, "dev"]})
+    df["app_info__version"] = df["app_info__version"].astype("category")
+
+    out = filter_events_by_version(df, {"version_filter": "1.0.3"})
+
+    assert out["app_info__version"].tolist() == ["1.0.12", "1.0.3"]